@@ -1,17 +1,33 @@
 # -*- coding: utf-8 -*-
 
+import collections
+import re
+import threading
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 
 from PyQt5 import QtGui, QtCore
 from PyQt5.QtWidgets import *
 
 from OpenNumismat.Auctions import AuctionItem
 from OpenNumismat.Auctions import _AuctionParser, _NotDoneYetError, _CanceledError
+from OpenNumismat.Auctions.Scheduler import Priority
 from OpenNumismat.Tools.Converters import stringToMoney
 
+# Offset of time shown by auction sites from UTC in seconds
+MoscowOffset = 3 * 60 * 60
+
 
 class MolotokParser(_AuctionParser):
     HostName = 'molotok.ru'
+    # Lots pages changes till lot is done
+    CacheTtl = 60 * 60
+    Selectors = {
+            'saller': 'dl dt',
+            'strong': 'strong',
+            'style': 'style',
+            'shipmentPrice': 'dd strong',
+        }
 
     @staticmethod
     def verifyDomain(url):
@@ -58,15 +74,16 @@ class MolotokParser(_AuctionParser):
         auctionItem.date = QtCore.QDate(currentDate.year(), tmpDate.month(),
                                     tmpDate.day()).toString(QtCore.Qt.ISODate)
 
-        saller = siWrapper.find_class('sellerDetails')[0].cssselect('dl dt')[0].text_content()
+        saller = self.select('saller', siWrapper.find_class('sellerDetails')[0])[0].text_content()
         auctionItem.saller = saller.split()[0].strip()
-        buyer = siWrapper.find_class('buyerInfo')[0].cssselect('strong')[1].text_content()
+        buyer = self.select('strong', siWrapper.find_class('buyerInfo')[0])[1].text_content()
         auctionItem.buyer = buyer.strip()
 
         # Remove STYLE element
-        for element in self.html.get_element_by_id('user_field').cssselect('style'):
+        userField = self.html.get_element_by_id('user_field')
+        for element in self.select('style', userField):
             element.getparent().remove(element)
-        info = self.html.get_element_by_id('user_field').text_content()
+        info = userField.text_content()
         auctionItem.info = info.strip() + '\n' + self.url
 
         index = self.doc.find("$('.galleryWrap').newGallery")
@@ -77,10 +94,10 @@ class MolotokParser(_AuctionParser):
         images = images.replace('"', '')
         auctionItem.images = images.split(',')
 
-        content = siWrapper.get_element_by_id('itemFinishBox2').cssselect('strong')[0].text_content()
+        content = self.select('strong', siWrapper.get_element_by_id('itemFinishBox2'))[0].text_content()
         auctionItem.price = stringToMoney(content)
 
-        element = siWrapper.get_element_by_id('paymentShipment').cssselect('dd strong')
+        element = self.select('shipmentPrice', siWrapper.get_element_by_id('paymentShipment'))
         if element:
             content = element[0].text_content()
             shipmentPrice = stringToMoney(content)
@@ -113,6 +130,7 @@ class MolotokParser(_AuctionParser):
 
 
 class AuctionSpbParser(_AuctionParser):
+    HostName = 'auction.spb.ru'
     HostNames = ('www.auction.spb.ru', 'auction.spb.ru')
     Categories = [
 #            "Все категории",
@@ -125,6 +143,16 @@ class AuctionSpbParser(_AuctionParser):
             "Монеты иностранные",
             "Награды, медали, знаки, жетоны, пряжки и т.д.",
         ]
+    Selectors = {
+            'layoutRow': 'table tr',
+            'contentCell': 'table td',
+            'table': 'table',
+            'tr': 'tr',
+            'td': 'td',
+            'a': 'a',
+            'b': 'b',
+            'strong': 'strong',
+        }
 
     @staticmethod
     def verifyDomain(url):
@@ -158,13 +186,14 @@ class AuctionSpbParser(_AuctionParser):
     def _parsePage(self):
         items = []
         hostname = 'http://' + urllib.parse.urlparse(self.url).hostname
-        table = self.html.cssselect('table tr')[4].cssselect('table td')[1].cssselect('table')[0]
+        # Only rows of lots table are walked
+        table = self.select('table', self._contentCell(1))[0]
 
-        for tr in table.cssselect('tr'):
-            tds = tr.cssselect('td')
+        for tr in self.select('tr', table):
+            tds = self.select('td', tr)
             if len(tds) >= 9:
                 lotnum = str(tds[0].text_content()).strip()
-                url = hostname + tds[1].cssselect('a')[0].attrib['href']
+                url = hostname + self.select('a', tds[1])[0].attrib['href']
                 denomination = str(tds[2].text_content()).strip()
                 year = str(tds[3].text_content())
                 mintmark = str(tds[4].text_content())
@@ -185,14 +214,25 @@ class AuctionSpbParser(_AuctionParser):
 
         return items
 
+    def _contentCell(self, index):
+        row = self.select('layoutRow')[4]
+        return self.select('contentCell', row)[index]
+
     def _parse(self):
-        table = self.html.cssselect('table tr')[4].cssselect('table td')[0]
+        table = self._contentCell(0)
         if table.text_content().find("Торги по лоту завершились") < 0:
-            raise _NotDoneYetError()
+            # Open lot shows planned end of trading as '12:00:00 05-12-2007'
+            match = re.search(r'(\d{1,2}:\d{2}:\d{2})\s+(\d{2}-\d{2}-\d{4})',
+                              table.text_content())
+            closeTime = None
+            if match:
+                closeTime = _closeTime(match.group(2), 'dd-MM-yyyy',
+                                       match.group(1), 'h:mm:ss')
+            raise _NotDoneYetError(closeTime)
 
         item = {}
 
-        content = table.cssselect('b')[0].text_content()
+        content = self.select('b', table)[0].text_content()
         date = content.split()[1]  # convert '12:00:00 05-12-07' to '05-12-07'
         date = QtCore.QDate.fromString(date, 'dd-MM-yyyy')
         if date.year() < 1960:
@@ -202,7 +242,8 @@ class AuctionSpbParser(_AuctionParser):
 #        content = table.cssselect('strong')[2].text_content()
 #        item['buyer'] = content.split()[-1]
 
-        content = table.cssselect('strong')[0].text_content()
+        strongs = self.select('strong', table)
+        content = strongs[0].text_content()
         if content[-1] == '.':
             content = content[:-1]
         part = content.split('\xA0', 1)[-1]  # remove 'Лот № 8607'
@@ -222,7 +263,7 @@ class AuctionSpbParser(_AuctionParser):
                     if country:
                         item['country'] = country
 
-        content = table.cssselect('strong')[1].text_content()
+        content = strongs[1].text_content()
         if content[-1] == '.':
             content = content[:-1]
         item['info'] = str(content)
@@ -231,20 +272,21 @@ class AuctionSpbParser(_AuctionParser):
 #            print("Only 1 bid")
 
         images = []
-        content = table.cssselect('a')[0]
+        links = self.select('a', table)
+        content = links[0]
         href = content.attrib['href']
         href = urllib.parse.urljoin(self.url, href)
         images.append(href)
 
-        content = table.cssselect('a')[1]
+        content = links[1]
         href = content.attrib['href']
         href = urllib.parse.urljoin(self.url, href)
         images.append(href)
         item['images'] = images
 
         bidders = {}
-        for tr in table.cssselect('table')[0].cssselect('tr')[1:]:
-            bidder = tr.cssselect('td')[0].text_content()
+        for tr in self.select('tr', self.select('table', table)[0])[1:]:
+            bidder = self.select('td', tr)[0].text_content()
             bidders[bidder] = None
         item['bidders'] = len(bidders.keys())
 
@@ -278,6 +320,23 @@ class ConrosParser(_AuctionParser):
             "Монеты иностранные",
             "Боны",
         ]
+    Selectors = {
+            'center': 'td#center',
+            'innerTable': 'table table',
+            'smallText': 'td.smallText',
+            'strong': 'strong',
+            'lotsTable': 'table.productListing',
+            'lotRow': 'tr.productListing-data',
+            'td': 'td',
+            'a': 'a',
+            'rate': 'div#your_rate',
+            'state': 'p#lot_state.lot_info_box',
+            'title': 'h1.pageHeading',
+            'info': '#lot_information .main p',
+            'rates': '#rates',
+            'rateRow': 'tr.tableHostPrice',
+            'information': 'div#lot_information',
+        }
 
     @staticmethod
     def verifyDomain(url):
@@ -311,13 +370,13 @@ class ConrosParser(_AuctionParser):
         items = []
         hostname = 'http://' + urllib.parse.urlparse(self.url).hostname
 
-        item = self.html.cssselect('td#center')[0]
-        item = item.cssselect('table table')[2]
-        item = item.cssselect('td.smallText')
+        item = self.select('center')[0]
+        item = self.select('innerTable', item)[2]
+        item = self.select('smallText', item)
         if len(item) < 2:
             return []
         item = item[1]
-        content = item.cssselect('strong')[0].text_content()
+        content = self.select('strong', item)[0].text_content()
         if content.find("Аукцион №") >= 0:
             site = 'Аукцион'
         else:
@@ -325,12 +384,13 @@ class ConrosParser(_AuctionParser):
 
         auctionnum = content[content.find("№") + 1:]
 
-        table = self.html.cssselect('table.productListing')[0]
-        for tr in table.cssselect('tr.productListing-data'):
-            tds = tr.cssselect('td')
+        # Only rows of lots table are walked
+        table = self.select('lotsTable')[0]
+        for tr in self.select('lotRow', table):
+            tds = self.select('td', tr)
             if len(tds) >= 9:
                 lotnum = str(tds[0].text_content()).strip()
-                url = hostname + tds[1].cssselect('a')[0].attrib['href']
+                url = hostname + self.select('a', tds[1])[0].attrib['href']
                 denomination = str(tds[1].text_content()).strip()
                 year = str(tds[2].text_content())
                 mintmark = str(tds[3].text_content())
@@ -352,20 +412,30 @@ class ConrosParser(_AuctionParser):
         return items
 
     def _parse(self):
-        if self.html.cssselect('div#your_rate')[0].text_content().find("Торги по этому лоту завершены") < 0:
-            raise _NotDoneYetError()
+        if self.select('rate')[0].text_content().find("Торги по этому лоту завершены") < 0:
+            # Open lot shows planned end of trading as '10.05.2015 в 21:00'
+            match = None
+            state = self.select('state')
+            if state:
+                match = re.search(r'(\d{2}\.\d{2}\.\d{4})\s+в\s+(\d{1,2}:\d{2})',
+                                  state[0].text_content())
+            closeTime = None
+            if match:
+                closeTime = _closeTime(match.group(1), 'dd.MM.yyyy',
+                                       match.group(2), 'h:mm')
+            raise _NotDoneYetError(closeTime)
 
         item = {}
 
-        content = self.html.cssselect('p#lot_state.lot_info_box')[0].text_content()
+        content = self.select('state')[0].text_content()
         date = content.split()[9]  # extract date
         item['date'] = QtCore.QDate.fromString(date, 'dd.MM.yyyy').toString(QtCore.Qt.ISODate)
 
-        content = self.html.cssselect('h1.pageHeading')[0].text_content()
+        content = self.select('title')[0].text_content()
         item['title'] = str(content)
 #        item['title'] = ' '.join(content.split())  # remove extra spaces
 
-        content = self.html.cssselect('#lot_information .main p')[1].text_content()
+        content = self.select('info')[1].text_content()
         parts = []
         index = content.find("Редкость")
         if index > 0:
@@ -383,13 +453,13 @@ class ConrosParser(_AuctionParser):
 #            print("Only 1 bid")
 
         bidders = {}
-        for tr in self.html.cssselect('#rates')[0].cssselect('tr.tableHostPrice'):
-            bidder = tr.cssselect('td')[0].text_content()
+        for tr in self.select('rateRow', self.select('rates')[0]):
+            bidder = self.select('td', tr)[0].text_content()
             bidders[bidder] = None
         item['bidders'] = len(bidders.keys())
 
         images = []
-        for tag in self.html.cssselect('div#lot_information')[0].cssselect('a'):
+        for tag in self.select('a', self.select('information')[0]):
             href = tag.attrib['href']
             href = urllib.parse.urljoin(self.url, href)
             images.append(href)
@@ -410,8 +480,61 @@ class ConrosParser(_AuctionParser):
         return str(price + price * 10 / 100)
 
 
+class WolmarAuction:
+    """Data of auction page shared by all its lots"""
+    # Count of recently used auctions kept in memory
+    MaxAuctions = 16
+
+    _lock = threading.Lock()
+    _auctions = collections.OrderedDict()
+
+    @classmethod
+    def get(cls, url):
+        with cls._lock:
+            auction = cls._auctions.get(url)
+            if auction:
+                cls._auctions.move_to_end(url)
+            else:
+                auction = cls(url)
+                cls._auctions[url] = auction
+                if len(cls._auctions) > cls.MaxAuctions:
+                    cls._auctions.popitem(last=False)
+
+        return auction
+
+    def __init__(self, url):
+        self.url = url
+        self._date = None
+        self._lock = threading.Lock()
+
+    def date(self, parser):
+        # Lots parsed at the same time wait for the first reading of page
+        with self._lock:
+            if self._date is None:
+                html = parser.readHtmlTree(self.url, parser._encoding(),
+                                           Priority.List)
+                if html is None:
+                    return ''
+
+                content = parser.select('date', html.find_class('content')[0])[0].text_content()
+                date = content.split()[1]  # convert '(Закрыт 29.09.2011 12:30)' to '29.09.2011'
+                self._date = QtCore.QDate.fromString(date, 'dd.MM.yyyy').toString(QtCore.Qt.ISODate)
+
+            return self._date
+
+
 class WolmarParser(_AuctionParser):
     HostName = 'www.wolmar.ru'
+    # Count of image pages of lot read at the same time
+    ImageWorkers = 4
+    _imageExecutor = None
+    _imageExecutorLock = threading.Lock()
+    Selectors = {
+            'a': 'a',
+            'div': 'div',
+            'img': 'img',
+            'date': 'h1 span',
+        }
 
     @staticmethod
     def verifyDomain(url):
@@ -473,30 +596,49 @@ class WolmarParser(_AuctionParser):
         price = float(auctionItem.price)
         auctionItem.totalSalePrice = str(price - price * 10 / 100)
 
-        storedUrl = self.url
+        # Image pages of lot are read together
+        urls = [urllib.parse.urljoin(self.url, tag.attrib['href'])
+                for tag in self.select('a', item)]
+        executor = self._executor()
+        auctionItem.images = [image for image in
+                              executor.map(self._imageUrl, urls) if image]
 
-        auctionItem.images = []
-        for tag in item.cssselect('a'):
-            href = tag.attrib['href']
-            url = urllib.parse.urljoin(storedUrl, href)
-            self.readHtmlPage(url, 'windows-1251')
-            content = self.html.cssselect('div')[0]
-            for tag in content.cssselect('div'):
-                tag.drop_tree()
-            content = content.cssselect('img')[0]
-            src = content.attrib['src']
-            href = urllib.parse.urljoin(self.url, src)
-            auctionItem.images.append(href)
-
-        # Extract date from parent page
-        url = urllib.parse.urljoin(storedUrl, '.')[:-1]
-        self.readHtmlPage(url, 'windows-1251')
-        content = self.html.find_class('content')[0].cssselect('h1 span')[0].text_content()
-        date = content.split()[1]  # convert '(Закрыт 29.09.2011 12:30)' to '29.09.2011'
-        auctionItem.date = QtCore.QDate.fromString(date, 'dd.MM.yyyy').toString(QtCore.Qt.ISODate)
+        # Date is taken from parent page which is read once per auction
+        url = urllib.parse.urljoin(self.url, '.')[:-1]
+        auctionItem.date = WolmarAuction.get(url).date(self)
 
         return auctionItem
 
+    def _imageUrl(self, url):
+        html = self.readHtmlTree(url, self._encoding())
+        if html is None:
+            return None
+
+        content = self.select('div', html)[0]
+        for tag in self.select('div', content):
+            tag.drop_tree()
+        content = self.select('img', content)[0]
+        src = content.attrib['src']
+        return urllib.parse.urljoin(url, src)
+
+    @classmethod
+    def _executor(cls):
+        with cls._imageExecutorLock:
+            if not cls._imageExecutor:
+                cls._imageExecutor = ThreadPoolExecutor(cls.ImageWorkers)
+            return cls._imageExecutor
+
+
+def _closeTime(date, dateFormat, time, timeFormat):
+    # Auction sites show Moscow time, returns seconds since epoch
+    dateTime = QtCore.QDateTime(QtCore.QDate.fromString(date, dateFormat),
+                                QtCore.QTime.fromString(time, timeFormat),
+                                QtCore.Qt.OffsetFromUTC, MoscowOffset)
+    if not dateTime.isValid():
+        return None
+
+    return dateTime.toSecsSinceEpoch()
+
 
 def _stringToGrade(string):
     # Parse VF-XF, XF/AU and XF-
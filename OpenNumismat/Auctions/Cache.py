@@ -0,0 +1,236 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+import OpenNumismat
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stored = 0
+        self.evicted = 0
+
+    def __str__(self):
+        requests = self.hits + self.misses + self.revalidated
+        ratio = 0.
+        if requests:
+            ratio = (self.hits + self.revalidated) * 100. / requests
+        return ("%d hits, %d revalidated, %d misses (%.1f%% from cache),"
+                " %d stored, %d evicted" %
+                (self.hits, self.revalidated, self.misses, ratio,
+                 self.stored, self.evicted))
+
+
+class CacheEntry:
+    def __init__(self, row):
+        (self.url, self.hash, self.etag, self.modified,
+         self.fetched, self.size) = row
+
+
+class HttpCache:
+    # Index is shared between import worker threads, so it is stored in
+    # separate SQLite file opened by sqlite3 module, not by QtSql connection
+    IndexFileName = 'index.db'
+    DefaultTtl = 7 * 24 * 60 * 60
+    DefaultMaxSize = 512 * 1024 * 1024
+
+    def __init__(self, path, maxSize=DefaultMaxSize):
+        self.path = path
+        self.maxSize = maxSize
+        self.stats = CacheStats()
+        self._ttls = {}
+
+        os.makedirs(self.path, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(os.path.join(self.path, self.IndexFileName),
+                                   check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                url TEXT NOT NULL PRIMARY KEY,
+                hash TEXT NOT NULL,
+                etag TEXT,
+                modified TEXT,
+                fetched REAL,
+                accessed REAL,
+                size INTEGER)""")
+        self._db.execute("""CREATE INDEX IF NOT EXISTS entries_accessed
+                ON entries (accessed)""")
+        self._db.execute("""CREATE INDEX IF NOT EXISTS entries_hash
+                ON entries (hash)""")
+        self._db.commit()
+
+        self._size = self._db.execute(
+                    "SELECT ifnull(sum(size), 0) FROM entries").fetchone()[0]
+
+    def setTtl(self, host, ttl):
+        self._ttls[host] = ttl
+
+    def ttl(self, url):
+        host = urllib.parse.urlsplit(url).hostname
+        return self._ttls.get(host, self.DefaultTtl)
+
+    def get(self, url):
+        with self._lock:
+            row = self._db.execute("""SELECT url, hash, etag, modified,
+                        fetched, size FROM entries WHERE url=?""",
+                        (url,)).fetchone()
+        if row:
+            return CacheEntry(row)
+
+    def isFresh(self, entry, maxAge=None):
+        if maxAge is None:
+            maxAge = self.ttl(entry.url)
+        return entry.fetched + maxAge > time.time()
+
+    def data(self, entry):
+        try:
+            with open(self._fileName(entry.hash), 'rb') as file:
+                data = file.read()
+        except OSError:
+            self.remove(entry.url)
+            return None
+
+        with self._lock:
+            self._db.execute("UPDATE entries SET accessed=? WHERE url=?",
+                             (time.time(), entry.url))
+            self._db.commit()
+
+        return data
+
+    def validators(self, entry):
+        headers = {}
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.modified:
+            headers['If-Modified-Since'] = entry.modified
+        return headers
+
+    def revalidated(self, entry):
+        now = time.time()
+        with self._lock:
+            self._db.execute("""UPDATE entries SET fetched=?, accessed=?
+                        WHERE url=?""", (now, now, entry.url))
+            self._db.commit()
+
+            self.stats.revalidated += 1
+
+    def hit(self):
+        with self._lock:
+            self.stats.hits += 1
+
+    def miss(self):
+        with self._lock:
+            self.stats.misses += 1
+
+    def put(self, url, headers, data):
+        hash_ = hashlib.sha1(data).hexdigest()
+        fileName = self._fileName(hash_)
+
+        now = time.time()
+        with self._lock:
+            if not os.path.exists(fileName):
+                os.makedirs(os.path.dirname(fileName), exist_ok=True)
+                tmpFileName = fileName + '.tmp'
+                with open(tmpFileName, 'wb') as file:
+                    file.write(data)
+                os.replace(tmpFileName, fileName)
+
+            self._removeEntry(url, keepHash=hash_)
+            self._db.execute("""INSERT INTO entries (url, hash, etag,
+                        modified, fetched, accessed, size)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                        (url, hash_, headers.get('ETag'),
+                         headers.get('Last-Modified'), now, now, len(data)))
+            self._db.commit()
+
+            self._size += len(data)
+            self.stats.stored += 1
+
+            if self._size > self.maxSize:
+                self._evict()
+
+    def remove(self, url):
+        with self._lock:
+            self._removeEntry(url)
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            for (url,) in self._db.execute("SELECT url FROM entries").fetchall():
+                self._removeEntry(url)
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _evict(self):
+        # Remove least recently used entries till 90% of limit
+        size = self._size
+        limit = self.maxSize * 9 // 10
+        urls = []
+        cursor = self._db.execute("SELECT url, size FROM entries ORDER BY accessed")
+        for url, entrySize in cursor:
+            if size <= limit:
+                break
+            urls.append(url)
+            size -= entrySize
+
+        for url in urls:
+            self._removeEntry(url)
+            self.stats.evicted += 1
+        self._db.commit()
+
+    def _removeEntry(self, url, keepHash=None):
+        row = self._db.execute("SELECT hash, size FROM entries WHERE url=?",
+                               (url,)).fetchone()
+        if not row:
+            return
+
+        hash_, size = row
+        self._db.execute("DELETE FROM entries WHERE url=?", (url,))
+        self._size -= size
+
+        if hash_ == keepHash:
+            return
+
+        # Content file may be shared by few urls
+        count = self._db.execute("SELECT count(*) FROM entries WHERE hash=?",
+                                 (hash_,)).fetchone()[0]
+        if not count:
+            try:
+                os.remove(self._fileName(hash_))
+            except OSError:
+                pass
+
+    def _fileName(self, hash_):
+        return os.path.join(self.path, hash_[0:2], hash_[2:4], hash_)
+
+
+def defaultCache():
+    from OpenNumismat.Settings import Settings
+
+    settings = Settings()
+    if not settings['http_cache']:
+        return None
+
+    from OpenNumismat.Auctions import ParserClasses
+
+    path = os.path.join(OpenNumismat.HOME_PATH, 'cache')
+    try:
+        cache = HttpCache(path, int(settings['http_cache_size']) * 1024 * 1024)
+    except (OSError, sqlite3.Error):
+        print("Can't open HTTP cache at %s" % path)
+        return None
+
+    for parserClass in ParserClasses:
+        for host in parserClass.hostNames():
+            cache.setTtl(host, parserClass.CacheTtl)
+
+    return cache
@@ -0,0 +1,82 @@
+import queue
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from PyQt5 import QtCore
+
+
+def workersCount(parserClass):
+    settings = QtCore.QSettings()
+    value = settings.value('import/%s/workers' % parserClass.HostName)
+    if value:
+        return max(1, int(value))
+
+    return parserClass.Workers
+
+
+def setWorkersCount(parserClass, count):
+    settings = QtCore.QSettings()
+    settings.setValue('import/%s/workers' % parserClass.HostName, count)
+
+
+class LotFetcher(QtCore.QObject):
+    # Time in seconds between processing GUI events while waiting for lots
+    EventsInterval = 0.05
+
+    def __init__(self, parserClass, category, workers=None, parent=None):
+        super().__init__(parent)
+
+        if not workers:
+            workers = workersCount(parserClass)
+        self.workers = workers
+
+        # Parser keeps state of last read page, so each worker thread
+        # takes own parser instance
+        self._parsers = queue.Queue()
+        for _ in range(self.workers):
+            parser = parserClass()
+            parser.page_category = category
+            self._parsers.put(parser)
+
+        self._executor = ThreadPoolExecutor(self.workers)
+        self.canceled = False
+
+    def parse(self, urls):
+        futures = [self.submit(url) for url in urls]
+        try:
+            # Return results in lot order independently of completion order
+            for future in futures:
+                if not self.waitFor(future):
+                    return
+
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def submit(self, url):
+        return self._executor.submit(self._parse, url)
+
+    def waitFor(self, future, idle=None):
+        # Returns False when canceled. Idle is called while waiting
+        while not future.done():
+            QtCore.QCoreApplication.processEvents()
+            if self.canceled:
+                return False
+            if idle:
+                idle()
+            wait([future], timeout=self.EventsInterval)
+
+        return True
+
+    def cancel(self):
+        self.canceled = True
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def _parse(self, url):
+        parser = self._parsers.get()
+        try:
+            return parser.parse(url)
+        finally:
+            self._parsers.put(parser)
@@ -0,0 +1,506 @@
+from PyQt5 import QtCore
+from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtSql import QSqlQuery
+
+from OpenNumismat.Auctions import Network, NotDoneLot
+from OpenNumismat.Auctions.AuctionParser import AuctionSpbParser, ConrosParser
+from OpenNumismat.Auctions.Pipeline import ImportPipeline, PipelineStats
+from OpenNumismat.Collection.Background import WorkerPool
+from OpenNumismat.Collection.Collection import Photo
+from OpenNumismat.Collection.ImportProgress import ImportProgress
+from OpenNumismat.Collection.ImportedLots import ImportedLots
+from OpenNumismat.Collection.WatchList import WatchList
+
+
+class AuctionImporter(QtCore.QObject):
+    stepped = pyqtSignal()
+
+    Places = (('АукционЪ.СПб', AuctionSpbParser),
+              ('Конрос', ConrosParser))
+    # Pages of watched lots were cached while trading was open, so polls
+    # revalidate them instead of using cache of host
+    WatchMaxAge = 0
+
+    # Model is CollectionModel or RecordsWriter - both provide database(),
+    # appendRecords() and place for storing photos
+    def __init__(self, model, params, parent=None):
+        super().__init__(parent)
+
+        self.model = model
+        self.db = model.database()
+        self.params = params
+
+        self.parserClass = self.placeParser(params['auction'])
+        self.parser = self.parserClass()
+
+        self.importedLots = ImportedLots(self.db, self)
+        self.watchList = WatchList(self.db, self)
+
+        self.canceled = False
+        self.pipeline = None
+        self.importedCount = 0
+        # Summary of all imported auctions
+        self.pipelineStatistics = PipelineStats()
+        self.skippedCount = 0
+        self.updatedCount = 0
+        # Lots which can't be parsed, they are retried by next import
+        self.failedCount = 0
+        # Auctions which list pages can't be read, they are continued by
+        # next import
+        self.unfinishedCount = 0
+        # Lots added to watch list and imported from it
+        self.watchedCount = 0
+        self.closedCount = 0
+
+    @staticmethod
+    def placeParser(place):
+        for name, parserClass in AuctionImporter.Places:
+            if name == place:
+                return parserClass
+
+        raise KeyError(place)
+
+    def categories(self):
+        if self.params['category'] == 0:
+            return range(len(self.parser.categories()))
+        else:
+            return [self.params['category'] - 1, ]
+
+    def auctions(self):
+        return range(self.params['from_num'], self.params['till_num'] + 1)
+
+    def stepsCount(self):
+        return len(self.auctions()) * len(self.categories())
+
+    def run(self):
+        for auctNo in self.auctions():
+            for category in self.categories():
+                self.stepped.emit()
+                if self.canceled:
+                    return
+
+                self.importAuction(auctNo, category)
+
+    def cancel(self):
+        self.canceled = True
+        if self.pipeline:
+            self.pipeline.cancel()
+
+    def statistics(self):
+        session = Network.session()
+        lines = ["%d lots imported, %d already imported lots skipped"
+                 " (%d updated), %d failed" % (self.importedCount,
+                                    self.skippedCount, self.updatedCount,
+                                    self.failedCount),
+                 "%d auctions not listed to the end" % self.unfinishedCount,
+                 "%d unfinished lots watched, %d finished lots imported from"
+                 " watch list" % (self.watchedCount, self.closedCount),
+                 str(session.stats),
+                 session.scheduler.statistics()]
+        lines.append(str(self.pipelineStatistics))
+        if session.cache:
+            lines.append(str(session.cache.stats))
+
+        return '\n'.join(lines)
+
+    def importAuction(self, auctNo, category):
+        parser = self.parser
+
+        progress = ImportProgress(self.db, self.params['auction'], auctNo,
+                                  parser.category(category), self)
+        # Continue interrupted import of this auction or repeat import of
+        # already imported auction
+        auct_id = progress.auctionId()
+        if not auct_id:
+            url = parser.getPageUrl(auctNo, category, 0)
+            items = parser.parsePage(url)
+            if items is None:
+                self.unfinishedCount += 1
+                return
+            if not items:
+                return
+
+            item1 = parser.parse(items[0]['url'])
+            if not item1 or isinstance(item1, NotDoneLot):
+                # Date of auction is known only from finished lot
+                date = None
+            else:
+                date = item1['date']
+
+            # Auction is written with its checkpoint, so it is always
+            # resumed by next import when interrupted
+            started = self.db.transaction()
+
+            query = QSqlQuery(self.db)
+            query.prepare("INSERT INTO auctions (number, date, site, place, category)" \
+                          " VALUES (?, ?, ?, ?, ?)")
+            query.addBindValue(auctNo)
+            query.addBindValue(date)
+            query.addBindValue('Аукцион')
+            query.addBindValue(self.params['auction'])
+            query.addBindValue(parser.category(category))
+
+            query.exec_()
+
+            progress.start()
+
+            if started and not self.db.commit():
+                print(self.db.lastError().text())
+                self.db.rollback()
+                return
+        elif not progress.isStarted():
+            progress.start()
+
+        def newItems(page, items):
+            doneLots = progress.doneLots(page)
+            items = [item for item in items
+                     if item['lotnum'] not in doneLots]
+            return self.__skipImported(auctNo, items)
+
+        failedCount = self.failedCount
+        self.pipeline = ImportPipeline(self.parserClass, auctNo, category,
+                                       self.params['workers'],
+                                       progress.donePages(), self)
+        try:
+            # Each page is written in own transaction while next pages
+            # are listed and parsed
+            for page, lots in self.pipeline.pages(newItems):
+                self.__importPage(category, auctNo, lots, progress, page)
+        finally:
+            self.pipeline.close()
+
+        self.pipelineStatistics.add(self.pipeline.stats)
+        # Checkpoint with pages of failed lots is kept for next import
+        finished = (self.pipeline.finished and not self.canceled and
+                    self.failedCount == failedCount)
+        if not self.pipeline.finished and not self.canceled:
+            self.unfinishedCount += 1
+        self.pipeline = None
+
+        if finished:
+            progress.finish()
+
+    def __skipImported(self, auctNo, items):
+        # Already imported lots are recognized by list page, so their lot
+        # pages are not downloaded
+        newItems = []
+        imported = []
+        for item in items:
+            key = {'place': self.params['auction'], 'site': item['site'],
+                   'auctionnum': item.get('auctionnum', auctNo),
+                   'lotnum': item['lotnum']}
+            id_ = self.importedLots.find(key)
+            if id_ is None:
+                newItems.append(item)
+            else:
+                imported.append((id_, self.__pageFields(item)))
+
+        self.skippedCount += len(imported)
+        if imported and self.params.get('update_existing'):
+            self.updatedCount += self.importedLots.update(imported)
+
+        return newItems
+
+    @staticmethod
+    def __pageFields(item):
+        return {'denomination': item['denomination'], 'year': item['year'],
+                'mintmark': item['mintmark'], 'material': item['material'],
+                'grade': item['grade'], 'price': item['price'],
+                'totalpayprice': item['totalPayPrice'],
+                'totalsaleprice': item['totalSalePrice'],
+                'buyer': item['buyer'], 'bids': item['bids']}
+
+    def importWatched(self):
+        """Imports lots of this place from watch list which trading
+        should be finished by now"""
+        for group in self.watchedGroups():
+            fetched = self.fetchWatched(group)
+            if self.canceled:
+                return
+
+            self.writeWatched(group, fetched)
+
+    def watchedGroups(self):
+        """Returns due lots of watch list grouped by list page as
+        ((auctNo, category, page), lots) pairs"""
+        groups = []
+        for lot in self.watchList.due(self.params['auction']):
+            key = (lot['number'], lot['category'], lot['page'])
+            if not groups or groups[-1][0] != key:
+                groups.append((key, []))
+            groups[-1][1].append(lot)
+
+        return groups
+
+    def fetchWatched(self, group):
+        """Reads list page and lot pages of group, returns list page items
+        by url and (lot, parsed lot) pairs. Collection isn't used, so it
+        can be called from worker thread"""
+        (auctNo, category, page), watched = group
+        # Parser keeps state of last read page, so each call takes own
+        parser = self.parserClass()
+
+        # Prices and buyers are taken from list page, so it is read
+        # once for all watched lots of page
+        url = parser.getPageUrl(auctNo, category, page)
+        items = {item['url']: item for item in
+                 parser.parsePage(url, self.WatchMaxAge) or []}
+
+        lots = []
+        for lot in watched:
+            if self.canceled:
+                break
+
+            if lot['url'] in items:
+                lots.append((lot, parser.parse(lot['url'], self.WatchMaxAge)))
+
+        return items, lots
+
+    def writeWatched(self, group, fetched):
+        """Writes finished lots fetched by fetchWatched() and postpones
+        unfinished ones"""
+        (auctNo, category, _page), watched = group
+        items, lots = fetched
+
+        for lot in watched:
+            if lot['url'] not in items:
+                self.watchList.postpone(lot)
+
+        closed = {}
+        for lot, item1 in lots:
+            if isinstance(item1, NotDoneLot):
+                self.watchList.postpone(lot, item1.closeTime)
+            elif not item1:
+                self.watchList.postpone(lot)
+            else:
+                record = self.__record(category, auctNo, items[lot['url']],
+                                       item1)
+                closed[record['url']] = (lot, record)
+
+        def remove(record):
+            self.watchList.remove(closed[record['url']][0])
+
+        started = self.db.transaction()
+
+        # Already imported lots leave watch list too
+        records = self.__newRecords(
+                [record for _lot, record in closed.values()], remove)
+        # Lot leaves watch list in the same transaction as it written
+        count = self.model.appendRecords(records, remove)
+
+        if started and not self.db.commit():
+            print(self.db.lastError().text())
+            self.db.rollback()
+            return
+
+        self.skippedCount += len(closed) - len(records)
+        self.importedCount += count
+        self.closedCount += count
+
+    def __importPage(self, category, auctNo, lots, progress, page):
+        # All lots of page are parsed before writing, so collection isn't
+        # locked while network is waited
+        records = []
+        watched = []
+        parseFailed = 0
+        for item, item1 in lots:
+            if isinstance(item1, NotDoneLot):
+                watched.append((item, item1))
+            elif item1:
+                records.append(self.__record(category, auctNo, item, item1))
+            else:
+                parseFailed += 1
+
+        # Lots are marked as done in the same transaction as they written
+        started = self.db.transaction()
+
+        newRecords = self.__newRecords(records,
+                lambda record: progress.setLotDone(page, record['lotnum']))
+
+        for item, item1 in watched:
+            # Lot is imported from watch list when trading finished
+            self.watchList.add(self.params['auction'], auctNo, category,
+                               page, item['lotnum'], item1.url,
+                               item1.closeTime)
+            progress.setLotDone(page, item['lotnum'])
+
+        count = self.model.appendRecords(newRecords,
+                lambda record: progress.setLotDone(page, record['lotnum']))
+        failed = parseFailed + len(newRecords) - count
+
+        # Page with failed lots stays unfinished, so they are parsed again
+        # on resume
+        if not self.pipeline.canceled and not failed:
+            progress.setPageDone(page)
+
+        if started and not self.db.commit():
+            print(self.db.lastError().text())
+            self.db.rollback()
+            # Nothing of page is written
+            self.failedCount += len(records) + len(watched) + parseFailed
+            return
+
+        self.importedCount += count
+        self.skippedCount += len(records) - len(newRecords)
+        self.watchedCount += len(watched)
+        self.failedCount += failed
+
+    def __newRecords(self, records, skipped):
+        # Lot could be written by other import since its page was listed.
+        # Collection allows copies of lot, so it is checked here instead of
+        # unique index
+        newRecords = []
+        keys = set()
+        for record in records:
+            key = (record['place'], record['site'], record['auctionnum'],
+                   record['lotnum'])
+            if key in keys or self.importedLots.find(record) is not None:
+                skipped(record)
+            else:
+                keys.add(key)
+                newRecords.append(record)
+
+        return newRecords
+
+    def __record(self, category, auctNo, item, item1):
+        parser = self.parser
+
+        record_item = {
+                'title': item1['title'],
+                'denomination': item['denomination'],
+                'year': item['year'],
+                'mintmark': item['mintmark'],
+                'category': parser.category(category),
+                'status': 'pass',
+                'material': item['material'],
+                'grade': item['grade'],
+                'price': item['price'],
+                'totalpayprice': item['totalPayPrice'],
+                'totalsaleprice': item['totalSalePrice'],
+                'buyer': item['buyer'],
+                'url': item['url'],
+                'bids': item['bids'],
+                'bidders': item1['bidders'],
+                'info': item1['info'],
+                'date': item1['date'],
+                'auctionnum': auctNo,
+                'site': item['site'],
+                'place': self.params['auction'],
+        }
+        if 'auctionnum' in item:
+            record_item['auctionnum'] = item['auctionnum']
+        if 'lotnum' in item:
+            record_item['lotnum'] = item['lotnum']
+        else:
+            record_item['lotnum'] = item1['lotnum']
+        if 'country' in item1:
+            record_item['country'] = item1['country']
+        imageFields = ['photo1', 'photo2', 'photo3', 'photo4']
+        for i, imageUrl in enumerate(item1['images']):
+            if i < len(imageFields):
+                photo = Photo(None, self.model)
+                # Photo is freed with its record instead of living as long
+                # as model
+                photo.setParent(None)
+                photo.url = imageUrl
+                # Lot is saved without waiting for image downloading
+                photo.queued = self.params['download_images']
+                photo.changed = True
+                record_item[imageFields[i]] = photo
+
+        return record_item
+
+
+def importWatchedLots(model, downloadImages=True, workers=None):
+    """Imports finished lots of watch list of all places, returns count
+    of imported lots"""
+    db = model.database()
+    if 'watch_lots' not in db.tables():
+        return 0
+
+    watchList = WatchList(db)
+
+    count = 0
+    for place in watchList.duePlaces():
+        try:
+            AuctionImporter.placeParser(place)
+        except KeyError:
+            continue
+
+        params = {'auction': place, 'download_images': downloadImages,
+                  'workers': workers}
+        importer = AuctionImporter(model, params)
+        importer.importWatched()
+        count += importer.importedCount
+
+    return count
+
+
+class WatchedLotsImporter(WorkerPool):
+    """Imports finished lots of watch list of all places without blocking
+    GUI: pages are read and parsed by worker threads and lots are written
+    by GUI thread when their page is fetched"""
+    finished = pyqtSignal()
+
+    def __init__(self, model, downloadImages=True,
+                 workers=WorkerPool.Workers, parent=None):
+        super().__init__(workers, parent)
+
+        self.model = model
+        self.downloadImages = downloadImages
+        self.importedCount = 0
+
+        # Importer and group of lots by key of fetching job
+        self._groups = {}
+
+    def start(self):
+        """Returns False when there are no lots to check"""
+        db = self.model.database()
+        if 'watch_lots' not in db.tables():
+            return False
+
+        for place in WatchList(db).duePlaces():
+            try:
+                AuctionImporter.placeParser(place)
+            except KeyError:
+                continue
+
+            params = {'auction': place,
+                      'download_images': self.downloadImages,
+                      'workers': self.workers}
+            importer = AuctionImporter(self.model, params, self)
+            for group in importer.watchedGroups():
+                key = len(self._groups)
+                self._groups[key] = (importer, group)
+                self.submit(key, importer.fetchWatched, group)
+
+        if not self._groups:
+            return False
+
+        self.startPolling()
+        return True
+
+    def process(self):
+        for key, future in self.takeDone():
+            importer, group = self._groups.pop(key)
+            try:
+                fetched = future.result()
+            except Exception as error:
+                print("Can not check watched lots: %s" % error)
+                continue
+
+            count = importer.importedCount
+            importer.writeWatched(group, fetched)
+            self.importedCount += importer.importedCount - count
+
+        if not self.runningCount():
+            self.close()
+            self.finished.emit()
+
+    def close(self):
+        # Running page reading stops by itself after current lot
+        for importer, _group in self._groups.values():
+            importer.cancel()
+        self._groups.clear()
+
+        super().close()
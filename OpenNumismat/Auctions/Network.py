@@ -0,0 +1,300 @@
+import gzip
+import http.client
+import threading
+import time
+import urllib.parse
+import zlib
+
+from OpenNumismat import version
+from OpenNumismat.Auctions.Scheduler import Priority, Scheduler
+
+
+class NetworkError(Exception):
+    def __init__(self, url, reason, status=None, retryAfter=None):
+        super().__init__("%s: %s" % (url, reason))
+        self.url = url
+        self.reason = reason
+        self.status = status
+        self.retryAfter = retryAfter
+
+
+class SessionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.connects = 0
+        self.reused = 0
+        self.bytes = 0
+        self.connectTime = 0.
+        self.requestTime = 0.
+
+    def add(self, **kwargs):
+        with self._lock:
+            for key, value in kwargs.items():
+                setattr(self, key, getattr(self, key) + value)
+
+    def values(self):
+        with self._lock:
+            return {'requests': self.requests, 'errors': self.errors,
+                    'retries': self.retries, 'connects': self.connects,
+                    'reused': self.reused, 'bytes': self.bytes,
+                    'connect_time': self.connectTime,
+                    'request_time': self.requestTime}
+
+    def __str__(self):
+        values = self.values()
+        average = 0.
+        if values['requests']:
+            average = values['request_time'] / values['requests']
+        return ("%(requests)d requests (%(errors)d errors, %(retries)d retries),"
+                " %(connects)d connections (%(reused)d reused),"
+                " %(bytes)d bytes, connecting %(connect_time).1fs,"
+                " requesting %(request_time).1fs" % values) + \
+                (", %.3fs per request" % average)
+
+
+class HttpSession:
+    # Count of idle keep-alive connections stored per host
+    MaxIdleConnections = 8
+    MaxRedirects = 5
+    Timeout = 30
+    # Delays between retries are chosen by scheduler for the whole host
+    Retries = 5
+    Headers = {'User-Agent': version.AppName,
+               'Accept-Encoding': 'gzip, deflate',
+               'Connection': 'keep-alive'}
+
+    def __init__(self, cache=None, scheduler=None):
+        self._lock = threading.Lock()
+        self._idle = {}
+        self.cache = cache
+        self.scheduler = scheduler or Scheduler()
+        self.stats = SessionStats()
+
+    def read(self, url, headers=None, priority=Priority.Lot, maxAge=None):
+        # MaxAge in seconds overrides cache TTL of host, 0 revalidates
+        # cached page by server
+        if priority == Priority.Image:
+            # Images are stored by collection, so they would only evict
+            # cached pages
+            status, responseHeaders, data = self._fetch(url, headers,
+                                                        priority)
+            return data
+
+        entry = None
+        if self.cache:
+            entry = self.cache.get(url)
+            if entry:
+                if self.cache.isFresh(entry, maxAge):
+                    data = self.cache.data(entry)
+                    if data is not None:
+                        self.cache.hit()
+                        return data
+                    entry = None
+                else:
+                    headers = dict(headers or {})
+                    headers.update(self.cache.validators(entry))
+
+        status, responseHeaders, data = self._fetch(url, headers, priority)
+
+        if self.cache:
+            if status == 304 and entry:
+                data = self.cache.data(entry)
+                if data is not None:
+                    self.cache.revalidated(entry)
+                    return data
+                # Cached content lost - request it without validators
+                status, responseHeaders, data = self._fetch(url,
+                                                            priority=priority)
+
+            self.cache.miss()
+            self.cache.put(url, responseHeaders, data)
+
+        return data
+
+    def _fetch(self, url, headers=None, priority=Priority.Lot):
+        for attempt in range(self.Retries):
+            if attempt:
+                self.stats.add(retries=1)
+
+            slot = self.scheduler.acquire(url, priority)
+            try:
+                result = self._read(url, headers)
+            except NetworkError as error:
+                self.scheduler.release(slot, error.status, error.retryAfter)
+                self.stats.add(errors=1)
+                # Client errors will not disappear after retry
+                if error.status and 400 <= error.status < 500 and \
+                                                    error.status != 429:
+                    raise
+                lastError = error
+                continue
+
+            self.scheduler.release(slot, result[0])
+            return result
+
+        raise lastError
+
+    def close(self):
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle.clear()
+
+    def _read(self, url, headers):
+        for _ in range(self.MaxRedirects):
+            status, responseHeaders, data = self._request(url, headers)
+            if status in (301, 302, 303, 307, 308):
+                location = responseHeaders.get('Location')
+                if not location:
+                    raise NetworkError(url, "redirect without location",
+                                       status)
+                url = urllib.parse.urljoin(url, location)
+                continue
+
+            if status >= 400:
+                retryAfter = responseHeaders.get('Retry-After', '')
+                if retryAfter.isdigit():
+                    retryAfter = int(retryAfter)
+                else:
+                    retryAfter = None
+                raise NetworkError(url, "HTTP error %d" % status, status,
+                                   retryAfter)
+
+            return status, responseHeaders, self._decode(url, data,
+                                                         responseHeaders)
+
+        raise NetworkError(url, "too many redirects")
+
+    def _request(self, url, headers):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise NetworkError(url, "unsupported scheme %s" % parts.scheme)
+
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        allHeaders = dict(self.Headers)
+        if headers:
+            allHeaders.update(headers)
+
+        connection, reused = self._acquire(key)
+        startTime = time.perf_counter()
+        try:
+            try:
+                connection.request('GET', path, headers=allHeaders)
+                response = connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError,
+                    BrokenPipeError):
+                if not reused:
+                    raise
+                # Server closed idle keep-alive connection - reconnect
+                connection.close()
+                connection, reused = self._connect(key), False
+                connection.request('GET', path, headers=allHeaders)
+                response = connection.getresponse()
+
+            data = response.read()
+        except (OSError, http.client.HTTPException) as error:
+            connection.close()
+            raise NetworkError(url, error)
+
+        self.stats.add(requests=1, bytes=len(data),
+                       requestTime=time.perf_counter() - startTime)
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(key, connection)
+
+        return response.status, response.headers, data
+
+    def _acquire(self, key):
+        with self._lock:
+            connections = self._idle.get(key)
+            if connections:
+                self.stats.add(reused=1)
+                return connections.pop(), True
+
+        return self._connect(key), False
+
+    def _connect(self, key):
+        scheme, host, port = key
+        if scheme == 'https':
+            connection = http.client.HTTPSConnection(host, port,
+                                                     timeout=self.Timeout)
+        else:
+            connection = http.client.HTTPConnection(host, port,
+                                                    timeout=self.Timeout)
+
+        startTime = time.perf_counter()
+        try:
+            connection.connect()
+        except OSError as error:
+            raise NetworkError(host, error)
+        self.stats.add(connects=1,
+                       connectTime=time.perf_counter() - startTime)
+
+        return connection
+
+    def _release(self, key, connection):
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            if len(connections) < self.MaxIdleConnections:
+                connections.append(connection)
+                return
+
+        connection.close()
+
+    @staticmethod
+    def _decode(url, data, headers):
+        encoding = headers.get('Content-Encoding', '').lower()
+        try:
+            if encoding == 'gzip':
+                return gzip.decompress(data)
+            elif encoding == 'deflate':
+                try:
+                    return zlib.decompress(data)
+                except zlib.error:
+                    # Some servers send raw deflate stream without header
+                    return zlib.decompress(data, -zlib.MAX_WBITS)
+        except (OSError, EOFError, zlib.error) as error:
+            raise NetworkError(url, "broken %s content: %s" % (encoding, error))
+
+        return data
+
+
+_session = None
+_sessionLock = threading.Lock()
+
+
+def session():
+    global _session
+
+    with _sessionLock:
+        if not _session:
+            from OpenNumismat.Auctions.Cache import defaultCache
+            from OpenNumismat.Auctions.Scheduler import defaultScheduler
+
+            _session = HttpSession(defaultCache(), defaultScheduler())
+
+        return _session
+
+
+def setSession(newSession):
+    global _session
+
+    with _sessionLock:
+        if _session and _session is not newSession:
+            _session.close()
+            if _session.cache:
+                _session.cache.close()
+        _session = newSession
@@ -0,0 +1,223 @@
+import collections
+import queue
+import threading
+import time
+
+from PyQt5 import QtCore
+
+from OpenNumismat.Auctions.Fetcher import LotFetcher
+
+
+class _PagesEnd:
+    def __init__(self, finished):
+        # Finished is True when empty page reached - all lots listed.
+        # Page which can't be read ends listing as unfinished
+        self.finished = finished
+
+
+class PipelineStats:
+    def __init__(self):
+        self.listedPages = 0
+        # Pages and lots which raised while parsing
+        self.failedPages = 0
+        self.parsedLots = 0
+        self.failedLots = 0
+        # Time of waiting previous stages by writing stage
+        self.pagesWaitTime = 0.
+        self.lotsWaitTime = 0.
+
+    def add(self, other):
+        self.listedPages += other.listedPages
+        self.failedPages += other.failedPages
+        self.parsedLots += other.parsedLots
+        self.failedLots += other.failedLots
+        self.pagesWaitTime += other.pagesWaitTime
+        self.lotsWaitTime += other.lotsWaitTime
+
+    def __str__(self):
+        return ("%d list pages (%d failed), %d lots parsed (%d failed),"
+                " writing waited %.1fs for list pages and %.1fs for lots" %
+                (self.listedPages, self.failedPages, self.parsedLots,
+                 self.failedLots, self.pagesWaitTime, self.lotsWaitTime))
+
+
+class ImportPipeline(QtCore.QObject):
+    """Imports lots of one auction category by stages:
+
+    listing pages (own thread) -> parsing lots (pool of workers) ->
+    building and writing records (caller thread, in lot order).
+
+    Stages are connected by bounded queues, so a fast stage waits for
+    a slow one instead of accumulating its results in memory.
+    """
+    # Count of list pages parsed ahead of writing
+    PagesAhead = 2
+    # Count of pages which lots are parsed ahead of writing
+    LotPagesAhead = 2
+    # Time in seconds between checks of cancel by listing thread
+    PutInterval = 0.1
+
+    def __init__(self, parserClass, auctNo, category, workers=None,
+                 donePages=(), parent=None):
+        super().__init__(parent)
+
+        self.parserClass = parserClass
+        self.auctNo = auctNo
+        self.category = category
+        self.donePages = set(donePages)
+
+        self.fetcher = LotFetcher(parserClass, category, workers, self)
+        self.canceled = False
+        self.finished = False
+
+        self.stats = PipelineStats()
+
+        self._pages = queue.Queue(self.PagesAhead)
+        self._dispatched = collections.deque()
+        self._ended = False
+        self._thread = None
+
+    def pages(self, itemsFilter=None):
+        """Yields (page, lots) in page order, lots yields (item, lot)
+        pairs in order of list page. ItemsFilter(page, items) is called in
+        caller thread before lots of page are requested."""
+        self._itemsFilter = itemsFilter
+
+        self._thread = threading.Thread(target=self._listPages, daemon=True)
+        self._thread.start()
+
+        while not self.canceled:
+            self.__dispatch(block=not self._dispatched)
+            if not self._dispatched:
+                break
+
+            page, futures = self._dispatched.popleft()
+            yield page, self.__lots(futures)
+
+    def cancel(self):
+        self.canceled = True
+        self.fetcher.cancel()
+
+    def close(self):
+        self.canceled = True
+        for _page, futures in self._dispatched:
+            for _item, future in futures:
+                future.cancel()
+        self._dispatched.clear()
+
+        # Listing thread stops by itself after current page
+        self.fetcher.close()
+
+    def __dispatch(self, block):
+        # Request lots of already listed pages while enough place ahead
+        while not self._ended and len(self._dispatched) < self.LotPagesAhead:
+            startTime = time.perf_counter()
+            entry = self.__takePage(block)
+            self.stats.pagesWaitTime += time.perf_counter() - startTime
+            if entry is None:
+                return
+
+            if isinstance(entry, _PagesEnd):
+                self._ended = True
+                self.finished = entry.finished
+                return
+
+            page, items = entry
+            if self._itemsFilter:
+                items = self._itemsFilter(page, items)
+            futures = [(item, self.fetcher.submit(item['url']))
+                       for item in items]
+            self._dispatched.append((page, futures))
+            block = False
+
+    def __takePage(self, block):
+        if not block:
+            try:
+                return self._pages.get_nowait()
+            except queue.Empty:
+                return None
+
+        while not self.canceled:
+            QtCore.QCoreApplication.processEvents()
+            try:
+                return self._pages.get(timeout=LotFetcher.EventsInterval)
+            except queue.Empty:
+                pass
+
+        return None
+
+    def __lots(self, futures):
+        try:
+            for item, future in futures:
+                startTime = time.perf_counter()
+                done = self.fetcher.waitFor(future,
+                                    lambda: self.__dispatch(block=False))
+                self.stats.lotsWaitTime += time.perf_counter() - startTime
+                if not done:
+                    self.canceled = True
+                    return
+
+                try:
+                    lot = future.result()
+                except Exception as error:
+                    # Unexpected layout of lot page - lot is counted as
+                    # failed and parsed again by next import
+                    print("Can not parse lot %s: %s" % (item['url'], error))
+                    self.stats.failedLots += 1
+                    lot = None
+                else:
+                    self.stats.parsedLots += 1
+                yield item, lot
+        finally:
+            for _item, future in futures:
+                future.cancel()
+
+    def _listPages(self):
+        # Runs in own thread with own parser
+        parser = self.parserClass()
+        parser.page_category = self.category
+
+        try:
+            for page in parser.pages(self.auctNo, self.category):
+                if self.canceled:
+                    break
+
+                if page in self.donePages:
+                    continue
+
+                url = parser.getPageUrl(self.auctNo, self.category, page)
+                try:
+                    items = parser.parsePage(url)
+                except Exception as error:
+                    # Unexpected layout of page - next pages are still
+                    # listed, but auction stays unfinished
+                    print("Can not parse page %s: %s" % (url, error))
+                    self.stats.failedPages += 1
+                    continue
+                if items is None:
+                    # Page can't be read or parsed (already retried by
+                    # session) - auction isn't finished, so its checkpoint
+                    # is kept and listing is continued by next import
+                    print("Listing of auction %d stopped at page %s" %
+                          (self.auctNo, page))
+                    self.__put(_PagesEnd(False))
+                    return
+                if not items:
+                    self.__put(_PagesEnd(not self.stats.failedPages))
+                    return
+
+                self.stats.listedPages += 1
+                self.__put((page, items))
+        except Exception as error:
+            print("Listing of auction %d failed: %s" % (self.auctNo, error))
+            self.stats.failedPages += 1
+
+        self.__put(_PagesEnd(False))
+
+    def __put(self, entry):
+        while not self.canceled:
+            try:
+                self._pages.put(entry, timeout=self.PutInterval)
+                return
+            except queue.Full:
+                pass
@@ -0,0 +1,198 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+import urllib.parse
+
+
+class Priority:
+    # Lower value is served first
+    List = 0
+    Lot = 1
+    Image = 2
+
+
+class HostState:
+    def __init__(self, budget, maxConcurrency):
+        # Maximum count of requests started per second
+        self.budget = budget
+        self.maxConcurrency = maxConcurrency
+        # Concurrency window: starts from one connection and grows while
+        # host responds fast and without errors
+        self.limit = 1.
+        self.threshold = float(maxConcurrency)
+        self.active = 0
+        self.waiting = []
+        self.nextStart = 0.
+        self.pausedTill = 0.
+        self.lastDecrease = 0.
+        self.failures = 0
+        self.latency = None
+        self.minLatency = None
+
+        self.requests = 0
+        self.throttled = 0
+
+    def __str__(self):
+        return ("%d requests, %d throttled, concurrency %.1f,"
+                " latency %.3fs" % (self.requests, self.throttled,
+                                     self.limit, self.latency or 0.))
+
+
+class Slot:
+    def __init__(self, host, state):
+        self.host = host
+        self.state = state
+        self.started = time.monotonic()
+
+
+class Scheduler:
+    DefaultBudget = 5.
+    MaxConcurrency = 8
+    # Pause of host after first error in seconds, doubled for each next
+    # error in a row
+    BackoffBase = 0.5
+    MaxBackoff = 60.
+    # Host is considered overloaded when average latency grows this
+    # times over the best observed
+    LatencyFactor = 3.
+    # Weight of last request in average latency
+    LatencyWeight = 0.2
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._hosts = {}
+        self._budgets = {}
+        self._counter = itertools.count()
+
+    def setBudget(self, host, requestsPerSecond, maxConcurrency=None):
+        with self._condition:
+            self._budgets[host] = (requestsPerSecond,
+                                   maxConcurrency or self.MaxConcurrency)
+
+    def acquire(self, url, priority=Priority.Lot):
+        host = urllib.parse.urlsplit(url).hostname
+        with self._condition:
+            state = self._hostState(host)
+            entry = (priority, next(self._counter))
+            heapq.heappush(state.waiting, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = self._delay(state, entry, now)
+                    if delay == 0.:
+                        break
+                    self._condition.wait(delay)
+            except BaseException:
+                state.waiting.remove(entry)
+                heapq.heapify(state.waiting)
+                self._condition.notify_all()
+                raise
+
+            heapq.heappop(state.waiting)
+            state.active += 1
+            state.requests += 1
+            state.nextStart = max(now, state.nextStart) + 1. / state.budget
+            # Next waiter may be allowed too
+            self._condition.notify_all()
+
+        return Slot(host, state)
+
+    def release(self, slot, status=None, retryAfter=None):
+        """Status is None when request failed without response"""
+        latency = time.monotonic() - slot.started
+        state = slot.state
+        with self._condition:
+            state.active -= 1
+            if status is None or status == 429 or status >= 500:
+                self._congested(state, retryAfter)
+            else:
+                self._succeeded(state, latency)
+
+            self._condition.notify_all()
+
+    def statistics(self):
+        with self._condition:
+            return '\n'.join("%s: %s" % (host, state)
+                             for host, state in sorted(self._hosts.items()))
+
+    def _hostState(self, host):
+        state = self._hosts.get(host)
+        if not state:
+            budget, maxConcurrency = self._budgets.get(
+                            host, (self.DefaultBudget, self.MaxConcurrency))
+            state = HostState(budget, maxConcurrency)
+            self._hosts[host] = state
+
+        return state
+
+    @staticmethod
+    def _delay(state, entry, now):
+        # None - wait for other request finishing
+        if state.waiting[0] != entry:
+            return None
+        if state.active >= int(state.limit):
+            return None
+
+        return max(0., state.pausedTill - now, state.nextStart - now)
+
+    def _succeeded(self, state, latency):
+        state.failures = 0
+
+        if state.latency is None:
+            state.latency = latency
+        else:
+            state.latency += (latency - state.latency) * self.LatencyWeight
+        if state.minLatency is None or latency < state.minLatency:
+            state.minLatency = latency
+
+        if state.latency > state.minLatency * self.LatencyFactor:
+            if self._canDecrease(state):
+                state.threshold = max(1., state.limit / 2)
+                state.limit = state.threshold
+        elif state.limit < state.threshold:
+            # Slow start
+            state.limit += 1.
+        else:
+            state.limit += 1. / state.limit
+
+        state.limit = min(state.limit, float(state.maxConcurrency))
+
+    def _congested(self, state, retryAfter):
+        state.failures += 1
+        state.throttled += 1
+
+        if self._canDecrease(state):
+            state.threshold = max(1., state.limit / 2)
+            state.limit = 1.
+
+        if retryAfter:
+            delay = min(float(retryAfter), self.MaxBackoff)
+        else:
+            delay = min(self.BackoffBase * (2 ** (state.failures - 1)),
+                        self.MaxBackoff)
+            delay += random.uniform(0, delay / 2)
+        state.pausedTill = max(state.pausedTill, time.monotonic() + delay)
+
+    @staticmethod
+    def _canDecrease(state):
+        # Decrease window once per round trip - simultaneous requests
+        # report about the same overload
+        now = time.monotonic()
+        if now - state.lastDecrease < (state.latency or 0.):
+            return False
+
+        state.lastDecrease = now
+        return True
+
+
+def defaultScheduler():
+    from OpenNumismat.Auctions import ParserClasses
+
+    scheduler = Scheduler()
+    for parserClass in ParserClasses:
+        for host in parserClass.hostNames():
+            scheduler.setBudget(host, parserClass.RequestRate)
+
+    return scheduler
@@ -1,24 +1,37 @@
 from PyQt5 import QtCore, QtGui
 
-import urllib.error
 import urllib.parse
-import urllib.request
 try:
     import lxml.html
+    from lxml.cssselect import CSSSelector
 except ImportError:
     print('lxml module missed. Auction parsing not available')
 
+from OpenNumismat.Auctions import Network
+from OpenNumismat.Auctions.Scheduler import Priority
 from OpenNumismat.Tools.CursorDecorators import waitCursorDecorator
 
 
 class _NotDoneYetError(Exception):
-    pass
+    def __init__(self, closeTime=None):
+        super().__init__()
+        # Expected closing time of lot in seconds since epoch when it is
+        # shown on lot page
+        self.closeTime = closeTime
 
 
 class _CanceledError(Exception):
     pass
 
 
+class NotDoneLot:
+    """Result of parsing lot which trading isn't finished yet"""
+
+    def __init__(self, url, closeTime=None):
+        self.url = url
+        self.closeTime = closeTime
+
+
 class AuctionItem:
     def __init__(self, place):
         self.place = place
@@ -28,10 +41,58 @@ class AuctionItem:
 
 
 class _AuctionParser(QtCore.QObject):
+    HostName = None
+    # Default count of parallel connections to auction host
+    Workers = 4
+    # Time in seconds while cached pages of auction host are used without
+    # requesting server
+    CacheTtl = 30 * 24 * 60 * 60
+    # Maximum count of requests per second to auction host
+    RequestRate = 5
+    # CSS selectors used by parser by name. Translated to XPath once per
+    # parser class instead of each cssselect() call
+    Selectors = {}
+
     def __init__(self, parent=None):
         QtCore.QObject.__init__(self, parent)
 
         self.html = ''
+        self.data = b''
+        self._doc = ''
+        self._docEncoding = 'utf-8'
+        # lxml parser isn't shared between threads, so each parser
+        # instance keeps own
+        self._htmlParsers = {}
+
+    @classmethod
+    def selector(cls, name):
+        compiled = cls.__dict__.get('_compiledSelectors')
+        if compiled is None:
+            compiled = {}
+            cls._compiledSelectors = compiled
+
+        try:
+            return compiled[name]
+        except KeyError:
+            selector = CSSSelector(cls.Selectors[name])
+            compiled[name] = selector
+            return selector
+
+    def select(self, name, element=None):
+        if element is None:
+            element = self.html
+        return self.selector(name)(element)
+
+    @property
+    def doc(self):
+        # Page text is required only by few parsers, so decoded on demand
+        if self._doc is None:
+            self._doc = self.data.decode(self._docEncoding, 'ignore')
+        return self._doc
+
+    @classmethod
+    def hostNames(cls):
+        return getattr(cls, 'HostNames', (cls.HostName,))
 
     @staticmethod
     def categories(self):
@@ -46,9 +107,9 @@ class _AuctionParser(QtCore.QObject):
     def getPageUrl(self, auctNo, category, page):
         raise NotImplementedError
 
-    def parsePage(self, url):
-        if self.readHtmlPage(url, self._encoding()):
-            if len(self.doc) == 0:
+    def parsePage(self, url, maxAge=None):
+        if self.readHtmlPage(url, self._encoding(), Priority.List, maxAge):
+            if not self.data:
                 return
 
             try:
@@ -58,35 +119,81 @@ class _AuctionParser(QtCore.QObject):
             except _CanceledError:
                 print("Auction canceled")
 
-    def parse(self, url):
-        if self.readHtmlPage(url, self._encoding()):
-            if len(self.doc) == 0:
+    def parse(self, url, maxAge=None):
+        if self.readHtmlPage(url, self._encoding(), maxAge=maxAge):
+            if not self.data:
                 return
 
             try:
                 return self._parse()
-            except _NotDoneYetError:
+            except _NotDoneYetError as error:
                 print("Auction not done yet")
+                return NotDoneLot(url, error.closeTime)
             except _CanceledError:
                 print("Auction canceled")
 
-    def readHtmlPage(self, url, encoding='utf-8'):
+    def readHtmlPage(self, url, encoding='utf-8', priority=Priority.Lot,
+                     maxAge=None):
         # TODO: Remove debug output
         print(url)
-        for _ in range(3):
-            try:
-                data = urllib.request.urlopen(url).read()
+        try:
+            # Shared session keeps connections alive and retries with
+            # backoff on errors, requests to host are rate limited by
+            # its scheduler. MaxAge overrides time of using cached page
+            data = Network.session().read(url, priority=priority,
+                                          maxAge=maxAge)
+
+            return self.loadHtmlPage(url, data, encoding)
+        except Network.NetworkError:
+            print("Error while reading page %s" % url)
 
-                self.doc = data.decode(encoding, 'ignore')
-                self.html = lxml.html.fromstring(self.doc)
-                self.url = url
+        return False
 
-                return True
-            except (ValueError, urllib.error.URLError):
-                print("Error while reading page %s" % url)
+    @staticmethod
+    def readHtmlTree(url, encoding='utf-8', priority=Priority.Lot):
+        # Reads additional page without changing current page of parser.
+        # Can be called from any thread, so lxml parser isn't shared
+        try:
+            data = Network.session().read(url, priority=priority)
+            if data:
+                parser = lxml.html.HTMLParser(encoding=encoding)
+                return lxml.html.fromstring(data, parser=parser)
+        except Network.NetworkError:
+            print("Error while reading page %s" % url)
+        except (ValueError, lxml.etree.LxmlError):
+            print("Error while parsing page %s" % url)
+
+        return None
+
+    def loadHtmlPage(self, url, data, encoding='utf-8'):
+        # Parsing is separated from reading for processing pages loaded
+        # by other way (f.e. saved pages in parsers benchmark)
+        self.url = url
+        self.data = data
+        self._doc = None
+        self._docEncoding = encoding
+        if not data:
+            self.html = ''
+            return True
+
+        # Bytes are parsed directly with page encoding without creating
+        # decoded copy of page
+        try:
+            self.html = lxml.html.fromstring(data,
+                                             parser=self._htmlParser(encoding))
+            return True
+        except (ValueError, lxml.etree.LxmlError):
+            print("Error while parsing page %s" % url)
 
         return False
 
+    def _htmlParser(self, encoding):
+        parser = self._htmlParsers.get(encoding)
+        if not parser:
+            parser = lxml.html.HTMLParser(encoding=encoding)
+            self._htmlParsers[encoding] = parser
+        return parser
+
     def _encoding(self):
         return 'utf-8'
 
@@ -102,6 +209,8 @@ from OpenNumismat.Auctions.AuctionParser import AuctionSpbParser
 from OpenNumismat.Auctions.AuctionParser import ConrosParser
 from OpenNumismat.Auctions.AuctionParser import WolmarParser
 
+ParserClasses = (MolotokParser, AuctionSpbParser, ConrosParser, WolmarParser)
+
 
 def getParser(url, parent=None):
     if MolotokParser.verifyDomain(url):
@@ -0,0 +1,131 @@
+"""Helpers shared by background jobs working with image files of
+collection: pool of worker threads polled by GUI thread, downloading of
+images and scanning of images folder."""
+
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from PyQt5 import QtCore
+
+from OpenNumismat.Auctions import Network
+
+
+def downloadImage(workingDir, collectionName, url):
+    """Downloads image and saves it to file named by its content, returns
+    file title and size of downloaded data. Can be called from any
+    thread"""
+    from OpenNumismat.Collection.Collection import Photo
+
+    data = Network.session().read(url, priority=Network.Priority.Image)
+
+    # File is written atomically and shared with identical images
+    try:
+        fileTitle = Photo.storeDownloadedData(workingDir, collectionName,
+                                              data)
+    except ValueError as error:
+        raise ValueError("%s: %s" % (url, error))
+
+    return fileTitle, len(data)
+
+
+def imagesFolder(workingDir, collectionName):
+    return os.path.join(workingDir, '%s_images' % collectionName)
+
+
+def scanFolder(folder):
+    """Yields (path relative to folder, os.DirEntry) of all files of folder
+    and its subfolders"""
+    stack = ['']
+    while stack:
+        subfolder = stack.pop()
+        try:
+            entries = os.scandir(os.path.join(folder, subfolder))
+        except FileNotFoundError:
+            continue
+
+        with entries:
+            for entry in entries:
+                path = os.path.join(subfolder, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(path)
+                else:
+                    yield path, entry
+
+
+class WorkerPool(QtCore.QObject):
+    """Runs jobs by pool of worker threads and handles their results in
+    GUI thread.
+
+    Jobs are submitted with a key and checked by timer which calls
+    process() of subclass. Job runs in worker thread, so it must not use
+    collection database - results are written by process().
+    """
+    Workers = 2
+    # Interval of checking jobs in milliseconds
+    PollInterval = 200
+
+    def __init__(self, workers=Workers, parent=None):
+        super().__init__(parent)
+
+        self.workers = workers
+
+        self._executor = None
+        self._futures = {}
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(self.PollInterval)
+        self._timer.timeout.connect(self.process)
+
+    def process(self):
+        raise NotImplementedError
+
+    def submit(self, key, fn, *args):
+        if not self._executor:
+            self._executor = ThreadPoolExecutor(self.workers)
+        self._futures[key] = self._executor.submit(fn, *args)
+
+    def isSubmitted(self, key):
+        return key in self._futures
+
+    def runningCount(self):
+        return len(self._futures)
+
+    def takeDone(self):
+        """Returns finished jobs as (key, future) pairs and forgets them"""
+        done = [(key, future) for key, future in self._futures.items()
+                if future.done()]
+        for key, _future in done:
+            del self._futures[key]
+
+        return done
+
+    def waitAny(self, timeout):
+        """Blocks until any job finishes or timeout in seconds expires"""
+        if self._futures:
+            wait(self._futures.values(), timeout=timeout,
+                 return_when=FIRST_COMPLETED)
+
+    def startPolling(self, interval=PollInterval):
+        if not self._timer.isActive() or self._timer.interval() != interval:
+            self._timer.start(interval)
+
+    def stopPolling(self):
+        self._timer.stop()
+
+    def isPolling(self):
+        return self._timer.isActive()
+
+    def nextPoll(self):
+        """Returns time in milliseconds till next call of process()"""
+        return self._timer.remainingTime()
+
+    def close(self):
+        self._timer.stop()
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+
+        # Running jobs are finished by their threads
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -1,6 +1,7 @@
+import hashlib
 import locale
 import os
-import uuid
+import tempfile
 
 from PyQt5 import QtGui, QtCore
 from PyQt5.QtCore import Qt, pyqtSignal
@@ -12,6 +13,10 @@ from OpenNumismat.Collection.CollectionFields import CollectionFields
 from OpenNumismat.Collection.CollectionPages import CollectionPages
 from OpenNumismat.Collection.Password import cryptPassword, PasswordDialog
 from OpenNumismat.Collection.Description import CollectionDescription
+from OpenNumismat.Collection.ImageQueue import ImageQueue
+from OpenNumismat.Collection.PhotoHashes import PhotoHashIndex
+from OpenNumismat.Collection import PhotoRenditions
+from OpenNumismat.Collection import Thumbnails
 from OpenNumismat.Reference.Reference import CrossReferenceSection
 from OpenNumismat.Reference.ReferenceDialog import AllReferenceDialog
 from OpenNumismat.EditCoinDialog.EditCoinDialog import EditCoinDialog
@@ -19,9 +24,21 @@ from OpenNumismat.Collection.VersionUpdater import updateCollection
 from OpenNumismat.Tools.CursorDecorators import waitCursorDecorator
 from OpenNumismat.Tools import Gui
 from OpenNumismat.Settings import Settings, BaseSettings
+from OpenNumismat.Auctions import Network
 from OpenNumismat import version
 
 
+def imageFormat(data):
+    """Returns file extension for JPEG and PNG data, None for other
+    formats - they are converted before saving"""
+    if data[:3] == b'\xff\xd8\xff':
+        return 'jpg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+
+    return None
+
+
 class Photo(QtCore.QObject):
     def __init__(self, id_, model):
         QtCore.QObject.__init__(self, model)
@@ -35,7 +52,12 @@ class Photo(QtCore.QObject):
         self.collectionName = model.collectionName
         self.changed = False
         self.cleared = False
+        # Image will be downloaded by background queue after saving
+        self.queued = False
         self.image = QtGui.QImage()
+        # Original file data, it is saved as is
+        self.data = None
+        self.dataFormat = None
 
         query = QSqlQuery(self.db)
         query.prepare("SELECT * FROM photos WHERE id=?")
@@ -45,59 +67,190 @@ class Photo(QtCore.QObject):
             self.file = query.record().value('file')
             self.url = query.record().value('url')
 
+    @property
+    def image(self):
+        # Original data is decoded only when image is needed
+        if self._image.isNull() and self.data:
+            self._image.loadFromData(self.data)
+        return self._image
+
+    @image.setter
+    def image(self, image):
+        self._image = image
+        self.data = None
+
+    def setData(self, data, dataFormat):
+        self._image = QtGui.QImage()
+        self.data = data
+        self.dataFormat = dataFormat
+
+    def loadData(self, data):
+        dataFormat = imageFormat(data)
+        if dataFormat:
+            self.setData(data, dataFormat)
+            return True
+
+        image = QtGui.QImage()
+        if not image.loadFromData(data):
+            return False
+
+        self.image = image
+        return True
+
+    def loadFile(self, fileName):
+        if not fileName:
+            return False
+
+        try:
+            with open(fileName, 'rb') as file:
+                return self.loadData(file.read())
+        except OSError:
+            return False
+
     def clear(self):
         self.cleared = True
 
     def isNull(self):
-        return not self.file and not self.url and self.image.isNull()
+        return not self.file and not self.url and self.isEmpty()
 
     def isEmpty(self):
-        return self.image.isNull()
+        return self._image.isNull() and not self.data
 
     def save(self):
         if self.cleared or self.isNull():
             self.remove()
         else:
-            if not self.file:
-                self.file = str(uuid.uuid1()) + '.jpg'
+            old_file = self.file
+            self.saveImage()
+
+            if self.id_:
+                query = QSqlQuery(self.db)
+                query.prepare("UPDATE photos SET file=?, url=? WHERE id=?")
+                query.addBindValue(self.file)
+                query.addBindValue(self.url)
+                query.addBindValue(self.id_)
+                query.exec_()
+            else:
+                query = QSqlQuery(self.db)
+                query.prepare("INSERT INTO photos (file, url) VALUES (?, ?)")
+                query.addBindValue(self.file)
+                query.addBindValue(self.url)
+                query.exec_()
 
-                if self.id_:
-                    query = QSqlQuery(self.db)
-                    query.prepare("UPDATE photos SET file=?, url=? WHERE id=?")
-                    query.addBindValue(self.file)
-                    query.addBindValue(self.url)
-                    query.addBindValue(self.id_)
-                    query.exec_()
-                else:
-                    query = QSqlQuery(self.db)
-                    query.prepare("INSERT INTO photos (file, url) VALUES (?, ?)")
-                    query.addBindValue(self.file)
-                    query.addBindValue(self.url)
-                    query.exec_()
+                self.id_ = query.lastInsertId()
 
-                    self.id_ = query.lastInsertId()
+            if old_file and old_file != self.file:
+                self._releaseFile(old_file)
 
-            if not self.image.isNull():
-                file_name = self._generateFileName(self.file, True)
-                self.image.save(file_name)
+    def setFile(self, file_title):
+        # Image file is already saved, for example by background loader
+        self.file = file_title
 
-    def remove(self):
-        if self.file:
-            file_name = self._generateFileName(self.file)
+        query = QSqlQuery(self.db)
+        query.prepare("UPDATE photos SET file=? WHERE id=?")
+        query.addBindValue(self.file)
+        query.addBindValue(self.id_)
+        query.exec_()
+
+    def saveImage(self):
+        if self.data:
+            self.file = self.storeData(self.workingDir, self.collectionName,
+                                       self.data, self.dataFormat)
+        elif not self._image.isNull():
+            self.file = self.storeImage(self.workingDir, self.collectionName,
+                                        self._image)
+
+    @staticmethod
+    def storeImage(workingDir, collectionName, image):
+        """Saves image to file named by its content and returns file title.
+        Can be called from any thread"""
+        ba = QtCore.QByteArray()
+        buffer = QtCore.QBuffer(ba)
+        buffer.open(QtCore.QIODevice.WriteOnly)
+        if not image.save(buffer, 'jpg'):
+            raise OSError("Can't encode image")
+
+        return Photo.storeData(workingDir, collectionName, bytes(ba), 'jpg')
+
+    @staticmethod
+    def storeDownloadedData(workingDir, collectionName, data):
+        """Saves downloaded image data without decoding when possible.
+        Can be called from any thread"""
+        dataFormat = imageFormat(data)
+        if dataFormat:
+            return Photo.storeData(workingDir, collectionName, data,
+                                   dataFormat)
+
+        image = QtGui.QImage()
+        if not image.loadFromData(data):
+            raise ValueError("Unknown image format")
+
+        return Photo.storeImage(workingDir, collectionName, image)
+
+    @staticmethod
+    def storeData(workingDir, collectionName, data, ext):
+        # Identical images get the same file, so it is written once and
+        # shared by all photos referencing it
+        file_title = "%s.%s" % (hashlib.sha1(data).hexdigest(), ext)
+        file_name = Photo.filePath(workingDir, collectionName, file_title)
+        if os.path.exists(file_name):
+            return file_title
+
+        folder = os.path.dirname(file_name)
+        os.makedirs(folder, exist_ok=True)
+
+        # Interrupted or concurrent writing doesn't leave broken file
+        fd, tmp_name = tempfile.mkstemp(suffix='.part', dir=folder)
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(tmp_name, file_name)
+        except:
             try:
-                os.remove(file_name)
-            except FileNotFoundError:
+                os.remove(tmp_name)
+            except OSError:
                 pass
-            self.file = None
+            raise
+
+        PhotoRenditions.schedule(file_name)
 
+        return file_title
+
+    def remove(self):
         if self.id_:
             query = QSqlQuery(self.db)
             query.prepare("DELETE FROM photos WHERE id=?")
             query.addBindValue(self.id_)
             query.exec_()
 
+        if self.file:
+            self._releaseFile(self.file)
+            self.file = None
+
         self.id_ = None
 
+    def _releaseFile(self, file_title):
+        # File is removed when no more photos reference it
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT 1 FROM photos WHERE file=? LIMIT 1")
+        query.addBindValue(file_title)
+        query.exec_()
+        if query.first():
+            return
+
+        file_name = self._generateFileName(file_title)
+        try:
+            os.remove(file_name)
+        except FileNotFoundError:
+            pass
+        PhotoRenditions.remove(file_name)
+
+    @staticmethod
+    def createIndex(db):
+        # Count of photos referencing file is checked by this index
+        sql = "CREATE INDEX IF NOT EXISTS photos_file ON photos (file)"
+        QSqlQuery(sql, db)
+
     def fileName(self):
         if self.file:
             file_name = self._generateFileName(self.file)
@@ -122,34 +275,234 @@ class Photo(QtCore.QObject):
 
     def uploadImage(self):
         if self.url:
-            import urllib.request
             try:
-                # Wikipedia require any header
-                req = urllib.request.Request(self.url,
-                                    headers={'User-Agent': version.AppName})
-                data = urllib.request.urlopen(req).read()
-                return self.image.loadFromData(data)
+                data = Network.session().read(self.url,
+                                              priority=Network.Priority.Image)
+                return self.loadData(data)
             except:
                 print('Can not load image %s' % self.url)
 
         return False
 
     def _generateFileName(self, file_title, create_folder=False):
-        path = os.path.join(self.workingDir,
-                            '%s_images' % self.collectionName,
-                            file_title[0:2], file_title[2:4])
+        file_name = self.filePath(self.workingDir, self.collectionName,
+                                  file_title)
 
         if create_folder:
-            os.makedirs(path, exist_ok=True)
-        file_name = os.path.join(path, file_title)
+            os.makedirs(os.path.dirname(file_name), exist_ok=True)
 
         return file_name
 
+    @staticmethod
+    def filePath(workingDir, collectionName, file_title):
+        return os.path.join(workingDir, '%s_images' % collectionName,
+                            file_title[0:2], file_title[2:4], file_title)
+
+
+def createPreview(obverseImage, reverseImage, height):
+    if not obverseImage.isNull():
+        obverseImage = obverseImage.scaledToHeight(height,
+                                                   Qt.SmoothTransformation)
+    if not reverseImage.isNull():
+        reverseImage = reverseImage.scaledToHeight(height,
+                                                   Qt.SmoothTransformation)
+
+    image = QtGui.QImage(obverseImage.width() + reverseImage.width(),
+                         height, QtGui.QImage.Format_RGB32)
+    image.fill(QtGui.QColor(Qt.white).rgb())
+
+    paint = QtGui.QPainter(image)
+    if not obverseImage.isNull():
+        paint.drawImage(QtCore.QRectF(0, 0, obverseImage.width(), height), obverseImage,
+                        QtCore.QRectF(0, 0, obverseImage.width(), height))
+    if not reverseImage.isNull():
+        paint.drawImage(QtCore.QRectF(obverseImage.width(), 0, reverseImage.width(), height), reverseImage,
+                        QtCore.QRectF(0, 0, reverseImage.width(), height))
+    paint.end()
+
+    return Thumbnails.encode(image)
+
+
+class RecordsWriter(QtCore.QObject):
+    PhotoFields = ('photo1', 'photo2', 'photo3', 'photo4')
+
+    def __init__(self, db, fields, workingDir, collectionName, previewHeight,
+                 imageQueue=None, parent=None):
+        super().__init__(parent)
+
+        self.db = db
+        self.workingDir = workingDir
+        self.collectionName = collectionName
+        self.previewHeight = previewHeight
+        self.imageQueue = imageQueue
+        self.columns = [field.name for field in fields if field.name != 'id']
+
+    def database(self):
+        return self.db
+
+    def appendRecords(self, records, written=None):
+        return self.write(records, written)
+
+    def write(self, records, written=None):
+        """Inserts records and returns count of inserted ones. Written is
+        called with each inserted record in the same transaction"""
+        # Records are built, images downloaded and saved before
+        # transaction, so other writers of collection aren't blocked
+        # while network is waited
+        prepared = [(record, self.__prepare(record)) for record in records]
+        if not prepared:
+            return 0
+
+        # Importer can write own marks in the same transaction
+        started = self.db.transaction()
+
+        # All rows are inserted by the same prepared statements
+        self.coinQuery = QSqlQuery(self.db)
+        self.coinQuery.prepare("INSERT INTO coins (%s) VALUES (%s)" %
+                               (', '.join(self.columns),
+                                ', '.join('?' * len(self.columns))))
+        self.photoQuery = QSqlQuery(self.db)
+        self.photoQuery.prepare("INSERT INTO photos (file, url) VALUES (?, ?)")
+        self.imageQuery = QSqlQuery(self.db)
+        self.imageQuery.prepare("INSERT INTO %s (image) VALUES (?)" % Thumbnails.Table)
+
+        count = 0
+        try:
+            for record, values in prepared:
+                if self.__writeRecord(values):
+                    count += 1
+                    if written:
+                        written(record)
+        except:
+            if started:
+                self.db.rollback()
+            raise
+
+        if started and not self.db.commit():
+            print(self.db.lastError().text())
+            self.db.rollback()
+            count = 0
+
+        self.coinQuery.clear()
+        self.photoQuery.clear()
+        self.imageQuery.clear()
+
+        return count
+
+    def __prepare(self, record):
+        values = dict(record)
+
+        photos = []
+        for field in self.PhotoFields:
+            photo = values.get(field)
+            if photo is None or photo.isNull():
+                values[field] = None
+                continue
+
+            if photo.queued and not self.imageQueue:
+                photo.uploadImage()
+            photos.append(photo)
+
+        if not values.get('image'):
+            values['image'] = self.__createPreview(values)
+
+        for photo in photos:
+            if not photo.id_ and not (photo.queued and self.imageQueue):
+                photo.saveImage()
+                photo.image = QtGui.QImage()  # free image
+
+        return values
+
+    def __writeRecord(self, values):
+        # Photos and preview of record which can't be inserted are
+        # removed with it
+        QSqlQuery("SAVEPOINT record", self.db)
+        inserted = []
+        if self.__insertRecord(values, inserted):
+            QSqlQuery("RELEASE SAVEPOINT record", self.db)
+            return True
+
+        QSqlQuery("ROLLBACK TO SAVEPOINT record", self.db)
+        QSqlQuery("RELEASE SAVEPOINT record", self.db)
+        for photo in inserted:
+            photo.id_ = None
+
+        return False
+
+    def __insertRecord(self, values, inserted):
+        image = values.get('image')
+        if image:
+            self.imageQuery.bindValue(0, image)
+            if not self.__exec(self.imageQuery):
+                return False
+            values['image'] = self.imageQuery.lastInsertId()
+        else:
+            values['image'] = None
+
+        queued = []
+        for field in self.PhotoFields:
+            photo = values.get(field)
+            if photo is None:
+                continue
+
+            if not photo.id_:
+                if photo.queued and self.imageQueue:
+                    # File will be assigned after downloading
+                    queued.append(photo)
+                self.photoQuery.bindValue(0, photo.file)
+                self.photoQuery.bindValue(1, photo.url)
+                if not self.__exec(self.photoQuery):
+                    return False
+                photo.id_ = self.photoQuery.lastInsertId()
+                inserted.append(photo)
+            elif photo.changed:
+                photo.save()
+
+            photo.image = QtGui.QImage()  # free image
+            values[field] = photo.id_
+
+        currentTime = QtCore.QDateTime.currentDateTimeUtc()
+        values['updatedat'] = currentTime.toString(Qt.ISODate)
+        if not values.get('createdat'):
+            values['createdat'] = values['updatedat']
+
+        for i, column in enumerate(self.columns):
+            self.coinQuery.bindValue(i, values.get(column))
+        if not self.__exec(self.coinQuery):
+            return False
+
+        for photo in queued:
+            self.imageQueue.add(photo.id_, self.coinQuery.lastInsertId())
+
+        return True
+
+    def __createPreview(self, values):
+        obverse = values.get('photo1')
+        reverse = values.get('photo2')
+        obverseImage = obverse.image if obverse else QtGui.QImage()
+        reverseImage = reverse.image if reverse else QtGui.QImage()
+        if obverseImage.isNull() and reverseImage.isNull():
+            return None
+
+        return createPreview(obverseImage, reverseImage, self.previewHeight)
+
+    @staticmethod
+    def __exec(query):
+        if not query.exec_():
+            print(query.lastError().text())
+            return False
+
+        return True
+
 
 class CollectionModel(QSqlTableModel):
     rowInserted = pyqtSignal(object)
     modelChanged = pyqtSignal()
+    # Preview image with given id is changed
+    imageChanged = pyqtSignal(int)
     IMAGE_FORMAT = 'jpg'
+    # Maximum count of ids in one query (SQLite limits count of variables)
+    PrefetchChunk = 500
 
     def __init__(self, collection, parent=None):
         super(CollectionModel, self).__init__(parent, collection.db)
@@ -164,14 +517,64 @@ class CollectionModel(QSqlTableModel):
         self.reference = collection.reference
         self.fields = collection.fields
         self.description = collection.description
+        self.imageQueue = collection.imageQueue
+        if self.imageQueue:
+            self.imageQueue.previewUpdated.connect(self.imageChanged)
+        self.photoHashes = collection.photoHashes
+        if self.photoHashes:
+            # New and changed photos are hashed in background
+            self.imageChanged.connect(
+                                lambda _imageId: self.photoHashes.start())
+            self.rowInserted.connect(lambda _index: self.photoHashes.start())
 
         self.proxy = None
 
+        # Preview images of visible rows, prefetched by view
+        self._images = {}
+        self.imageChanged.connect(self.imageChangedEvent)
+
         self.rowsInserted.connect(self.rowsInsertedEvent)
 
     def rowsInsertedEvent(self, parent, start, end):
         self.insertedRowIndex = self.index(end, 0)
 
+    def imageChangedEvent(self, imageId):
+        self._images.pop(imageId, None)
+
+    def prefetchImages(self, rows):
+        """Reads preview images of given rows by one query, so data()
+        of these rows doesn't query images one by one"""
+        column = self.fieldIndex('image')
+        ids = []
+        for row in rows:
+            img_id = super(CollectionModel, self).data(self.index(row, column),
+                                                       Qt.DisplayRole)
+            if img_id:
+                ids.append(img_id)
+
+        # Only images of last requested rows are kept
+        images = {}
+        missed = []
+        for img_id in ids:
+            if img_id in self._images:
+                images[img_id] = self._images[img_id]
+            else:
+                missed.append(img_id)
+
+        for i in range(0, len(missed), self.PrefetchChunk):
+            chunk = missed[i:i + self.PrefetchChunk]
+            query = QSqlQuery(self.database())
+            query.prepare("SELECT id, image FROM %s WHERE id IN (%s)" %
+                          (Thumbnails.Table, ', '.join('?' * len(chunk))))
+            for img_id in chunk:
+                query.addBindValue(img_id)
+            query.exec_()
+            while query.next():
+                record = query.record()
+                images[record.value(0)] = record.value(1)
+
+        self._images = images
+
     def data(self, index, role=Qt.DisplayRole):
         if role == Qt.DisplayRole:
             # Localize values
@@ -246,6 +649,22 @@ class CollectionModel(QSqlTableModel):
         self.insertRecord(-1, record)
         self.submitAll()
 
+    def appendRecords(self, records, written=None):
+        writer = RecordsWriter(self.database(), self.fields, self.workingDir,
+                               self.collectionName, self.previewHeight(),
+                               self.imageQueue, self)
+        count = writer.write(records, written)
+
+        self.select()
+
+        return count
+
+    @staticmethod
+    def previewHeight():
+        # Get height of list view for resizing images
+        tmp = QTableView()
+        return int(tmp.verticalHeader().defaultSectionSize() * 1.5 - 1)
+
     def insertRecord(self, row, record):
         self._updateRecord(record)
         record.setNull('id')  # remove ID value from record
@@ -255,7 +674,7 @@ class CollectionModel(QSqlTableModel):
         image = record.value('image')
         if image:
             query = QSqlQuery(self.database())
-            query.prepare("INSERT INTO images (image) VALUES (?)")
+            query.prepare("INSERT INTO %s (image) VALUES (?)" % Thumbnails.Table)
             query.addBindValue(image)
             query.exec_()
 
@@ -286,13 +705,15 @@ class CollectionModel(QSqlTableModel):
         if image:
             if img_id:
                 query = QSqlQuery(self.database())
-                query.prepare("UPDATE images SET image=? WHERE id=?")
+                query.prepare("UPDATE %s SET image=? WHERE id=?" % Thumbnails.Table)
                 query.addBindValue(image)
                 query.addBindValue(img_id)
                 query.exec_()
+
+                self.imageChanged.emit(img_id)
             else:
                 query = QSqlQuery(self.database())
-                query.prepare("INSERT INTO images (image) VALUES (?)")
+                query.prepare("INSERT INTO %s (image) VALUES (?)" % Thumbnails.Table)
                 query.addBindValue(image)
                 query.exec_()
 
@@ -302,10 +723,12 @@ class CollectionModel(QSqlTableModel):
         else:
             if img_id:
                 query = QSqlQuery(self.database())
-                query.prepare("DELETE FROM images WHERE id=?")
+                query.prepare("DELETE FROM %s WHERE id=?" % Thumbnails.Table)
                 query.addBindValue(img_id)
                 query.exec_()
 
+                self.imageChanged.emit(img_id)
+
             record.setNull('image')
 
         for i in range(4):
@@ -349,7 +772,7 @@ class CollectionModel(QSqlTableModel):
         img_id = record.value('image')
         if img_id:
             query = QSqlQuery(self.database())
-            query.prepare("DELETE FROM images WHERE id=?")
+            query.prepare("DELETE FROM %s WHERE id=?" % Thumbnails.Table)
             query.addBindValue(img_id)
             query.exec_()
 
@@ -403,41 +826,14 @@ class CollectionModel(QSqlTableModel):
              (record.isNull('photo2') or not record.value('photo2').changed):
             pass
         else:
-            # Get height of list view for resizing images
-            tmp = QTableView()
-            height = int(tmp.verticalHeader().defaultSectionSize() * 1.5 - 1)
-
             if not record.isNull('photo1') and obverseImage.isNull():
                 obverseImage = record.value('photo1').image
-            if not obverseImage.isNull():
-                obverseImage = obverseImage.scaledToHeight(height,
-                                                    Qt.SmoothTransformation)
             if not record.isNull('photo2') and reverseImage.isNull():
                 reverseImage = record.value('photo2').image
-            if not reverseImage.isNull():
-                reverseImage = reverseImage.scaledToHeight(height,
-                                                    Qt.SmoothTransformation)
-
-            image = QtGui.QImage(obverseImage.width() + reverseImage.width(),
-                                 height, QtGui.QImage.Format_RGB32)
-            image.fill(QtGui.QColor(Qt.white).rgb())
-
-            paint = QtGui.QPainter(image)
-            if not obverseImage.isNull():
-                paint.drawImage(QtCore.QRectF(0, 0, obverseImage.width(), height), obverseImage,
-                                QtCore.QRectF(0, 0, obverseImage.width(), height))
-            if not reverseImage.isNull():
-                paint.drawImage(QtCore.QRectF(obverseImage.width(), 0, reverseImage.width(), height), reverseImage,
-                                QtCore.QRectF(0, 0, reverseImage.width(), height))
-            paint.end()
-
-            ba = QtCore.QByteArray()
-            buffer = QtCore.QBuffer(ba)
-            buffer.open(QtCore.QIODevice.WriteOnly)
-
-            # Store as PNG for better view
-            image.save(buffer, 'png')
-            record.setValue('image', ba)
+
+            image = createPreview(obverseImage, reverseImage,
+                                  self.previewHeight())
+            record.setValue('image', image)
 
         currentTime = QtCore.QDateTime.currentDateTimeUtc()
         record.setValue('updatedat', currentTime.toString(Qt.ISODate))
@@ -451,6 +847,8 @@ class CollectionModel(QSqlTableModel):
         return ret
 
     def select(self):
+        self._images = {}
+
         ret = super(CollectionModel, self).select()
 
         self.modelChanged.emit()
@@ -472,8 +870,11 @@ class CollectionModel(QSqlTableModel):
         self.__applyFilter()
 
     def getImage(self, img_id):
+        if img_id in self._images:
+            return self._images[img_id]
+
         query = QSqlQuery(self.database())
-        query.prepare("SELECT image FROM images WHERE id=?")
+        query.prepare("SELECT image FROM %s WHERE id=?" % Thumbnails.Table)
         query.addBindValue(img_id)
         query.exec_()
         if query.first():
@@ -562,6 +963,8 @@ class Collection(QtCore.QObject):
         self.db = QSqlDatabase.addDatabase('QSQLITE')
         self._pages = None
         self.fileName = None
+        self.imageQueue = None
+        self.photoHashes = None
 
     def isOpen(self):
         return self.db.isValid()
@@ -600,6 +1003,8 @@ class Collection(QtCore.QObject):
         self.fields = CollectionFields(self.db)
 
         updateCollection(self)
+        Photo.createIndex(self.db)
+        Thumbnails.attach(self.db, self.fileName)
 
         self._pages = CollectionPages(self.db)
 
@@ -627,6 +1032,7 @@ class Collection(QtCore.QObject):
         self.fields = CollectionFields(self.db)
 
         self.createCoinsTable()
+        Thumbnails.attach(self.db, self.fileName)
 
         self._pages = CollectionPages(self.db)
 
@@ -636,6 +1042,31 @@ class Collection(QtCore.QObject):
 
         return True
 
+    def startImageQueue(self):
+        if self.imageQueue:
+            self.imageQueue.close()
+            self.imageQueue.deleteLater()
+
+        # Continue downloading images queued before restart
+        self.imageQueue = ImageQueue(self.db,
+                                     QtCore.QFileInfo(self.fileName).absolutePath(),
+                                     self.getCollectionName(),
+                                     CollectionModel.previewHeight(), parent=self)
+        self.imageQueue.start()
+
+    def startPhotoHashes(self):
+        if self.photoHashes:
+            self.photoHashes.close()
+            self.photoHashes.deleteLater()
+
+        # Hash photos added since last opening
+        self.photoHashes = PhotoHashIndex(self.db,
+                                          QtCore.QFileInfo(self.fileName).absolutePath(),
+                                          self.getCollectionName(), parent=self)
+        if self.imageQueue:
+            self.imageQueue.finished.connect(self.photoHashes.start)
+        self.photoHashes.start()
+
     def createCoinsTable(self):
         self.db.transaction()
 
@@ -656,16 +1087,12 @@ class Collection(QtCore.QObject):
         sql = """CREATE INDEX coins_denomination ON coins (denomination)"""
         QSqlQuery(sql, self.db)
 
-        sql = """CREATE TABLE images (
-                id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
-                image BLOB)"""
-        QSqlQuery(sql, self.db)
-
         sql = """CREATE TABLE photos (
                 id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
                 file TEXT,
                 url TEXT)"""
         QSqlQuery(sql, self.db)
+        Photo.createIndex(self.db)
 
         sql = """CREATE TABLE auctions (
                 id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
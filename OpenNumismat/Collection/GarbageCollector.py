@@ -0,0 +1,278 @@
+import os
+import re
+import time
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtSql import QSqlQuery
+
+from OpenNumismat.Collection.Background import imagesFolder, scanFolder
+from OpenNumismat.Collection import PhotoRenditions
+from OpenNumismat.Collection import Thumbnails
+
+
+class FileKind:
+    Original = 0
+    Rendition = 1
+    Temporary = 2
+
+
+class GarbageCollector(QtCore.QObject):
+    """Finds and removes image files, photos and previews which aren't
+    used by any coin.
+
+    Images folder is scanned into temporary table and everything else is
+    done by SQL, so memory usage doesn't depend on collection size.
+    """
+    stepped = pyqtSignal()
+
+    PhotoFields = ('photo1', 'photo2', 'photo3', 'photo4')
+    # Count of scanned files written to temporary table by one transaction
+    BatchSize = 1000
+    # Files modified later than this count of seconds before scanning can
+    # be still saved by background loaders and are kept
+    MinAge = 60 * 60
+
+    _renditionRe = re.compile(r'^(.+)_(\d+)\.jpg$')
+
+    def __init__(self, db, fileName, collectionName, parent=None):
+        super().__init__(parent)
+
+        self.db = db
+        self.imagesDir = imagesFolder(
+                            QtCore.QFileInfo(fileName).absolutePath(),
+                            collectionName)
+        self.hasPreviews = Thumbnails.isAttached(db)
+
+        self.canceled = False
+        self.scanned = False
+        self.scanTime = None
+        self.scannedCount = 0
+        self.removedCount = 0
+        self.removedSize = 0
+        self.elapsed = 0.
+
+        self.counts = {}
+
+    def cancel(self):
+        self.canceled = True
+
+    def scan(self):
+        startTime = time.perf_counter()
+        self.scanTime = time.time()
+
+        self.__createTables()
+
+        query = QSqlQuery(self.db)
+        query.prepare("INSERT INTO temp.gc_files"
+                      " (path, name, stem, kind, size, mtime)"
+                      " VALUES (?, ?, ?, ?, ?, ?)")
+
+        self.db.transaction()
+        batchCount = 0
+        for path, entry in scanFolder(self.imagesDir):
+            if self.canceled:
+                break
+
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+
+            stem, kind = self.__classify(entry.name)
+            query.bindValue(0, path)
+            query.bindValue(1, entry.name)
+            query.bindValue(2, stem)
+            query.bindValue(3, kind)
+            query.bindValue(4, stat.st_size)
+            query.bindValue(5, stat.st_mtime)
+            query.exec_()
+
+            self.scannedCount += 1
+            batchCount += 1
+            if batchCount >= self.BatchSize:
+                self.db.commit()
+                self.stepped.emit()
+                QtCore.QCoreApplication.processEvents()
+                self.db.transaction()
+                batchCount = 0
+
+        if not self.db.commit():
+            print(self.db.lastError().text())
+            self.db.rollback()
+
+        if not self.canceled:
+            self.scanned = True
+            self.__collectReferences()
+            self.__count()
+
+        self.elapsed += time.perf_counter() - startTime
+
+    def isEmpty(self):
+        return not any(self.counts.values())
+
+    def stepsCount(self):
+        return (self.counts.get('files', 0) +
+                self.counts.get('renditions', 0) +
+                self.counts.get('temporary', 0))
+
+    def report(self):
+        return self.tr("Unused image files: %d (%.1f MB)\n"
+                       "Unused photo renditions: %d\n"
+                       "Unfinished temporary files: %d\n"
+                       "Photos without coins: %d\n"
+                       "Previews without coins: %d") % (
+                self.counts['files'], self.counts['size'] / 1024 / 1024,
+                self.counts['renditions'], self.counts['temporary'],
+                self.counts['photos'], self.counts['previews'])
+
+    def collect(self):
+        if not self.scanned:
+            return
+
+        startTime = time.perf_counter()
+
+        # References could be changed by background loaders after scanning
+        self.__collectReferences()
+
+        self.db.transaction()
+
+        QSqlQuery("DELETE FROM photos"
+                  " WHERE id NOT IN (SELECT id FROM temp.gc_photos)", self.db)
+        if self.hasPreviews:
+            QSqlQuery("DELETE FROM %s WHERE id NOT IN"
+                      " (SELECT id FROM temp.gc_previews)" % Thumbnails.Table,
+                      self.db)
+
+        if not self.db.commit():
+            print(self.db.lastError().text())
+            self.db.rollback()
+            return
+
+        query = self.__orphanFiles("f.path, f.size")
+        while query.next() and not self.canceled:
+            record = query.record()
+            try:
+                os.remove(os.path.join(self.imagesDir, record.value(0)))
+            except FileNotFoundError:
+                pass
+            except OSError as error:
+                print("Can not remove image file: %s" % error)
+                continue
+
+            self.removedCount += 1
+            self.removedSize += record.value(1)
+
+            self.stepped.emit()
+            if self.removedCount % self.BatchSize == 0:
+                QtCore.QCoreApplication.processEvents()
+
+        query.clear()
+
+        self.elapsed += time.perf_counter() - startTime
+
+    def close(self):
+        for table in ('gc_files', 'gc_photos', 'gc_previews'):
+            QSqlQuery("DROP TABLE IF EXISTS temp.%s" % table, self.db)
+
+    def statistics(self):
+        rate = self.scannedCount / self.elapsed if self.elapsed else 0.
+        return ("%d files scanned, %d files (%.1f MB) removed in %.1fs"
+                " (%.0f files/s)" %
+                (self.scannedCount, self.removedCount,
+                 self.removedSize / 1024 / 1024, self.elapsed, rate))
+
+    def __classify(self, name):
+        if name.endswith('.part'):
+            return None, FileKind.Temporary
+
+        match = self._renditionRe.match(name)
+        if match and int(match.group(2)) in PhotoRenditions.Sides:
+            return match.group(1), FileKind.Rendition
+
+        return None, FileKind.Original
+
+    def __createTables(self):
+        self.close()
+
+        QSqlQuery("""CREATE TEMP TABLE gc_files (
+                path TEXT NOT NULL,
+                name TEXT NOT NULL,
+                stem TEXT,
+                kind INTEGER NOT NULL,
+                size INTEGER,
+                mtime REAL)""", self.db)
+        QSqlQuery("CREATE TEMP TABLE gc_photos"
+                  " (id INTEGER NOT NULL PRIMARY KEY)", self.db)
+        QSqlQuery("CREATE TEMP TABLE gc_previews"
+                  " (id INTEGER NOT NULL PRIMARY KEY)", self.db)
+
+    def __collectReferences(self):
+        self.db.transaction()
+
+        QSqlQuery("DELETE FROM temp.gc_photos", self.db)
+        for field in self.PhotoFields:
+            QSqlQuery("INSERT OR IGNORE INTO temp.gc_photos (id)"
+                      " SELECT %s FROM coins WHERE %s IS NOT NULL" %
+                      (field, field), self.db)
+
+        QSqlQuery("DELETE FROM temp.gc_previews", self.db)
+        QSqlQuery("INSERT OR IGNORE INTO temp.gc_previews (id)"
+                  " SELECT image FROM coins WHERE image IS NOT NULL", self.db)
+
+        if not self.db.commit():
+            print(self.db.lastError().text())
+            self.db.rollback()
+
+    def __orphanFiles(self, columns, grouped=False):
+        # File is used when it is referenced by photo of any coin, and
+        # rendition is used while its original file is used
+        sql = ("SELECT %s FROM temp.gc_files AS f WHERE f.mtime<? AND ("
+               "  f.kind=%d OR (NOT EXISTS (SELECT 1 FROM photos AS p"
+               "    JOIN temp.gc_photos AS g ON g.id=p.id"
+               "    WHERE p.file=f.name)"
+               "  AND (f.stem IS NULL OR NOT EXISTS (SELECT 1 FROM photos AS p"
+               "    JOIN temp.gc_photos AS g ON g.id=p.id"
+               "    WHERE p.file>=f.stem||'.' AND p.file<f.stem||'/'))))" %
+               (columns, FileKind.Temporary))
+        if grouped:
+            sql += " GROUP BY f.kind"
+
+        query = QSqlQuery(self.db)
+        query.setForwardOnly(True)
+        query.prepare(sql)
+        query.addBindValue(self.scanTime - self.MinAge)
+        query.exec_()
+
+        return query
+
+    def __count(self):
+        self.counts = {'files': 0, 'size': 0, 'renditions': 0,
+                       'temporary': 0, 'photos': 0, 'previews': 0}
+
+        query = self.__orphanFiles("f.kind, count(*), sum(f.size)",
+                                   grouped=True)
+        while query.next():
+            record = query.record()
+            kind = record.value(0)
+            if kind == FileKind.Original:
+                self.counts['files'] = record.value(1)
+                self.counts['size'] += record.value(2) or 0
+            elif kind == FileKind.Rendition:
+                self.counts['renditions'] = record.value(1)
+                self.counts['size'] += record.value(2) or 0
+            else:
+                self.counts['temporary'] = record.value(1)
+
+        query = QSqlQuery("SELECT count(*) FROM photos"
+                          " WHERE id NOT IN (SELECT id FROM temp.gc_photos)",
+                          self.db)
+        if query.first():
+            self.counts['photos'] = query.record().value(0)
+
+        if self.hasPreviews:
+            query = QSqlQuery("SELECT count(*) FROM %s WHERE id NOT IN"
+                              " (SELECT id FROM temp.gc_previews)" %
+                              Thumbnails.Table, self.db)
+            if query.first():
+                self.counts['previews'] = query.record().value(0)
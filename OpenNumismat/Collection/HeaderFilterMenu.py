@@ -252,6 +252,12 @@ class FilterMenuButton(QPushButton):
     def clear(self):
         self.setIcon(createIcon())
 
+    def updateIcon(self):
+        if self.fieldid in self.filters.keys():
+            self.setIcon(createIcon('filters.ico'))
+        else:
+            self.setIcon(createIcon())
+
     def applySearch(self, text):
         for i in range(self.listWidget.count()):
             item = self.listWidget.item(i)
@@ -0,0 +1,286 @@
+import time
+
+from PyQt5 import QtGui
+from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtSql import QSqlQuery
+
+from OpenNumismat.Collection.Background import WorkerPool, downloadImage
+from OpenNumismat.Collection import PhotoRenditions
+from OpenNumismat.Collection import Thumbnails
+
+
+class ImageQueue(WorkerPool):
+    """Downloads images of imported lots in background.
+
+    Queue is stored in collection, so downloading is continued after
+    restart. Photos are saved without image and get file when downloaded.
+    """
+    imageSaved = pyqtSignal(int)
+    # Preview image of coin with given id is recreated
+    previewUpdated = pyqtSignal(int)
+    finished = pyqtSignal()
+
+    Workers = 4
+    # Count of attempts to download image before giving up
+    Attempts = 5
+    # Delay before next attempt in seconds, doubled for each next attempt
+    RetryDelay = 30
+
+    def __init__(self, db, workingDir, collectionName, previewHeight,
+                 workers=Workers, parent=None):
+        super().__init__(workers, parent)
+
+        self.db = db
+        self.workingDir = workingDir
+        self.collectionName = collectionName
+        self.previewHeight = previewHeight
+
+        self.savedCount = 0
+        self.failedCount = 0
+
+        self._updatedPreviews = []
+
+        if 'image_queue' not in self.db.tables():
+            self.create(self.db)
+
+    def add(self, photoId, coinId):
+        query = QSqlQuery(self.db)
+        query.prepare("INSERT OR IGNORE INTO image_queue (photo, coin)"
+                      " VALUES (?, ?)")
+        query.addBindValue(photoId)
+        query.addBindValue(coinId)
+        query.exec_()
+
+        self.start()
+
+    def start(self):
+        if not self.isPolling():
+            self.__removeOrphans()
+        # Timer could wait for retry, but new image can be downloaded now
+        self.startPolling()
+
+    def pendingCount(self):
+        query = QSqlQuery(self.db)
+        query.exec_("SELECT count(*) FROM image_queue")
+        if query.first():
+            return query.record().value(0)
+
+        return 0
+
+    def isIdle(self):
+        return not self.isPolling()
+
+    def waitForDone(self):
+        while not self.isIdle():
+            if self.runningCount():
+                self.waitAny(self.PollInterval / 1000)
+            else:
+                # Only images waiting for retry are left
+                time.sleep(max(self.nextPoll(), self.PollInterval) / 1000)
+            self.process()
+
+    def statistics(self):
+        return "%d images downloaded, %d failed, %d pending" % (
+                            self.savedCount, self.failedCount,
+                            self.pendingCount())
+
+    def process(self):
+        done = self.takeDone()
+
+        saved = []
+        self._updatedPreviews = []
+        if done:
+            # Import may be in progress on the same connection - then
+            # results are committed together with imported page
+            started = self.db.transaction()
+
+            for photoId, future in done:
+                try:
+                    fileTitle, _size = future.result()
+                except Exception as error:
+                    self.__failed(photoId, error)
+                else:
+                    self.__saved(photoId, fileTitle)
+                    saved.append(photoId)
+
+            if started and not self.db.commit():
+                print(self.db.lastError().text())
+                self.db.rollback()
+
+        self.__submit()
+
+        for photoId in saved:
+            self.imageSaved.emit(photoId)
+        for imageId in self._updatedPreviews:
+            self.previewUpdated.emit(imageId)
+
+        if self.runningCount():
+            self.startPolling()
+            return
+
+        retryAt = self.__nextRetry()
+        if retryAt is None:
+            self.stopPolling()
+            self.finished.emit()
+        else:
+            # Nothing to check until the nearest retry
+            delay = int((retryAt - time.time()) * 1000)
+            self.startPolling(max(delay, self.PollInterval))
+
+    def __submit(self):
+        free = self.workers * 2 - self.runningCount()
+        if free <= 0:
+            return
+
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT image_queue.photo, photos.url FROM image_queue"
+                      " INNER JOIN photos ON photos.id=image_queue.photo"
+                      " WHERE image_queue.retry_at<=? ORDER BY image_queue.photo")
+        query.addBindValue(time.time())
+        query.exec_()
+        while free and query.next():
+            photoId = query.record().value(0)
+            if self.isSubmitted(photoId):
+                continue
+
+            self.submit(photoId, downloadImage, self.workingDir,
+                        self.collectionName, query.record().value(1))
+            free -= 1
+
+    def __nextRetry(self):
+        query = QSqlQuery(self.db)
+        query.exec_("SELECT min(image_queue.retry_at) FROM image_queue"
+                    " INNER JOIN photos ON photos.id=image_queue.photo")
+        if query.first():
+            value = query.record().value(0)
+            if value is not None and value != '':
+                return value
+
+        return None
+
+    def __removeOrphans(self):
+        # Photo could be removed with its coin before image downloaded
+        QSqlQuery("DELETE FROM image_queue"
+                  " WHERE photo NOT IN (SELECT id FROM photos)", self.db)
+
+    def __saved(self, photoId, fileTitle):
+        query = QSqlQuery(self.db)
+        query.prepare("UPDATE photos SET file=? WHERE id=?")
+        query.addBindValue(fileTitle)
+        query.addBindValue(photoId)
+        query.exec_()
+
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT coin FROM image_queue WHERE photo=?")
+        query.addBindValue(photoId)
+        query.exec_()
+        if query.first():
+            self.__updatePreview(query.record().value(0), photoId)
+
+        self.__remove(photoId)
+        self.savedCount += 1
+
+    def __failed(self, photoId, error):
+        print("Can not load image: %s" % error)
+
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT attempts FROM image_queue WHERE photo=?")
+        query.addBindValue(photoId)
+        query.exec_()
+        attempts = 0
+        if query.first():
+            attempts = query.record().value(0) + 1
+
+        # Client errors will not disappear after retry
+        status = getattr(error, 'status', None)
+        if attempts >= self.Attempts or \
+                (status and 400 <= status < 500 and status != 429):
+            # Photo keeps url, so image still can be loaded on demand
+            self.__remove(photoId)
+            self.failedCount += 1
+            return
+
+        query = QSqlQuery(self.db)
+        query.prepare("UPDATE image_queue SET attempts=?, retry_at=?"
+                      " WHERE photo=?")
+        query.addBindValue(attempts)
+        query.addBindValue(time.time() +
+                           self.RetryDelay * (2 ** (attempts - 1)))
+        query.addBindValue(photoId)
+        query.exec_()
+
+    def __remove(self, photoId):
+        query = QSqlQuery(self.db)
+        query.prepare("DELETE FROM image_queue WHERE photo=?")
+        query.addBindValue(photoId)
+        query.exec_()
+
+    def __updatePreview(self, coinId, photoId):
+        from OpenNumismat.Collection.Collection import createPreview
+
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT coins.image, p1.id, p1.file, p2.id, p2.file"
+                      " FROM coins"
+                      " LEFT JOIN photos AS p1 ON p1.id=coins.photo1"
+                      " LEFT JOIN photos AS p2 ON p2.id=coins.photo2"
+                      " WHERE coins.id=?")
+        query.addBindValue(coinId)
+        query.exec_()
+        if not query.first():
+            return
+
+        record = query.record()
+        if photoId not in (record.value(1), record.value(3)):
+            return
+
+        obverseImage = self.__loadImage(record.value(2))
+        reverseImage = self.__loadImage(record.value(4))
+        if obverseImage.isNull() and reverseImage.isNull():
+            return
+
+        image = createPreview(obverseImage, reverseImage, self.previewHeight)
+
+        imageId = record.value(0)
+        if imageId:
+            query = QSqlQuery(self.db)
+            query.prepare("UPDATE %s SET image=? WHERE id=?" % Thumbnails.Table)
+            query.addBindValue(image)
+            query.addBindValue(imageId)
+            query.exec_()
+
+            self._updatedPreviews.append(imageId)
+        else:
+            query = QSqlQuery(self.db)
+            query.prepare("INSERT INTO %s (image) VALUES (?)" % Thumbnails.Table)
+            query.addBindValue(image)
+            query.exec_()
+
+            query2 = QSqlQuery(self.db)
+            query2.prepare("UPDATE coins SET image=? WHERE id=?")
+            query2.addBindValue(query.lastInsertId())
+            query2.addBindValue(coinId)
+            query2.exec_()
+
+    def __loadImage(self, fileTitle):
+        image = QtGui.QImage()
+        if fileTitle:
+            # Preview is made from small rendition when it is ready
+            side = self.previewHeight * 2
+            image.load(PhotoRenditions.bestFile(self._fileName(fileTitle),
+                                                side, side))
+        return image
+
+    def _fileName(self, fileTitle):
+        from OpenNumismat.Collection.Collection import Photo
+
+        return Photo.filePath(self.workingDir, self.collectionName,
+                              fileTitle)
+
+    @staticmethod
+    def create(db):
+        sql = """CREATE TABLE IF NOT EXISTS image_queue (
+                photo INTEGER NOT NULL PRIMARY KEY,
+                coin INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                retry_at REAL NOT NULL DEFAULT 0)"""
+        QSqlQuery(sql, db)
@@ -0,0 +1,144 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtSql import QSqlQuery
+
+from OpenNumismat.Collection.Background import downloadImage
+from OpenNumismat.Collection.Background import imagesFolder, scanFolder
+
+
+class ImageUploader(QtCore.QObject):
+    """Downloads images of photos which have url but no file"""
+    stepped = pyqtSignal()
+
+    Workers = 8
+    # Count of saved photos written to collection by one transaction
+    BatchSize = 100
+    # Time in seconds between processing GUI events while waiting
+    EventsInterval = 0.05
+
+    def __init__(self, db, workingDir, collectionName, workers=Workers,
+                 parent=None):
+        super().__init__(parent)
+
+        self.db = db
+        self.workingDir = workingDir
+        self.collectionName = collectionName
+        self.workers = workers
+
+        self.canceled = False
+        self.savedCount = 0
+        self.failedCount = 0
+        self.bytesCount = 0
+        self.elapsed = 0.
+
+        self._missed = None
+
+    def missed(self):
+        """List of (photo id, file title, url) of photos without file"""
+        if self._missed is None:
+            # Titles of all image files by one pass over images folder
+            folder = imagesFolder(self.workingDir, self.collectionName)
+            files = {entry.name for _path, entry in scanFolder(folder)}
+
+            sql = "SELECT id, file, url FROM photos WHERE ifnull(url,'')<>''"
+            # Photos of imported lots are downloaded by image queue
+            if 'image_queue' in self.db.tables():
+                sql += " AND id NOT IN (SELECT photo FROM image_queue)"
+
+            self._missed = []
+            query = QSqlQuery(self.db)
+            query.setForwardOnly(True)
+            query.exec_(sql)
+            while query.next():
+                record = query.record()
+                fileTitle = record.value(1)
+                if not fileTitle or fileTitle not in files:
+                    self._missed.append((record.value(0), fileTitle,
+                                         record.value(2)))
+
+        return self._missed
+
+    def stepsCount(self):
+        return len(self.missed())
+
+    def cancel(self):
+        self.canceled = True
+
+    def run(self):
+        startTime = time.perf_counter()
+        pending = iter(self.missed())
+        futures = {}
+        saved = []
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            while not self.canceled:
+                # Keep workers busy without queuing all photos at once
+                while len(futures) < self.workers * 2:
+                    entry = next(pending, None)
+                    if entry is None:
+                        break
+                    photoId, fileTitle, url = entry
+                    future = executor.submit(downloadImage, self.workingDir,
+                                             self.collectionName, url)
+                    futures[future] = (photoId, fileTitle)
+
+                if not futures:
+                    break
+
+                done, _ = wait(futures, timeout=self.EventsInterval,
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    photoId, fileTitle = futures.pop(future)
+                    self.stepped.emit()
+                    try:
+                        newTitle, size = future.result()
+                    except Exception as error:
+                        print("Can not load image: %s" % error)
+                        self.failedCount += 1
+                        continue
+
+                    self.savedCount += 1
+                    self.bytesCount += size
+                    if newTitle != fileTitle:
+                        saved.append((photoId, newTitle))
+
+                if len(saved) >= self.BatchSize:
+                    self.__save(saved)
+                    saved = []
+
+                QtCore.QCoreApplication.processEvents()
+
+            for future in futures:
+                future.cancel()
+
+        self.__save(saved)
+
+        self.elapsed += time.perf_counter() - startTime
+
+    def statistics(self):
+        rate = self.savedCount / self.elapsed if self.elapsed else 0.
+        speed = self.bytesCount / 1024 / self.elapsed if self.elapsed else 0.
+        return ("%d images downloaded, %d failed in %.1fs"
+                " (%.1f images/s, %.0f KB/s)" %
+                (self.savedCount, self.failedCount, self.elapsed, rate,
+                 speed))
+
+    def __save(self, saved):
+        if not saved:
+            return
+
+        self.db.transaction()
+
+        query = QSqlQuery(self.db)
+        query.prepare("UPDATE photos SET file=? WHERE id=?")
+        for photoId, fileTitle in saved:
+            query.bindValue(0, fileTitle)
+            query.bindValue(1, photoId)
+            query.exec_()
+
+        if not self.db.commit():
+            print(self.db.lastError().text())
+            self.db.rollback()
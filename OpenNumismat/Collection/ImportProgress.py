@@ -0,0 +1,140 @@
+from PyQt5 import QtCore
+from PyQt5.QtSql import QSqlQuery
+
+
+class ImportProgress(QtCore.QObject):
+    # Special values of page and lot columns
+    StartedPage = -1
+    PageLot = ''
+
+    def __init__(self, db, place, number, category, parent=None):
+        super().__init__(parent)
+
+        self.db = db
+        self.key = (place, number, category)
+
+        if 'import_progress' not in self.db.tables():
+            self.create(self.db)
+
+    def isStarted(self):
+        return self.__exists(self.StartedPage, self.PageLot)
+
+    def start(self):
+        self.__mark(self.StartedPage, self.PageLot)
+
+    def auctionId(self):
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT id FROM auctions WHERE place=? AND number=?"
+                      " AND category=?")
+        for value in self.key:
+            query.addBindValue(value)
+        query.exec_()
+        if query.first():
+            return query.record().value(0)
+
+        return None
+
+    def isPageDone(self, page):
+        return self.__exists(page, self.PageLot)
+
+    def setPageDone(self, page):
+        self.__mark(page, self.PageLot)
+
+    def donePages(self):
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT page FROM import_progress WHERE place=?"
+                      " AND number=? AND category=? AND page<>? AND lot=?")
+        for value in self.key:
+            query.addBindValue(value)
+        query.addBindValue(self.StartedPage)
+        query.addBindValue(self.PageLot)
+        query.exec_()
+
+        pages = set()
+        while query.next():
+            pages.add(query.record().value(0))
+
+        return pages
+
+    def doneLots(self, page):
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT lot FROM import_progress WHERE place=?"
+                      " AND number=? AND category=? AND page=? AND lot<>?")
+        for value in self.key:
+            query.addBindValue(value)
+        query.addBindValue(page)
+        query.addBindValue(self.PageLot)
+        query.exec_()
+
+        lots = set()
+        while query.next():
+            lots.add(query.record().value(0))
+
+        return lots
+
+    def setLotDone(self, page, lot):
+        self.__mark(page, str(lot))
+
+    def finish(self):
+        query = QSqlQuery(self.db)
+        query.prepare("DELETE FROM import_progress WHERE place=? AND number=?"
+                      " AND category=?")
+        for value in self.key:
+            query.addBindValue(value)
+        query.exec_()
+
+    @staticmethod
+    def unfinished(db, place, category):
+        if 'import_progress' not in db.tables():
+            return []
+
+        query = QSqlQuery(db)
+        query.prepare("SELECT DISTINCT number FROM import_progress"
+                      " WHERE place=? AND category=? ORDER BY number")
+        query.addBindValue(place)
+        query.addBindValue(category)
+        query.exec_()
+
+        numbers = []
+        while query.next():
+            numbers.append(query.record().value(0))
+
+        return numbers
+
+    def __exists(self, page, lot):
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT 1 FROM import_progress WHERE place=?"
+                      " AND number=? AND category=? AND page=? AND lot=?")
+        for value in self.key:
+            query.addBindValue(value)
+        query.addBindValue(page)
+        query.addBindValue(lot)
+        query.exec_()
+
+        return query.first()
+
+    def __mark(self, page, lot):
+        query = QSqlQuery(self.db)
+        query.prepare("INSERT OR IGNORE INTO import_progress"
+                      " (place, number, category, page, lot)"
+                      " VALUES (?, ?, ?, ?, ?)")
+        for value in self.key:
+            query.addBindValue(value)
+        query.addBindValue(page)
+        query.addBindValue(lot)
+        query.exec_()
+
+    @staticmethod
+    def create(db):
+        sql = """CREATE TABLE IF NOT EXISTS import_progress (
+                id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+                place TEXT,
+                number INTEGER,
+                category TEXT,
+                page INTEGER,
+                lot TEXT)"""
+        QSqlQuery(sql, db)
+
+        sql = """CREATE UNIQUE INDEX IF NOT EXISTS import_progress_key
+                ON import_progress (place, number, category, page, lot)"""
+        QSqlQuery(sql, db)
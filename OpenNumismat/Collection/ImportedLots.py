@@ -0,0 +1,82 @@
+from PyQt5 import QtCore
+from PyQt5.QtCore import Qt
+from PyQt5.QtSql import QSqlQuery
+
+
+class ImportedLots(QtCore.QObject):
+    IndexName = 'coins_lot'
+    # Fields taken from auctions list page - they are updated for already
+    # imported lots without reading lot page
+    PageFields = ('denomination', 'year', 'mintmark', 'material', 'grade',
+                  'price', 'totalpayprice', 'totalsaleprice', 'buyer', 'bids')
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+
+        self.db = db
+
+        if not self.isIndexed(self.db):
+            self.create(self.db)
+
+        self.findQuery = QSqlQuery(self.db)
+        self.findQuery.prepare("SELECT id FROM coins WHERE place=? AND site=?"
+                               " AND auctionnum=? AND lotnum=?")
+
+    def find(self, record):
+        for i, field in enumerate(('place', 'site', 'auctionnum', 'lotnum')):
+            self.findQuery.bindValue(i, record[field])
+        self.findQuery.exec_()
+        if self.findQuery.first():
+            return self.findQuery.record().value(0)
+
+        return None
+
+    def update(self, records):
+        self.db.transaction()
+
+        query = QSqlQuery(self.db)
+        query.prepare("UPDATE coins SET %s, updatedat=? WHERE id=?" %
+                      ', '.join(field + '=?' for field in self.PageFields))
+
+        currentTime = QtCore.QDateTime.currentDateTimeUtc()
+        updatedAt = currentTime.toString(Qt.ISODate)
+
+        count = 0
+        for id_, record in records:
+            for i, field in enumerate(self.PageFields):
+                query.bindValue(i, record[field])
+            query.bindValue(len(self.PageFields), updatedAt)
+            query.bindValue(len(self.PageFields) + 1, id_)
+            if query.exec_():
+                count += 1
+            else:
+                print(query.lastError().text())
+
+        if not self.db.commit():
+            self.db.rollback()
+            count = 0
+
+        return count
+
+    @staticmethod
+    def isIndexed(db):
+        # Index created by previous versions was unique - it doesn't allow
+        # to paste or clone imported coins
+        query = QSqlQuery(db)
+        query.prepare("SELECT sql FROM sqlite_master WHERE type='index'"
+                      " AND name=?")
+        query.addBindValue(ImportedLots.IndexName)
+        query.exec_()
+        if query.first():
+            return 'UNIQUE' not in query.record().value(0).upper()
+
+        return False
+
+    @staticmethod
+    def create(db):
+        # Lot could be copied to several coins, so importer looks for it
+        # before writing instead of relying on unique index
+        QSqlQuery("DROP INDEX IF EXISTS %s" % ImportedLots.IndexName, db)
+        sql = """CREATE INDEX %s
+                ON coins (place, site, auctionnum, lotnum)""" % ImportedLots.IndexName
+        QSqlQuery(sql, db)
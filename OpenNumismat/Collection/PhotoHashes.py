@@ -0,0 +1,328 @@
+"""Perceptual hashes of obverse and reverse photos for finding the same
+coin sold in different auctions.
+
+Hash is 64-bit difference hash (dHash) - it stays close for recompressed,
+resized or slightly retouched photos. For lookup hash is split into 4
+chunks of 16 bits stored in indexed columns: hashes which differ in less
+than 4 bits have at least one equal chunk, so candidates are selected by
+index and checked by exact distance.
+"""
+
+import os
+
+from PyQt5 import QtGui
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtSql import QSqlQuery
+
+from OpenNumismat.Collection.Background import WorkerPool
+from OpenNumismat.Collection import PhotoRenditions
+
+Chunks = 4
+ChunkBits = 16
+MaxDistance = Chunks - 1
+
+
+def dhash(image):
+    # Each bit tells is pixel brighter than its right neighbour in 9x8
+    # grayscale thumbnail
+    small = image.scaled(9, 8, Qt.IgnoreAspectRatio,
+                         Qt.SmoothTransformation)
+    value = 0
+    for y in range(8):
+        left = QtGui.qGray(small.pixel(0, y))
+        for x in range(1, 9):
+            right = QtGui.qGray(small.pixel(x, y))
+            value = (value << 1) | (left > right)
+            left = right
+
+    return value
+
+
+def distance(hash1, hash2):
+    return bin(hash1 ^ hash2).count('1')
+
+
+def chunks(value):
+    mask = (1 << ChunkBits) - 1
+    return [(value >> (ChunkBits * i)) & mask for i in range(Chunks)]
+
+
+def _toDb(value):
+    # SQLite integers are signed
+    if value >= 1 << 63:
+        value -= 1 << 64
+    return value
+
+
+def _fromDb(value):
+    if value < 0:
+        value += 1 << 64
+    return value
+
+
+class PhotoHashIndex(WorkerPool):
+    """Hashes photos of coins in background.
+
+    Photo files are named by content, so hash is stored by file and only
+    files without hash are processed.
+    """
+    finished = pyqtSignal()
+
+    PhotoFields = ('photo1', 'photo2')
+
+    def __init__(self, db, workingDir, collectionName,
+                 workers=WorkerPool.Workers, parent=None):
+        super().__init__(workers, parent)
+
+        self.db = db
+        self.workingDir = workingDir
+        self.collectionName = collectionName
+
+        self.hashedCount = 0
+
+        # Id of last coin which photos are checked by current pass
+        self._lastCoin = 0
+        self._atEnd = False
+        self._rescan = False
+
+        if 'photo_hashes' not in self.db.tables():
+            self.create(self.db)
+
+    def start(self):
+        if self.isPolling():
+            # Photos of already checked coins could be changed
+            self._rescan = True
+        else:
+            self._lastCoin = 0
+            self._atEnd = False
+            self.startPolling()
+
+    def isIdle(self):
+        return not self.isPolling()
+
+    def process(self):
+        done = self.takeDone()
+
+        if done:
+            started = self.db.transaction()
+
+            for fileTitle, future in done:
+                try:
+                    value = future.result()
+                except FileNotFoundError:
+                    # Will be hashed by next pass when file appears
+                    continue
+                except Exception as error:
+                    print("Can not hash photo: %s" % error)
+                    value = None
+
+                self.__save(fileTitle, value)
+
+            if started and not self.db.commit():
+                print(self.db.lastError().text())
+                self.db.rollback()
+
+        self.__submit()
+
+        if not self.runningCount() and self._atEnd:
+            if self._rescan:
+                self._rescan = False
+                self._lastCoin = 0
+                self._atEnd = False
+                return
+
+            self.stopPolling()
+            self.__removeUnused()
+            self.finished.emit()
+
+    def findSameCoins(self, coinId, maxDistance=MaxDistance):
+        """Returns list of (coin id, distance) of other coins with similar
+        obverse or reverse photo, nearest first"""
+        maxDistance = min(maxDistance, MaxDistance)
+
+        distances = {}
+        for fileTitle in self.__coinFiles(coinId):
+            value = self.__hash(fileTitle)
+            if value is None:
+                continue
+
+            for similarFile, dist in self.__similarFiles(value, maxDistance):
+                if distances.get(similarFile, dist + 1) > dist:
+                    distances[similarFile] = dist
+
+        coins = {}
+        for fileTitle, dist in distances.items():
+            for otherId in self.__fileCoins(fileTitle):
+                if otherId != coinId and coins.get(otherId, dist + 1) > dist:
+                    coins[otherId] = dist
+
+        return sorted(coins.items(), key=lambda item: (item[1], item[0]))
+
+    def __submit(self):
+        free = self.workers * 2 - self.runningCount()
+        if free <= 0 or self._atEnd:
+            return
+
+        query = QSqlQuery(self.db)
+        query.setForwardOnly(True)
+        query.prepare("SELECT coins.id, p1.file, p2.file FROM coins"
+                      " LEFT JOIN photos AS p1 ON p1.id=coins.photo1"
+                      " LEFT JOIN photos AS p2 ON p2.id=coins.photo2"
+                      " WHERE coins.id>? AND ("
+                      "  (p1.file IS NOT NULL AND p1.file NOT IN"
+                      "   (SELECT file FROM photo_hashes)) OR"
+                      "  (p2.file IS NOT NULL AND p2.file NOT IN"
+                      "   (SELECT file FROM photo_hashes)))"
+                      " ORDER BY coins.id")
+        query.addBindValue(self._lastCoin)
+        query.exec_()
+
+        while free > 0:
+            if not query.next():
+                self._atEnd = True
+                break
+
+            record = query.record()
+            for i in (1, 2):
+                fileTitle = record.value(i)
+                if fileTitle and not self.isSubmitted(fileTitle):
+                    self.submit(fileTitle, self._hash, fileTitle)
+                    free -= 1
+            self._lastCoin = record.value(0)
+
+        query.clear()
+
+    def __save(self, fileTitle, value):
+        # Photo which can't be decoded gets empty hash and isn't
+        # processed again
+        query = QSqlQuery(self.db)
+        query.prepare("INSERT OR REPLACE INTO photo_hashes"
+                      " (file, hash, h0, h1, h2, h3)"
+                      " VALUES (?, ?, ?, ?, ?, ?)")
+        query.addBindValue(fileTitle)
+        if value is None:
+            for _ in range(Chunks + 1):
+                query.addBindValue(None)
+        else:
+            query.addBindValue(_toDb(value))
+            for chunk in chunks(value):
+                query.addBindValue(chunk)
+        query.exec_()
+
+        self.hashedCount += 1
+
+    def __removeUnused(self):
+        QSqlQuery("DELETE FROM photo_hashes WHERE file NOT IN"
+                  " (SELECT file FROM photos WHERE file IS NOT NULL)",
+                  self.db)
+
+    def __hash(self, fileTitle):
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT hash FROM photo_hashes WHERE file=?")
+        query.addBindValue(fileTitle)
+        query.exec_()
+        if query.first():
+            value = query.record().value(0)
+            if value is None or value == '':
+                return None
+            return _fromDb(value)
+
+        # Photo isn't hashed yet by background pass
+        try:
+            value = self._hash(fileTitle)
+        except FileNotFoundError:
+            return None
+        except Exception as error:
+            print("Can not hash photo: %s" % error)
+            value = None
+
+        self.__save(fileTitle, value)
+
+        return value
+
+    def __coinFiles(self, coinId):
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT p1.file, p2.file FROM coins"
+                      " LEFT JOIN photos AS p1 ON p1.id=coins.photo1"
+                      " LEFT JOIN photos AS p2 ON p2.id=coins.photo2"
+                      " WHERE coins.id=?")
+        query.addBindValue(coinId)
+        query.exec_()
+        if query.first():
+            record = query.record()
+            return [record.value(i) for i in range(2) if record.value(i)]
+
+        return []
+
+    def __similarFiles(self, value, maxDistance):
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT file, hash FROM photo_hashes"
+                      " WHERE h0=? OR h1=? OR h2=? OR h3=?")
+        for chunk in chunks(value):
+            query.addBindValue(chunk)
+        query.exec_()
+
+        result = []
+        while query.next():
+            record = query.record()
+            dist = distance(value, _fromDb(record.value(1)))
+            if dist <= maxDistance:
+                result.append((record.value(0), dist))
+
+        return result
+
+    def __fileCoins(self, fileTitle):
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT coins.id FROM coins"
+                      " INNER JOIN photos ON photos.id=coins.photo1"
+                      " WHERE photos.file=?"
+                      " UNION SELECT coins.id FROM coins"
+                      " INNER JOIN photos ON photos.id=coins.photo2"
+                      " WHERE photos.file=?")
+        query.addBindValue(fileTitle)
+        query.addBindValue(fileTitle)
+        query.exec_()
+
+        coins = []
+        while query.next():
+            coins.append(query.record().value(0))
+
+        return coins
+
+    def _hash(self, fileTitle):
+        from OpenNumismat.Collection.Collection import Photo
+
+        fileName = Photo.filePath(self.workingDir, self.collectionName,
+                                  fileTitle)
+        if not os.path.exists(fileName):
+            raise FileNotFoundError(fileName)
+
+        # Smallest rendition is enough for 9x8 thumbnail
+        side = PhotoRenditions.Sides[0]
+        reader = QtGui.QImageReader(PhotoRenditions.bestFile(fileName,
+                                                             side, side))
+        image = reader.read()
+        if image.isNull():
+            raise ValueError("%s: %s" % (fileTitle, reader.errorString()))
+
+        return dhash(image)
+
+    @staticmethod
+    def create(db):
+        db.transaction()
+
+        sql = """CREATE TABLE photo_hashes (
+            file TEXT NOT NULL PRIMARY KEY,
+            hash INTEGER,
+            h0 INTEGER, h1 INTEGER, h2 INTEGER, h3 INTEGER)"""
+        QSqlQuery(sql, db)
+        for i in range(Chunks):
+            QSqlQuery("CREATE INDEX photo_hashes_h%d ON photo_hashes (h%d)" %
+                      (i, i), db)
+
+        # Coins with found photos are selected by these indexes
+        for field in PhotoHashIndex.PhotoFields:
+            QSqlQuery("CREATE INDEX IF NOT EXISTS coins_%s ON coins (%s)" %
+                      (field, field), db)
+
+        db.commit()
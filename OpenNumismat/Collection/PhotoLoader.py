@@ -0,0 +1,140 @@
+import collections
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5 import QtCore, QtGui
+from PyQt5.QtCore import Qt, pyqtSignal
+
+from OpenNumismat.Collection.Background import downloadImage
+from OpenNumismat.Collection.Collection import Photo
+from OpenNumismat.Collection import PhotoRenditions
+
+
+class PhotoLoader(QtCore.QObject):
+    """Reads photos for showing in background.
+
+    Image is decoded directly to requested size, missed image file is
+    downloaded by its url. Last loaded images are kept, so prefetched
+    photos are shown immediately.
+    """
+    loaded = pyqtSignal(object, object)
+    _done = pyqtSignal(object, object)
+
+    Workers = 2
+    # Count of kept images
+    CacheSize = 16
+
+    def __init__(self, workingDir, collectionName, parent=None):
+        super().__init__(parent)
+
+        self.workingDir = workingDir
+        self.collectionName = collectionName
+
+        self._executor = ThreadPoolExecutor(self.Workers)
+        self._pending = {}
+        self._images = collections.OrderedDict()
+
+        # Callback of future is called in worker thread, signal passes
+        # result to GUI thread
+        self._done.connect(self.__finished)
+
+    def load(self, photo, size, download=True):
+        """Returns image when already loaded with enough size, otherwise
+        starts loading and returns None - loaded signal is emitted when
+        image is ready"""
+        key = photo.id_
+        image = self.image(key, size)
+        if image:
+            return image
+
+        if key not in self._pending:
+            fileName = None
+            if photo.file:
+                fileName = Photo.filePath(self.workingDir,
+                                          self.collectionName, photo.file)
+            url = photo.url if download else None
+            future = self._executor.submit(self._read, fileName, url,
+                                           QtCore.QSize(size))
+            self._pending[key] = (photo, future)
+            future.add_done_callback(lambda f: self._done.emit(key, f))
+
+        return None
+
+    def image(self, key, size):
+        entry = self._images.get(key)
+        if entry:
+            image, full = entry
+            if full or image.width() >= size.width() or \
+                    image.height() >= size.height():
+                self._images.move_to_end(key)
+                return image
+
+        return None
+
+    def clear(self):
+        # Photos may be changed
+        self._images.clear()
+
+    def close(self):
+        for _photo, future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=False)
+
+    def __finished(self, key, future):
+        photo, _future = self._pending.pop(key, (None, None))
+        if photo is None or future.cancelled():
+            return
+
+        try:
+            image, full, fileTitle = future.result()
+        except Exception as error:
+            print("Can not load image: %s" % error)
+            return
+
+        if image.isNull():
+            return
+
+        if fileTitle:
+            photo.setFile(fileTitle)
+
+        self._images[key] = (image, full)
+        self._images.move_to_end(key)
+        while len(self._images) > self.CacheSize:
+            self._images.popitem(last=False)
+
+        self.loaded.emit(key, image)
+
+    def _read(self, fileName, url, size):
+        fileTitle = None
+        if not fileName or not os.path.exists(fileName):
+            if not url:
+                return QtGui.QImage(), False, None
+
+            fileTitle, _size = downloadImage(self.workingDir,
+                                             self.collectionName, url)
+
+            # Saved file is decoded to label size as any other
+            fileName = Photo.filePath(self.workingDir, self.collectionName,
+                                      fileTitle)
+
+        # Smaller rendition is read faster when it is enough for label
+        path = PhotoRenditions.bestFile(fileName, size.width(),
+                                        size.height())
+        reader = QtGui.QImageReader(path)
+        imageSize = reader.size()
+        # Only not scaled original is enough for any bigger label
+        full = (path == fileName)
+        if imageSize.width() > size.width() or \
+                imageSize.height() > size.height():
+            # JPEG is decoded directly to smaller size - much faster than
+            # decoding full image and scaling it
+            reader.setScaledSize(imageSize.scaled(size, Qt.KeepAspectRatio))
+            full = False
+
+        image = reader.read()
+        if image.isNull():
+            raise ValueError("%s: %s" % (path, reader.errorString()))
+
+        return image, full, fileTitle
+
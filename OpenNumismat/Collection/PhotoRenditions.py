@@ -0,0 +1,145 @@
+"""Reduced copies of photo files for showing photos in small size.
+
+Renditions are saved next to original file and created in background,
+until they are ready original file is used. Original which isn't larger
+than rendition is used instead of it, so such rendition isn't created.
+"""
+
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5 import QtGui
+from PyQt5.QtCore import Qt
+
+# Maximum side of small and medium renditions
+Sides = (160, 640)
+Workers = 2
+
+_executor = None
+_scheduled = set()
+_lock = threading.Lock()
+
+
+def renditionPath(fileName, side):
+    stem, _ext = os.path.splitext(fileName)
+    return "%s_%d.jpg" % (stem, side)
+
+
+def renditionPaths(fileName):
+    return [renditionPath(fileName, side) for side in Sides]
+
+
+def bestFile(fileName, width, height):
+    """Returns smallest rendition of photo file which isn't less than
+    given size, or original file when it is small enough or there is no
+    such rendition yet"""
+    need = max(width, height)
+    for side in Sides:
+        if side >= need:
+            path = renditionPath(fileName, side)
+            if os.path.exists(path):
+                return path
+
+            if _isLarger(fileName, side):
+                schedule(fileName)
+            break
+
+    return fileName
+
+
+def schedule(fileName):
+    """Creates missed renditions of photo file in background. Can be
+    called from any thread"""
+    global _executor
+
+    with _lock:
+        if fileName in _scheduled:
+            return
+        _scheduled.add(fileName)
+
+        if not _executor:
+            _executor = ThreadPoolExecutor(Workers)
+        _executor.submit(_create, fileName)
+
+
+def remove(fileName):
+    for path in renditionPaths(fileName):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _create(fileName):
+    try:
+        createRenditions(fileName)
+    except Exception as error:
+        print("Can not create renditions of %s: %s" % (fileName, error))
+    finally:
+        with _lock:
+            _scheduled.discard(fileName)
+
+
+def createRenditions(fileName):
+    missed = [side for side in Sides
+              if not os.path.exists(renditionPath(fileName, side))]
+    if not missed:
+        return
+
+    reader = QtGui.QImageReader(fileName)
+    size = reader.size()
+    if not size.isValid():
+        raise ValueError(reader.errorString())
+
+    # Largest rendition is decoded directly to its size and smaller ones
+    # are scaled from it
+    image = None
+    for side in sorted(missed, reverse=True):
+        if max(size.width(), size.height()) <= side:
+            # Small original is used as is
+            continue
+
+        path = renditionPath(fileName, side)
+        if image is None:
+            reader.setScaledSize(size.scaled(side, side, Qt.KeepAspectRatio))
+            image = reader.read()
+            if image.isNull():
+                raise ValueError(reader.errorString())
+        else:
+            image = image.scaled(side, side, Qt.KeepAspectRatio,
+                                 Qt.SmoothTransformation)
+
+        _write(path, lambda tmpName: _saveImage(image, tmpName))
+
+
+def _isLarger(fileName, side):
+    # Only header of file is read
+    size = QtGui.QImageReader(fileName).size()
+    if not size.isValid():
+        # Not readable file is checked by creating renditions
+        return True
+
+    return max(size.width(), size.height()) > side
+
+
+def _saveImage(image, fileName):
+    if not image.save(fileName, 'jpg'):
+        raise OSError("%s: can't save image" % fileName)
+
+
+def _write(path, writer):
+    # Readers never see partially written rendition
+    fd, tmpName = tempfile.mkstemp(suffix='.part',
+                                   dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        writer(tmpName)
+        os.replace(tmpName, path)
+    except:
+        try:
+            os.remove(tmpName)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,219 @@
+import collections
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from PyQt5 import QtCore, QtGui
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtSql import QSqlQuery
+
+from OpenNumismat.Collection.Collection import Photo, createPreview
+from OpenNumismat.Collection import PhotoRenditions
+from OpenNumismat.Collection import Thumbnails
+
+
+class ThumbnailBuilder(QtCore.QObject):
+    """Recreates list previews of all coins from their photo files.
+
+    Previews are decoded and composed by pool of workers and written by
+    batches. Last written coin is stored in settings, so interrupted
+    rebuilding is continued from it.
+    """
+    stepped = pyqtSignal()
+
+    # Count of previews written to collection by one transaction
+    BatchSize = 200
+    # Time in seconds between processing GUI events while waiting
+    EventsInterval = 0.05
+
+    def __init__(self, db, fileName, collectionName, previewHeight,
+                 workers=None, parent=None):
+        super().__init__(parent)
+
+        self.db = db
+        self.fileName = fileName
+        self.workingDir = QtCore.QFileInfo(fileName).absolutePath()
+        self.collectionName = collectionName
+        self.previewHeight = previewHeight
+        self.workers = workers or os.cpu_count() or 1
+
+        self.canceled = False
+        self.finished = False
+        self.builtCount = 0
+        self.failedCount = 0
+        self.elapsed = 0.
+
+        self.startId = self.__savedPosition()
+
+    def isResumed(self):
+        return self.startId > 0
+
+    def stepsCount(self):
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT count(*) FROM coins"
+                      " WHERE id>? AND (photo1 IS NOT NULL"
+                      " OR photo2 IS NOT NULL)")
+        query.addBindValue(self.startId)
+        query.exec_()
+        if query.first():
+            return query.record().value(0)
+
+        return 0
+
+    def cancel(self):
+        self.canceled = True
+
+    def run(self):
+        startTime = time.perf_counter()
+
+        query = QSqlQuery(self.db)
+        query.setForwardOnly(True)
+        query.prepare("SELECT coins.id, coins.image, p1.file, p2.file"
+                      " FROM coins"
+                      " LEFT JOIN photos AS p1 ON p1.id=coins.photo1"
+                      " LEFT JOIN photos AS p2 ON p2.id=coins.photo2"
+                      " WHERE coins.id>? AND (coins.photo1 IS NOT NULL"
+                      " OR coins.photo2 IS NOT NULL) ORDER BY coins.id")
+        query.addBindValue(self.startId)
+        query.exec_()
+
+        # Results are written in coin order, so position of last written
+        # coin is a point of resuming
+        futures = collections.deque()
+        built = []
+        more = True
+        with ThreadPoolExecutor(self.workers) as executor:
+            while not self.canceled:
+                while more and len(futures) < self.workers * 4:
+                    more = query.next()
+                    if not more:
+                        break
+                    record = query.record()
+                    future = executor.submit(self._build, record.value(2),
+                                             record.value(3))
+                    futures.append((record.value(0), record.value(1),
+                                    future))
+
+                if not futures:
+                    self.finished = True
+                    break
+
+                coinId, imageId, future = futures[0]
+                if not future.done():
+                    wait([future], timeout=self.EventsInterval,
+                         return_when=FIRST_COMPLETED)
+                    QtCore.QCoreApplication.processEvents()
+                    continue
+
+                futures.popleft()
+                self.stepped.emit()
+                try:
+                    image = future.result()
+                except Exception as error:
+                    print("Can not create preview: %s" % error)
+                    self.failedCount += 1
+                    image = None
+
+                built.append((coinId, imageId, image))
+                if len(built) >= self.BatchSize:
+                    self.__write(built)
+                    built = []
+
+            for _coinId, _imageId, future in futures:
+                future.cancel()
+
+        query.clear()
+        self.__write(built)
+
+        if self.finished:
+            self.__savePosition(None)
+            Thumbnails.setRebuilt(self.db)
+
+        self.elapsed += time.perf_counter() - startTime
+
+    def statistics(self):
+        rate = self.builtCount / self.elapsed if self.elapsed else 0.
+        return ("%d previews rebuilt, %d failed in %.1fs (%.1f images/s)" %
+                (self.builtCount, self.failedCount, self.elapsed, rate))
+
+    def __write(self, built):
+        if not built:
+            return
+
+        self.db.transaction()
+
+        # Rebuilt preview gets new id, so previews cached by views with
+        # old id aren't shown anymore
+        insertQuery = QSqlQuery(self.db)
+        insertQuery.prepare("INSERT INTO %s (image) VALUES (?)" %
+                            Thumbnails.Table)
+        coinQuery = QSqlQuery(self.db)
+        coinQuery.prepare("UPDATE coins SET image=? WHERE id=?")
+        deleteQuery = QSqlQuery(self.db)
+        deleteQuery.prepare("DELETE FROM %s WHERE id=?" % Thumbnails.Table)
+
+        for coinId, imageId, image in built:
+            if image is None:
+                continue
+
+            insertQuery.bindValue(0, image)
+            insertQuery.exec_()
+            coinQuery.bindValue(0, insertQuery.lastInsertId())
+            coinQuery.bindValue(1, coinId)
+            coinQuery.exec_()
+            if imageId:
+                deleteQuery.bindValue(0, imageId)
+                deleteQuery.exec_()
+
+            self.builtCount += 1
+
+        if not self.db.commit():
+            print(self.db.lastError().text())
+            self.db.rollback()
+            return
+
+        self.__savePosition(built[-1][0])
+
+    def __savedPosition(self):
+        settings = QtCore.QSettings()
+        value = settings.value(self.__settingsKey())
+        if value:
+            return int(value)
+
+        return 0
+
+    def __savePosition(self, coinId):
+        settings = QtCore.QSettings()
+        if coinId:
+            settings.setValue(self.__settingsKey(), coinId)
+        else:
+            settings.remove(self.__settingsKey())
+
+    def __settingsKey(self):
+        return Thumbnails.rebuildKey(self.fileName)
+
+    def _build(self, obverseFile, reverseFile):
+        obverseImage = self.__readImage(obverseFile)
+        reverseImage = self.__readImage(reverseFile)
+        if obverseImage.isNull() and reverseImage.isNull():
+            return None
+
+        return createPreview(obverseImage, reverseImage, self.previewHeight)
+
+    def __readImage(self, fileTitle):
+        if not fileTitle:
+            return QtGui.QImage()
+
+        fileName = Photo.filePath(self.workingDir, self.collectionName,
+                                  fileTitle)
+        side = self.previewHeight * 2
+        reader = QtGui.QImageReader(PhotoRenditions.bestFile(fileName,
+                                                             side, side))
+        size = reader.size()
+        if size.isValid() and size.height() > self.previewHeight:
+            # Image is decoded directly to preview height
+            reader.setScaledSize(size.scaled(size.width(),
+                                             self.previewHeight,
+                                             Qt.KeepAspectRatio))
+
+        return reader.read()
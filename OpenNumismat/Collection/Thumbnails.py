@@ -0,0 +1,173 @@
+"""Preview images of list are kept in own database file next to
+collection, attached to collection connection. So collection file stays
+small and previews can be recreated any time.
+
+Coins refer previews by id, so both files keep the same link token,
+which is written when previews file is created for collection. Previews
+file which was lost or belongs to other collection has other token - then
+previews are rebuilt from photo files. Coins without photo files keep
+their previews.
+"""
+
+import os
+import uuid
+
+from PyQt5 import QtCore
+from PyQt5.QtSql import QSqlQuery
+
+Schema = 'thumbs'
+Table = Schema + '.previews'
+LinkTable = Schema + '.link'
+CollectionLinkTable = 'previews_link'
+Format = 'jpg'
+Quality = 85
+
+
+def fileName(collectionFileName):
+    stem, _ext = os.path.splitext(collectionFileName)
+    return stem + '_thumbnails.db'
+
+
+def isAttached(db):
+    query = QSqlQuery("PRAGMA database_list", db)
+    while query.next():
+        if query.record().value('name') == Schema:
+            return True
+
+    return False
+
+
+def attach(db, collectionFileName):
+    if isAttached(db):
+        return True
+
+    query = QSqlQuery(db)
+    query.prepare("ATTACH DATABASE ? AS %s" % Schema)
+    query.addBindValue(fileName(collectionFileName))
+    if not query.exec_():
+        print(query.lastError().text())
+        return False
+
+    sql = """CREATE TABLE IF NOT EXISTS %s (
+            id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+            image BLOB)""" % Table
+    QSqlQuery(sql, db)
+    QSqlQuery("CREATE TABLE IF NOT EXISTS %s (token TEXT, rebuild INTEGER)" %
+              LinkTable, db)
+    QSqlQuery("CREATE TABLE IF NOT EXISTS %s (token TEXT)" %
+              CollectionLinkTable, db)
+
+    _moveFromCollection(db)
+
+    token = _token(db, CollectionLinkTable)
+    previewsToken = _token(db, LinkTable)
+    if token and token == previewsToken:
+        return True
+
+    if token and previewsToken:
+        linked = False
+    else:
+        # Previews file is new or collection is of older version - they
+        # match while all coins refer existing previews
+        linked = not _hasMissedPreviews(db)
+
+    if not linked:
+        # Rebuilding starts from the first coin
+        QtCore.QSettings().remove(rebuildKey(collectionFileName))
+    _link(db, token or previewsToken or uuid.uuid4().hex, not linked)
+
+    return True
+
+
+def needsRebuild(db):
+    """Returns True when previews didn't match collection on attaching and
+    weren't rebuilt yet"""
+    query = QSqlQuery("SELECT rebuild FROM %s" % LinkTable, db)
+    if query.first():
+        return bool(query.record().value(0))
+
+    return False
+
+
+def setRebuilt(db):
+    QSqlQuery("UPDATE %s SET rebuild=0" % LinkTable, db)
+
+
+def rebuildKey(collectionFileName):
+    """Settings key of position of interrupted rebuilding"""
+    fileName = QtCore.QFileInfo(collectionFileName).absoluteFilePath()
+    return 'thumbnails/%s' % fileName.replace('/', '|')
+
+
+def encode(image):
+    ba = QtCore.QByteArray()
+    buffer = QtCore.QBuffer(ba)
+    buffer.open(QtCore.QIODevice.WriteOnly)
+    image.save(buffer, Format, Quality)
+
+    return ba
+
+
+def _token(db, table):
+    query = QSqlQuery("SELECT token FROM %s" % table, db)
+    if query.first():
+        return query.record().value(0)
+
+    return None
+
+
+def _hasMissedPreviews(db):
+    query = QSqlQuery("SELECT 1 FROM coins WHERE image IS NOT NULL"
+                      " AND image NOT IN (SELECT id FROM %s) LIMIT 1" %
+                      Table, db)
+    return query.first()
+
+
+def _link(db, token, rebuild):
+    db.transaction()
+
+    for table in (CollectionLinkTable, LinkTable):
+        query = QSqlQuery(db)
+        query.prepare("UPDATE %s SET token=?" % table)
+        query.addBindValue(token)
+        query.exec_()
+        if not query.numRowsAffected():
+            query = QSqlQuery(db)
+            query.prepare("INSERT INTO %s (token) VALUES (?)" % table)
+            query.addBindValue(token)
+            query.exec_()
+
+    if rebuild:
+        # Previews are replaced only for coins with photo files, so
+        # previews of other coins are kept
+        QSqlQuery("UPDATE %s SET rebuild=EXISTS (SELECT 1 FROM coins"
+                  " INNER JOIN photos ON photos.id=coins.photo1"
+                  " OR photos.id=coins.photo2"
+                  " WHERE photos.file IS NOT NULL)" % LinkTable, db)
+
+    if not db.commit():
+        print(db.lastError().text())
+        db.rollback()
+
+
+def _moveFromCollection(db):
+    # Previews of older collections are stored in images table of
+    # collection - they are moved with the same ids
+    if 'images' not in db.tables():
+        return
+
+    query = QSqlQuery("SELECT 1 FROM images"
+                      " WHERE id IN (SELECT image FROM coins) LIMIT 1", db)
+    if not query.first():
+        return
+
+    db.transaction()
+
+    QSqlQuery("INSERT OR REPLACE INTO %s (id, image)"
+              " SELECT id, image FROM images"
+              " WHERE id IN (SELECT image FROM coins)" % Table, db)
+    QSqlQuery("DELETE FROM images WHERE id IN (SELECT image FROM coins)", db)
+
+    if not db.commit():
+        print(db.lastError().text())
+        db.rollback()
@@ -0,0 +1,127 @@
+import time
+
+from PyQt5 import QtCore
+from PyQt5.QtSql import QSqlQuery
+
+
+class WatchList(QtCore.QObject):
+    """Lots which trading wasn't finished while importing auction"""
+    # Delay in seconds before first check of lot with unknown closing time
+    FirstDelay = 60 * 60
+    # Delay after known closing time, while results are published
+    CloseDelay = 10 * 60
+    # Delay between checks is doubled till this value
+    MaxDelay = 24 * 60 * 60
+    # Lot is removed from list after this count of checks
+    MaxPolls = 14
+
+    Columns = ('id', 'place', 'number', 'category', 'page', 'lot', 'url',
+               'close_at', 'poll_at', 'polls')
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+
+        self.db = db
+
+        if 'watch_lots' not in self.db.tables():
+            self.create(self.db)
+
+    def add(self, place, number, category, page, lot, url, closeTime=None):
+        if closeTime:
+            pollTime = closeTime + self.CloseDelay
+        else:
+            pollTime = time.time() + self.FirstDelay
+
+        query = QSqlQuery(self.db)
+        query.prepare("INSERT OR IGNORE INTO watch_lots (place, number,"
+                      " category, page, lot, url, close_at, poll_at)"
+                      " VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+        for value in (place, number, category, page, str(lot), url,
+                      closeTime, pollTime):
+            query.addBindValue(value)
+        query.exec_()
+
+    def duePlaces(self):
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT DISTINCT place FROM watch_lots WHERE poll_at<=?")
+        query.addBindValue(time.time())
+        query.exec_()
+
+        places = []
+        while query.next():
+            places.append(query.record().value(0))
+
+        return places
+
+    def due(self, place):
+        query = QSqlQuery(self.db)
+        query.prepare("SELECT %s FROM watch_lots WHERE place=? AND poll_at<=?"
+                      " ORDER BY number, category, page" %
+                      ', '.join(self.Columns))
+        query.addBindValue(place)
+        query.addBindValue(time.time())
+        query.exec_()
+
+        lots = []
+        while query.next():
+            record = query.record()
+            lots.append({column: record.value(i)
+                         for i, column in enumerate(self.Columns)})
+
+        return lots
+
+    def postpone(self, lot, closeTime=None):
+        polls = lot['polls'] + 1
+        if polls >= self.MaxPolls:
+            print("Lot %s not finished after %d checks" % (lot['url'], polls))
+            self.remove(lot)
+            return
+
+        if closeTime and closeTime + self.CloseDelay > time.time():
+            pollTime = closeTime + self.CloseDelay
+        else:
+            # Lot isn't closed at shown time, so it isn't polled on every
+            # check of watch list
+            delay = min(self.FirstDelay * (2 ** polls), self.MaxDelay)
+            pollTime = time.time() + delay
+
+        query = QSqlQuery(self.db)
+        query.prepare("UPDATE watch_lots SET close_at=?, poll_at=?, polls=?"
+                      " WHERE id=?")
+        query.addBindValue(closeTime)
+        query.addBindValue(pollTime)
+        query.addBindValue(polls)
+        query.addBindValue(lot['id'])
+        query.exec_()
+
+    def remove(self, lot):
+        query = QSqlQuery(self.db)
+        query.prepare("DELETE FROM watch_lots WHERE id=?")
+        query.addBindValue(lot['id'])
+        query.exec_()
+
+    def count(self):
+        query = QSqlQuery("SELECT count(*) FROM watch_lots", self.db)
+        if query.first():
+            return query.record().value(0)
+
+        return 0
+
+    @staticmethod
+    def create(db):
+        sql = """CREATE TABLE IF NOT EXISTS watch_lots (
+                id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+                place TEXT,
+                number INTEGER,
+                category INTEGER,
+                page INTEGER,
+                lot TEXT,
+                url TEXT UNIQUE,
+                close_at REAL,
+                poll_at REAL,
+                polls INTEGER NOT NULL DEFAULT 0)"""
+        QSqlQuery(sql, db)
+
+        sql = """CREATE INDEX IF NOT EXISTS watch_lots_poll_at
+                ON watch_lots (poll_at)"""
+        QSqlQuery(sql, db)
@@ -217,10 +217,13 @@ class ImageEdit(ImageLabel):
 
     def loadFromFile(self, fileName):
         if fileName:
-            image = QtGui.QImage()
-            result = image.load(fileName)
-            if result:
-                self._setNewImage(image)
+            try:
+                with open(fileName, 'rb') as file:
+                    data = file.read()
+            except OSError:
+                return
+
+            self._setNewData(data)
 
     def loadFromUrl(self, url):
         result = False
@@ -231,10 +234,7 @@ class ImageEdit(ImageLabel):
             req = urllib.request.Request(url,
                                     headers={'User-Agent': version.AppName})
             data = urllib.request.urlopen(req).read()
-            image = QtGui.QImage()
-            result = image.loadFromData(data)
-            if result:
-                self._setNewImage(image)
+            result = self._setNewData(data)
         except:
             pass
 
@@ -244,11 +244,31 @@ class ImageEdit(ImageLabel):
         if not self._photo:
             return None
 
-        if self.image:
+        if self._data:
+            from OpenNumismat.Collection.Collection import imageFormat
+            self._photo.setData(self._data, imageFormat(self._data))
+        elif self.image:
             self._photo.image = self.image
 
         return self._photo
 
+    def _setNewData(self, data):
+        from OpenNumismat.Collection.Collection import imageFormat
+
+        image = QtGui.QImage()
+        if not image.loadFromData(data):
+            return False
+
+        if imageFormat(data) and not image.hasAlphaChannel():
+            # Original file is saved as is, without re-encoding
+            self._setImage(image)
+            self._data = data
+            self._photo.changed = True
+        else:
+            self._setNewImage(image)
+
+        return True
+
     def _setNewImage(self, image):
         # Fill transparent color if present
         fixedImage = QtGui.QImage(image.size(), QtGui.QImage.Format_RGB32)
@@ -258,4 +278,5 @@ class ImageEdit(ImageLabel):
         painter.end()
 
         self._setImage(fixedImage)
+        self._data = None
         self._photo.changed = True
@@ -5,6 +5,8 @@ from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import *
 
 from OpenNumismat.Auctions.AuctionParser import AuctionSpbParser, ConrosParser
+from OpenNumismat.Auctions.Fetcher import workersCount, setWorkersCount
+from OpenNumismat.Collection.ImportProgress import ImportProgress
 
 class ImportDialog(QDialog):
     params = {}
@@ -54,6 +56,15 @@ class ImportDialog(QDialog):
         self.downloadImages = QCheckBox(self.tr("Download images"), self)
         form.addRow(self.downloadImages)
 
+        self.updateExisting = QCheckBox(
+                        self.tr("Update prices of already imported lots"), self)
+        form.addRow(self.updateExisting)
+
+        self.workers = QSpinBox(self)
+        self.workers.setMinimum(1)
+        self.workers.setMaximum(32)
+        form.addRow(self.tr("Parallel downloads"), self.workers)
+
         buttonBox = QDialogButtonBox(Qt.Horizontal)
         buttonBox.addButton(QDialogButtonBox.Ok)
         buttonBox.addButton(QDialogButtonBox.Cancel)
@@ -85,43 +96,52 @@ class ImportDialog(QDialog):
         self.params['till_num'] = self.tillNum.value()
         self.params['category'] = self.categorySelector.currentIndex() + 1
         self.params['auction'] = self.auctionSelector.currentText()
+        self.params['workers'] = self.workers.value()
+        self.params['update_existing'] = self.updateExisting.isChecked()
 
         if self.params['till_num'] < self.params['from_num']:
             QMessageBox.critical(self, self.tr("Import"),
                 self.tr("Auction number From should be less or equal to Till"))
             return
 
-        lastNum = self.__getMaxNum()
-        if self.params['from_num'] <= lastNum:
-            result = QMessageBox.question(self, self.tr("Import"),
-                self.tr("Auction number %d already imported.\nContinue anyway?") % self.params['from_num'],
-                QMessageBox.Yes | QMessageBox.Cancel,
-                QMessageBox.Cancel)
-            if result == QMessageBox.Cancel:
-                return
+        setWorkersCount(self.__parserClass(), self.params['workers'])
 
         self.accept()
 
     def __updateNum(self):
         lastNum = self.__getMaxNum()
-        self.fromNum.setValue(lastNum + 1)
         self.tillNum.setValue(lastNum + 1)
+        # Propose to continue interrupted import
+        unfinished = self.__getUnfinished()
+        if unfinished:
+            self.fromNum.setValue(unfinished[0])
+        else:
+            self.fromNum.setValue(lastNum + 1)
+
+    def __parserClass(self):
+        auc_name = self.auctionSelector.currentText()
+        if auc_name == 'АукционЪ.СПб':
+            return AuctionSpbParser
+        elif auc_name == 'Конрос':
+            return ConrosParser
 
     def __updateAuc(self):
         self.categorySelector.clear()
-        auc_name = self.auctionSelector.currentText()
+        parserClass = self.__parserClass()
         categories = []
-        if auc_name == 'АукционЪ.СПб':
-            categories = AuctionSpbParser.categories()
-        elif auc_name == 'Конрос':
-            categories = ConrosParser.categories()
+        if parserClass:
+            categories = parserClass.categories()
+            self.workers.setValue(workersCount(parserClass))
 
         for cat in categories:
             self.categorySelector.addItem(cat)
 
-        lastNum = self.__getMaxNum()
-        self.fromNum.setValue(lastNum + 1)
-        self.tillNum.setValue(lastNum + 1)
+        self.__updateNum()
+
+    def __getUnfinished(self):
+        return ImportProgress.unfinished(self.db,
+                                         self.auctionSelector.currentText(),
+                                         self.categorySelector.currentText())
 
     def __getMaxNum(self):
         query = QtSql.QSqlQuery(self.db)
@@ -1,3 +1,4 @@
+import collections
 import operator
 import pickle
 import os.path
@@ -17,6 +18,7 @@ from OpenNumismat.Reports.Report import Report
 from OpenNumismat.Settings import Settings
 from OpenNumismat.Reports.ExportList import ExportToExcel, ExportToHtml, ExportToCsv, ExportToCsvUtf8
 from OpenNumismat.Tools.Gui import createIcon
+from OpenNumismat.Tools.CursorDecorators import waitCursorDecorator
 from OpenNumismat.Collection.Collection import Photo
 
 
@@ -36,24 +38,122 @@ def clipboardToText(text):
     return text
 
 
+class PixmapCache:
+    """LRU of scaled pixmaps ready for drawing, keyed by
+    (image id, width, height) and bounded by memory size"""
+    # Maximum size of cached pixmaps in bytes
+    MaxCost = 32 * 1024 * 1024
+
+    def __init__(self, maxCost=MaxCost):
+        self.maxCost = maxCost
+        self.cost = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._pixmaps = collections.OrderedDict()
+
+    def get(self, key):
+        pixmap = self._pixmaps.get(key)
+        if pixmap is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._pixmaps.move_to_end(key)
+
+        return pixmap
+
+    def put(self, key, pixmap):
+        if key in self._pixmaps:
+            self.cost -= self._cost(self._pixmaps.pop(key))
+
+        self._pixmaps[key] = pixmap
+        self.cost += self._cost(pixmap)
+
+        while self.cost > self.maxCost and len(self._pixmaps) > 1:
+            _key, oldPixmap = self._pixmaps.popitem(last=False)
+            self.cost -= self._cost(oldPixmap)
+
+    def invalidate(self, imageId):
+        # Pixmaps of all sizes of changed image
+        for key in [key for key in self._pixmaps if key[0] == imageId]:
+            self.cost -= self._cost(self._pixmaps.pop(key))
+
+    def clear(self):
+        self._pixmaps.clear()
+        self.cost = 0
+
+    def hitRate(self):
+        requests = self.hits + self.misses
+        if requests:
+            return self.hits / requests
+
+        return 0.
+
+    def __str__(self):
+        return ("%d pixmaps (%d KB), %d hits, %d misses, hit rate %.0f%%" %
+                (len(self._pixmaps), self.cost // 1024, self.hits,
+                 self.misses, self.hitRate() * 100))
+
+    @staticmethod
+    def _cost(pixmap):
+        return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+
 class ImageDelegate(QStyledItemDelegate):
-    def __init__(self, parent):
+    def __init__(self, parent, cached=True):
         QStyledItemDelegate.__init__(self, parent)
 
+        # Only preview images have own id, photos are painted directly
+        self.cache = PixmapCache() if cached else None
+
+    def setModel(self, model):
+        if self.cache:
+            self.cache.clear()
+        model.imageChanged.connect(self.imageChanged)
+
+    def imageChanged(self, imageId):
+        if self.cache:
+            self.cache.invalidate(imageId)
+
     def paint(self, painter, option, index):
+        rect = option.rect
+
+        key = None
+        pixmap = None
+        if self.cache:
+            imageId = index.data(Qt.UserRole)
+            if not imageId:
+                return
+
+            key = (imageId, rect.width(), rect.height())
+            pixmap = self.cache.get(key)
+
+        if pixmap is None:
+            pixmap = self._createPixmap(index, rect)
+            if pixmap is None:
+                return
+
+            if key:
+                self.cache.put(key, pixmap)
+
+        if not pixmap.isNull():
+            # Set rect at center of item
+            rect.translate((rect.width() - pixmap.width()) / 2,
+                           (rect.height() - pixmap.height()) / 2)
+            rect.setSize(pixmap.size())
+            painter.drawPixmap(rect, pixmap)
+
+    @staticmethod
+    def _createPixmap(index, rect):
         data = index.data()
         if data and not data.isNull():
             image = QImage()
             image.loadFromData(data)
-            rect = option.rect
             scaledImage = image.scaled(rect.width(), rect.height(),
                                 Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            pixmap = QPixmap.fromImage(scaledImage)
-            # Set rect at center of item
-            rect.translate((rect.width() - pixmap.width()) / 2,
-                           (rect.height() - pixmap.height()) / 2)
-            rect.setSize(pixmap.size())
-            painter.drawPixmap(rect, pixmap)
+            return QPixmap.fromImage(scaledImage)
+
+        return None
 
 
 class SortFilterProxyModel(QSortFilterProxyModel):
@@ -99,6 +199,8 @@ class ListView(QTableView):
         super(ListView, self).__init__(parent)
 
         self.listParam = listParam
+        # Header filters replaced by found same coins
+        self.storedFilters = None
 
         self.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.setSelectionMode(QAbstractItemView.ExtendedSelection)
@@ -132,9 +234,15 @@ class ListView(QTableView):
         self.listSelectedLabel = QLabel(self.tr("0 coin(s) selected"))
 
         # Show image data as images
+        self.imageDelegates = []
+        self.imageColumns = []
         for field in listParam.fields:
             if field.type in Type.ImageTypes:
-                self.setItemDelegateForColumn(field.id, ImageDelegate(self))
+                delegate = ImageDelegate(self, field.type == Type.Image)
+                self.setItemDelegateForColumn(field.id, delegate)
+                self.imageDelegates.append(delegate)
+            if field.type == Type.Image:
+                self.imageColumns.append(field.id)
 
         self.selectedRowId = None
 
@@ -209,12 +317,41 @@ class ListView(QTableView):
             return None
         return self.proxyModel.sourceModel()
 
+    def paintEvent(self, event):
+        self._prefetchImages()
+
+        super(ListView, self).paintEvent(event)
+
+    def _prefetchImages(self):
+        # Preview images of visible rows and one screen above and below
+        # are read by one query before painting
+        if not self.model():
+            return
+        if all(self.isColumnHidden(column) for column in self.imageColumns):
+            return
+
+        first = self.rowAt(0)
+        if first < 0:
+            return
+        last = self.rowAt(self.viewport().height() - 1)
+        if last < 0:
+            last = self.proxyModel.rowCount() - 1
+
+        count = last - first + 1
+        first = max(0, first - count)
+        last = min(self.proxyModel.rowCount() - 1, last + count)
+
+        rows = [self.proxyModel.mapToSource(self.proxyModel.index(row, 0)).row()
+                for row in range(first, last + 1)]
+        self.model().prefetchImages(rows)
+
     def rowInserted(self, index):
         insertedRowIndex = self.proxyModel.mapFromSource(index)
         self.selectRow(insertedRowIndex.row())
         self.scrollTo(insertedRowIndex)
 
     def clearAllFilters(self):
+        self.storedFilters = None
         for btn in self.headerButtons:
             btn.clear()
 
@@ -222,8 +359,25 @@ class ListView(QTableView):
         self.listParam.save()
         self.model().setFilter('')
 
+    def restoreFilters(self):
+        if self.storedFilters is None:
+            return
+
+        self.listParam.filters.clear()
+        self.listParam.filters.update(self.storedFilters)
+        self.storedFilters = None
+        self.listParam.save()
+        for btn in self.headerButtons:
+            btn.updateIcon()
+
+        filtersSql = FilterMenuButton.filtersToSql(
+                                            self.listParam.filters.values())
+        self.model().setFilter(filtersSql)
+
     def setModel(self, model):
         model.rowInserted.connect(self.rowInserted)
+        for delegate in self.imageDelegates:
+            delegate.setModel(model)
 
         self.proxyModel = SortFilterProxyModel(self)
         self.proxyModel.setSourceModel(model)
@@ -374,6 +528,12 @@ class ListView(QTableView):
         act = menu.addAction(self.tr("Multi edit..."), self._multiEdit)
         # Disable Multi edit when only one record selected
         act.setEnabled(len(self.selectedRows()) > 1)
+        act = menu.addAction(self.tr("Find same coin"), self._findSame)
+        # Search by photos of one coin
+        act.setEnabled(len(self.selectedRows()) == 1 and
+                       bool(self.model().photoHashes))
+        act = menu.addAction(self.tr("Restore filters"), self.restoreFilters)
+        act.setEnabled(self.storedFilters is not None)
         menu.addSeparator()
 
         style = QApplication.style()
@@ -649,45 +809,46 @@ class ListView(QTableView):
                             self.tr("Inserting records"),
                             self.tr("Cancel"), len(pickleData), self)
 
-                for progress, recordData in enumerate(pickleData):
-                    progressDlg.setValue(progress)
-                    if progressDlg.wasCanceled():
-                        break
-
-                    record = self.model().record()
-                    for i in range(self.model().columnCount()):
-                        if isinstance(recordData[i], bytes):
-                            # Note: Qt::QVariant convert Python bytes type to
-                            # str type
-                            record.setValue(i, QtCore.QByteArray(recordData[i]))
-                        else:
-                            if i in [33, 34, 35, 36]:
-                                photo = Photo(None, self.model())
-                                photo.workingDir = recordData[i + (i - 33) * 3 + 2]
-                                photo.collectionName = recordData[i + (i - 33) * 3 + 3]
-                                photo.file = recordData[i + (i - 33) * 3]
-                                photo.image.load(photo.fileName())
-                                photo.url = recordData[i + (i - 33) * 3 + 1]
-                                photo.workingDir = self.model().workingDir
-                                photo.collectionName = self.model().collectionName
-                                photo.save()
-                                record.setValue(i, photo)
-                            elif i in [37, 38]:
-                                record.setValue(i, recordData[i + 12])
-                            else:
-                                record.setValue(i, recordData[i])
-
-                    for i in range(4):
-                        field = "photo%d" % (i + 1)
-                        photo = record.value(field)
-                        if not photo.isNull():
-                            photo.changed = True
-                        photo.file = None
-
-                    self.model().appendRecordQuiet(record)
+                self.model().appendRecords(
+                            self.__pastedRecords(pickleData, progressDlg))
 
                 progressDlg.reset()
 
+    def __pastedRecords(self, pickleData, progressDlg):
+        model = self.model()
+        for progress, recordData in enumerate(pickleData):
+            progressDlg.setValue(progress)
+            if progressDlg.wasCanceled():
+                break
+
+            record = {}
+            for i in range(model.columnCount()):
+                field = model.fields.field(i).name
+                if isinstance(recordData[i], bytes):
+                    # Note: Qt::QVariant convert Python bytes type to
+                    # str type
+                    record[field] = QtCore.QByteArray(recordData[i])
+                elif i in [33, 34, 35, 36]:
+                    photo = Photo(None, model)
+                    photo.workingDir = recordData[i + (i - 33) * 3 + 2]
+                    photo.collectionName = recordData[i + (i - 33) * 3 + 3]
+                    photo.file = recordData[i + (i - 33) * 3]
+                    photo.loadFile(photo.fileName())
+                    photo.url = recordData[i + (i - 33) * 3 + 1]
+                    photo.workingDir = model.workingDir
+                    photo.collectionName = model.collectionName
+                    # Saved as new photo to current collection
+                    photo.file = None
+                    photo.changed = True
+                    record[field] = photo
+                elif i in [37, 38]:
+                    # Created and updated time are set for new record
+                    continue
+                else:
+                    record[field] = recordData[i]
+
+            yield record
+
     def _delete(self, indexes=None):
         if not indexes:
             indexes = self.selectedRows()
@@ -714,6 +875,35 @@ class ListView(QTableView):
 
             progressDlg.reset()
 
+    @waitCursorDecorator
+    def __findSameCoins(self, coinId):
+        return self.model().photoHashes.findSameCoins(coinId)
+
+    def _findSame(self, index=None):
+        if not index:
+            index = self.currentIndex()
+
+        id_col = self.model().fieldIndex('id')
+        id_index = self.model().index(index.row(), id_col)
+        coinId = self.model().dataDisplayRole(id_index)
+
+        coins = self.__findSameCoins(coinId)
+        if not coins:
+            QMessageBox.information(self, self.tr("Find same coin"),
+                                    self.tr("Same coins not found"))
+            return
+
+        # Found coins are shown instead of header filters, which are
+        # stored for Restore filters
+        if self.storedFilters is None:
+            self.storedFilters = self.listParam.filters.copy()
+        self.listParam.filters.clear()
+        for btn in self.headerButtons:
+            btn.clear()
+
+        ids = [coinId] + [otherId for otherId, _distance in coins]
+        self.model().setFilter("id IN (%s)" % ','.join(map(str, ids)))
+
     def _clone(self, index=None):
         if not index:
             index = self.currentIndex()
@@ -7,6 +7,7 @@ from PyQt5 import QtGui, QtCore
 from PyQt5.QtWidgets import *
 
 from OpenNumismat.Collection.Collection import Collection
+from OpenNumismat.Collection import Thumbnails
 from OpenNumismat.Collection.Description import DescriptionDialog
 from OpenNumismat.Collection.Password import PasswordSetDialog
 from OpenNumismat.Reference.Reference import Reference
@@ -20,10 +21,13 @@ from OpenNumismat import version
 from OpenNumismat.Tools import Gui
 from OpenNumismat.ImportDialog import ImportDialog
 
-from OpenNumismat.Auctions.AuctionParser import AuctionSpbParser, ConrosParser
+from OpenNumismat.Auctions.Importer import AuctionImporter, WatchedLotsImporter
 
 
 class MainWindow(QMainWindow):
+    # Interval of checking watched auction lots in milliseconds
+    WatchInterval = 15 * 60 * 1000
+
     def __init__(self):
         QMainWindow.__init__(self)
 
@@ -41,6 +45,9 @@ class MainWindow(QMainWindow):
         uploadImagesAct = QAction(self.tr("Upload images"), self)
         uploadImagesAct.triggered.connect(self.uploadImagesEvent)
 
+        rebuildThumbnailsAct = QAction(self.tr("Rebuild thumbnails"), self)
+        rebuildThumbnailsAct.triggered.connect(self.rebuildThumbnailsEvent)
+
         cancelFilteringAct = QAction(createIcon('funnel.png'),
                                     self.tr("Clear all filters"), self)
         cancelFilteringAct.triggered.connect(self.cancelFilteringEvent)
@@ -64,6 +71,9 @@ class MainWindow(QMainWindow):
                                     self.tr("Vacuum"), self)
         vacuumCollectionAct.triggered.connect(self.vacuumCollectionEvent)
 
+        cleanupImagesAct = QAction(self.tr("Clean up images..."), self)
+        cleanupImagesAct.triggered.connect(self.cleanupImagesEvent)
+
         descriptionCollectionAct = QAction(self.tr("Description"), self)
         descriptionCollectionAct.triggered.connect(
                                             self.descriptionCollectionEvent)
@@ -84,11 +94,13 @@ class MainWindow(QMainWindow):
         file.addSeparator()
         file.addAction(backupCollectionAct)
         file.addAction(vacuumCollectionAct)
+        file.addAction(cleanupImagesAct)
         file.addAction(passwordCollectionAct)
         file.addAction(descriptionCollectionAct)
         file.addSeparator()
         file.addAction(importAct)
         file.addAction(uploadImagesAct)
+        file.addAction(rebuildThumbnailsAct)
         file.addSeparator()
         file.addAction(settingsAct)
         file.addSeparator()
@@ -191,11 +203,19 @@ class MainWindow(QMainWindow):
             latest = LatestCollections(self)
             fileName = latest.latest()
 
+        self.watchImporter = None
         self.collection = Collection(self.reference, self)
         self.openCollection(fileName)
 
         self.setCentralWidget(self.viewTab)
 
+        # Unfinished lots of imported auctions are imported when their
+        # trading is finished
+        self.watchTimer = QtCore.QTimer(self)
+        self.watchTimer.setInterval(self.WatchInterval)
+        self.watchTimer.timeout.connect(self.watchLotsEvent)
+        self.watchTimer.start()
+
         settings = QtCore.QSettings()
         pageIndex = settings.value('tabwindow/page')
         if pageIndex != None:
@@ -310,6 +330,7 @@ class MainWindow(QMainWindow):
                 self.tr("Collections (*.db)"))
         if fileName:
             self.__saveParams()
+            self.__stopWatching()
 
             if self.collection.create(fileName):
                 self.setCollection(self.collection)
@@ -328,8 +349,57 @@ class MainWindow(QMainWindow):
     def vacuumCollectionEvent(self, checked):
         self.collection.vacuum()
 
+    def cleanupImagesEvent(self, checked):
+        from OpenNumismat.Collection.GarbageCollector import GarbageCollector
+
+        collector = GarbageCollector(self.collection.db,
+                                     self.collection.getFileName(),
+                                     self.collection.getCollectionName(),
+                                     self)
+        try:
+            # Count of files is unknown until scanning is done
+            progressDlg = Gui.ProgressDialog(self.tr("Scanning images"),
+                                             self.tr("Cancel"), 0, self)
+            collector.stepped.connect(progressDlg.step)
+            progressDlg.canceled.connect(collector.cancel)
+
+            collector.scan()
+
+            progressDlg.reset()
+            collector.stepped.disconnect(progressDlg.step)
+
+            if collector.canceled:
+                return
+
+            if collector.isEmpty():
+                QMessageBox.information(self, self.tr("Clean up images"),
+                                        self.tr("No unused images found"))
+                return
+
+            result = QMessageBox.question(self, self.tr("Clean up images"),
+                        collector.report() + "\n\n" +
+                        self.tr("Remove them?"),
+                        QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if result != QMessageBox.Yes:
+                return
+
+            progressDlg = Gui.ProgressDialog(self.tr("Removing images"),
+                                             self.tr("Cancel"),
+                                             collector.stepsCount(), self)
+            collector.stepped.connect(progressDlg.step)
+            progressDlg.canceled.connect(collector.cancel)
+
+            collector.collect()
+
+            progressDlg.reset()
+        finally:
+            collector.close()
+
+        self.statusBar().showMessage(collector.statistics())
+
     def openCollection(self, fileName):
         self.__saveParams()
+        self.__stopWatching()
 
         if self.collection.open(fileName):
             self.setCollection(self.collection)
@@ -349,17 +419,26 @@ class MainWindow(QMainWindow):
         latest.add(collection.getFileName())
         self.__updateLatest()
 
+        # Models of collection write imported lots to its image queue
+        collection.startImageQueue()
+        collection.startPhotoHashes()
+
         self.viewTab.setCollection(collection)
 
         self.referenceMenu.clear()
         for action in self.collection.referenceMenu(self):
             self.referenceMenu.addAction(action)
 
+        # Previews which didn't match collection were cleared on opening
+        if Thumbnails.needsRebuild(collection.db):
+            QtCore.QTimer.singleShot(0, self.rebuildThumbnailsEvent)
+
     def closeEvent(self, e):
         self.__shutDown()
 
     def __shutDown(self):
         self.__saveParams()
+        self.__stopWatching()
 
         settings = QtCore.QSettings()
 
@@ -450,132 +529,122 @@ class MainWindow(QMainWindow):
 
         return newVersion
 
+    @waitCursorDecorator
+    def __missedImages(self, uploader):
+        return uploader.stepsCount()
+
     def uploadImagesEvent(self):
-        from PyQt5 import QtSql
-        from OpenNumismat.Collection.Collection import Photo
+        from OpenNumismat.Collection.ImageUploader import ImageUploader
 
-        model = self.collection.model()
+        uploader = ImageUploader(self.collection.db,
+                    QtCore.QFileInfo(self.collection.fileName).absolutePath(),
+                    self.collection.getCollectionName(), parent=self)
 
-        query = QtSql.QSqlQuery(self.collection.db)
-        query.prepare("SELECT count(*) FROM photos WHERE ifnull(url,'')<>''")
-        query.exec_()
-        if query.first():
-            count = query.record().value(0)
+        count = self.__missedImages(uploader)
+        if count:
             progressDlg = Gui.ProgressDialog(self.tr("Uploading images"),
                                 self.tr("Cancel"), count, self)
+            uploader.stepped.connect(progressDlg.step)
+            progressDlg.canceled.connect(uploader.cancel)
+
+            uploader.run()
+
+            progressDlg.reset()
 
-            query = QtSql.QSqlQuery(self.collection.db)
-            query.prepare("SELECT id FROM photos WHERE ifnull(url,'')<>''")
-            query.exec_()
+        self.statusBar().showMessage(uploader.statistics())
 
-            while query.next():
-                progressDlg.step()
-                if progressDlg.wasCanceled():
-                    break
+    def rebuildThumbnailsEvent(self):
+        from OpenNumismat.Collection.ThumbnailBuilder import ThumbnailBuilder
 
-                photo = Photo(query.record().value('id'), model)
-                photo.uploadMissedImage()
+        model = self.collection.model()
+        builder = ThumbnailBuilder(self.collection.db,
+                    self.collection.getFileName(),
+                    self.collection.getCollectionName(),
+                    model.previewHeight(), parent=self)
+
+        count = builder.stepsCount()
+        if count:
+            if builder.isResumed():
+                title = self.tr("Continue rebuilding thumbnails")
+            else:
+                title = self.tr("Rebuilding thumbnails")
+            progressDlg = Gui.ProgressDialog(title, self.tr("Cancel"),
+                                             count, self)
+            builder.stepped.connect(progressDlg.step)
+            progressDlg.canceled.connect(builder.cancel)
+
+            builder.run()
 
             progressDlg.reset()
-            query.clear()
+
+            model.select()
+
+        self.statusBar().showMessage(builder.statistics())
+
+    def watchLotsEvent(self):
+        settings = Settings()
+        if not settings['watch_lots'] or not self.collection.fileName:
+            return
+
+        # Previous check is still reading pages
+        if self.watchImporter:
+            return
+
+        # Pages are read by worker threads, lots are written when their
+        # page is ready
+        importer = WatchedLotsImporter(self.collection.model(),
+                                       settings['download_images'],
+                                       parent=self)
+        importer.finished.connect(self.watchLotsFinished)
+        if importer.start():
+            self.watchImporter = importer
+        else:
+            importer.deleteLater()
+
+    def watchLotsFinished(self):
+        count = self.watchImporter.importedCount
+        self.watchImporter.deleteLater()
+        self.watchImporter = None
+
+        if count:
+            self.statusBar().showMessage(
+                    self.tr("%d finished auction lots imported") % count)
+
+    def __stopWatching(self):
+        # Watched lots are written to model of current collection
+        if self.watchImporter:
+            self.watchImporter.close()
+            self.watchImporter.deleteLater()
+            self.watchImporter = None
 
     def importEvent(self):
-        from PyQt5 import QtSql
-        from OpenNumismat.Collection.Collection import Photo
+        self.watchTimer.stop()
+        self.__stopWatching()
 
-        model = self.collection.model()
-        dialog = ImportDialog(model, self)
-        res = dialog.exec_()
-        if res == QDialog.Accepted:
-            if dialog.params['auction'] == 'АукционЪ.СПб':
-                parser = AuctionSpbParser()
-            elif dialog.params['auction'] == 'Конрос':
-                parser = ConrosParser()
+        try:
+            model = self.collection.model()
+            dialog = ImportDialog(model, self)
+            res = dialog.exec_()
+            if res == QDialog.Accepted:
+                importer = AuctionImporter(model, dialog.params, self)
+
+                progressDlg = Gui.ProgressDialog(self.tr("Importing"),
+                                                 self.tr("Cancel"),
+                                                 importer.stepsCount(), self)
+                importer.stepped.connect(progressDlg.step)
+                progressDlg.canceled.connect(importer.cancel)
+
+                try:
+                    importer.run()
+                finally:
+                    progressDlg.reset()
+
+                self.statusBar().showMessage(
+                        self.tr("%d lots imported") % importer.importedCount)
+        finally:
+            # Collection is reopened and watching restarted even when
+            # import failed
+            self.collection.open(self.collection.getFileName())
+            self.setCollection(self.collection)
 
-            if dialog.params['category'] == 0:
-                categories = range(len(parser.categories()))
-            else:
-                categories = [dialog.params['category'] - 1, ]
-
-            for auctNo in range(dialog.params['from_num'], dialog.params['till_num'] + 1):
-                for category in categories:
-                    url = parser.getPageUrl(auctNo, category, 0)
-                    items = parser.parsePage(url)
-                    if not items:
-                        continue
-
-                    item1 = parser.parse(items[0]['url'])
-
-                    query = QtSql.QSqlQuery(self.collection.db)
-                    query.prepare("INSERT INTO auctions (number, date, site, place, category)" \
-                                  " VALUES (?, ?, ?, ?, ?)")
-                    query.addBindValue(auctNo)
-                    query.addBindValue(item1['date'])
-                    query.addBindValue('Аукцион')
-                    query.addBindValue(dialog.params['auction'])
-                    query.addBindValue(parser.category(category))
-
-                    query.exec_()
-
-                    auct_id = query.lastInsertId()
-
-                    for page in parser.pages(auctNo, category):
-                        url = parser.getPageUrl(auctNo, category, page)
-                        items = parser.parsePage(url)
-                        if not items:
-                            break
-
-                        for item in items:
-                            item1 = parser.parse(item['url'])
-
-                            record_item = {
-                                    'title': item1['title'],
-                                    'denomination': item['denomination'],
-                                    'year': item['year'],
-                                    'mintmark': item['mintmark'],
-                                    'category': parser.category(category),
-                                    'status': 'pass',
-                                    'material': item['material'],
-                                    'grade': item['grade'],
-                                    'price': item['price'],
-                                    'totalpayprice': item['totalPayPrice'],
-                                    'totalsaleprice': item['totalSalePrice'],
-                                    'buyer': item['buyer'],
-                                    'url': item['url'],
-                                    'bids': item['bids'],
-                                    'bidders': item1['bidders'],
-                                    'info': item1['info'],
-                                    'date': item1['date'],
-                                    'auctionnum': auctNo,
-                                    'site': item['site'],
-                                    'place': dialog.params['auction'],
-                            }
-                            if 'auctionnum' in item:
-                                record_item['auctionnum'] = item['auctionnum']
-                            if 'lotnum' in item:
-                                record_item['lotnum'] = item['lotnum']
-                            else:
-                                record_item['lotnum'] = item1['lotnum']
-                            if 'country' in item1:
-                                record_item['country'] = item1['country']
-                            imageFields = ['photo1', 'photo2', 'photo3', 'photo4']
-                            for i, imageUrl in enumerate(item1['images']):
-                                if i < len(imageFields):
-                                    photo = Photo(None, model)
-                                    photo.url = imageUrl
-                                    if dialog.params['download_images']:
-                                        # When error - repeat uploading
-                                        for _ in range(3):
-                                            if photo.uploadImage():
-                                                break
-
-                                    photo.changed = True
-                                    record_item[imageFields[i]] = photo
-
-                            record = model.record()
-                            for field, value in record_item.items():
-                                record.setValue(field, value)
-                            model.appendRecordQuiet(record)
-
-        self.collection.open(self.collection.getFileName())
-        self.setCollection(self.collection)
+            self.watchTimer.start()
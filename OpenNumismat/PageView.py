@@ -6,6 +6,7 @@ from PyQt5.QtWidgets import *
 from OpenNumismat.ListView import ListView
 from OpenNumismat.EditCoinDialog.ImageLabel import ImageLabel
 from OpenNumismat.Collection.CollectionFields import FieldTypes as Type
+from OpenNumismat.Collection.PhotoLoader import PhotoLoader
 from OpenNumismat.EditCoinDialog.EditCoinDialog import EditCoinDialog
 from OpenNumismat.CustomizeTreeDialog import CustomizeTreeDialog
 from OpenNumismat.Tools import Gui
@@ -13,17 +14,59 @@ from OpenNumismat.EditCoinDialog.DetailsTabWidget import DetailsTabWidget
 from OpenNumismat.Settings import Settings
 
 
+class PhotoLabel(ImageLabel):
+    """Shows photo read by loader in background, placeholder is shown
+    while loading"""
+
+    def __init__(self, loader, parent=None):
+        super(PhotoLabel, self).__init__(parent)
+
+        self.loader = loader
+        self.loader.loaded.connect(self.photoLoaded)
+        self._photo = None
+
+    def setPhoto(self, photo):
+        self._photo = photo
+        self.setText(self.tr("Loading..."))
+        self._load()
+
+    def photoLoaded(self, key, image):
+        if self._photo and key == self._photo.id_:
+            self._load()
+
+    def resizeEvent(self, e):
+        self._load()
+
+    def showEvent(self, e):
+        self._load()
+
+    def _load(self):
+        # Label not shown => can't get size for loading image
+        if not self._photo or not self.isVisible() or self.size().isEmpty():
+            return
+
+        image = self.loader.load(self._photo, self.size(),
+                                 Settings()['download_images'])
+        if image:
+            self._setImage(image)
+
+
 class ImageView(QWidget):
+    # Count of rows before and after current which photos are prefetched
+    PrefetchRows = 1
+
     def __init__(self, parent=None):
         super(ImageView, self).__init__(parent)
 
         self.currentIndex = None
+        self.loader = None
 
         layout = QVBoxLayout(self)
 
         self.imageLayout = QVBoxLayout()
         self.imageLayout.setContentsMargins(QtCore.QMargins())
-        layout.addWidget(self.__layoutToWidget(self.imageLayout))
+        self.imageWidget = self.__layoutToWidget(self.imageLayout)
+        layout.addWidget(self.imageWidget)
 
         self.buttonLayout = QHBoxLayout()
         self.buttonLayout.setAlignment(Qt.AlignCenter | Qt.AlignBottom)
@@ -37,6 +80,12 @@ class ImageView(QWidget):
     def setModel(self, model):
         self.model = model
 
+        if self.loader:
+            self.loader.close()
+        self.loader = PhotoLoader(model.workingDir, model.collectionName,
+                                  self)
+        self.model.modelChanged.connect(self.loader.clear)
+
         self.imageFields = []
         for field in self.model.fields.userFields:
             if field.type == Type.Photo:
@@ -59,6 +108,7 @@ class ImageView(QWidget):
             item = self.imageLayout.itemAt(0)
             item.widget().clear()
             self.imageLayout.removeItem(item)
+            item.widget().deleteLater()
 
     def buttonClicked(self, state):
         self.clear()
@@ -67,7 +117,7 @@ class ImageView(QWidget):
         for i, btn in enumerate(self.imageButtons):
             if btn.checkState() == Qt.Checked:
                 photo = self.photos[i]
-                image = ImageLabel(self)
+                image = PhotoLabel(self.loader, self)
                 image.setPhoto(photo)
                 self.imageLayout.addWidget(image)
 
@@ -97,7 +147,7 @@ class ImageView(QWidget):
                 if i < self.showedCount:
                     self.imageButtons[i].setCheckState(Qt.Checked)
 
-                    image = ImageLabel(self)
+                    image = PhotoLabel(self.loader, self)
                     image.setPhoto(photo)
                     self.imageLayout.addWidget(image)
 
@@ -105,6 +155,44 @@ class ImageView(QWidget):
 
             self.imageButtons[i].stateChanged.connect(self.buttonClicked)
 
+        self.__prefetch(current)
+
+    def __prefetch(self, current):
+        # Photos of neighbour rows are loaded while current row is viewed,
+        # so moving through list doesn't wait for decoding
+        if not self.showedCount:
+            return
+
+        size = self.imageWidget.size()
+        size.setHeight(size.height() // self.showedCount)
+        if size.isEmpty():
+            return
+
+        proxy = self.model.proxy
+        if proxy:
+            row = proxy.mapFromSource(current).row()
+        else:
+            row = current.row()
+        if row < 0:
+            return
+
+        download = Settings()['download_images']
+        for offset in range(1, self.PrefetchRows + 1):
+            for neighbour in (row + offset, row - offset):
+                if proxy:
+                    if not 0 <= neighbour < proxy.rowCount():
+                        continue
+                    index = proxy.mapToSource(proxy.index(neighbour, 0))
+                    neighbour = index.row()
+                elif not 0 <= neighbour < self.model.rowCount():
+                    continue
+
+                record = self.model.record(neighbour)
+                for field in self.imageFields[:self.showedCount]:
+                    photo = record.value(field.name)
+                    if not photo.isNull():
+                        self.loader.load(photo, size, download)
+
     def __layoutToWidget(self, layout):
         widget = QWidget(self)
         widget.setLayout(layout)
@@ -86,7 +86,10 @@ class Settings(BaseSettings):
                'sort_tree': True,
                'template': 'FCoins',
                'download_images': True,
-               'ImageSideLen': 1024}
+               'ImageSideLen': 1024,
+               'http_cache': True,
+               'watch_lots': True,
+               'http_cache_size': 512}
 
     def __init__(self, autoSave=False):
         super(Settings, self).__init__(autoSave)
@@ -100,7 +103,7 @@ class Settings(BaseSettings):
         value = self.settings.value('mainwindow/' + key)
         if value:
             if key in ('error', 'updates', 'free_numeric', 'store_sorting', 'download_images',
-                       'sort_filter', 'sort_tree'):
+                       'sort_filter', 'sort_tree', 'http_cache', 'watch_lots'):
                 # Convert boolean value
                 value = (value == 'true')
         else:
@@ -179,6 +182,22 @@ class MainSettingsPage(QWidget):
         self.downloadImages.setChecked(settings['download_images'])
         layout.addRow(self.downloadImages)
 
+        self.httpCache = QCheckBox(
+                            self.tr("Cache downloaded auction pages"), self)
+        self.httpCache.setChecked(settings['http_cache'])
+        layout.addRow(self.httpCache)
+
+        self.httpCacheSize = NumberEdit(self)
+        self.httpCacheSize.setMaximumWidth(60)
+        layout.addRow(self.tr("Max cache size, MB"), self.httpCacheSize)
+        self.httpCacheSize.setText(str(settings['http_cache_size']))
+
+        self.watchLots = QCheckBox(
+                            self.tr("Import unfinished auction lots when"
+                                    " trading is finished"), self)
+        self.watchLots.setChecked(settings['watch_lots'])
+        layout.addRow(self.watchLots)
+
         self.imageSideLen = NumberEdit(self)
         self.imageSideLen.setMaximumWidth(60)
         layout.addRow(self.tr("Max image side len"), self.imageSideLen)
@@ -243,6 +262,9 @@ class MainSettingsPage(QWidget):
         settings['error'] = self.errorSending.isChecked()
         settings['updates'] = self.checkUpdates.isChecked()
         settings['download_images'] = self.downloadImages.isChecked()
+        settings['http_cache'] = self.httpCache.isChecked()
+        settings['http_cache_size'] = int(self.httpCacheSize.text())
+        settings['watch_lots'] = self.watchLots.isChecked()
         settings['free_numeric'] = self.freeNumeric.isChecked()
         settings['store_sorting'] = self.storeSorting.isChecked()
         settings['sort_filter'] = self.sortFilter.isChecked()
@@ -0,0 +1,198 @@
+import argparse
+import locale
+import sys
+
+from PyQt5.QtCore import QCoreApplication, QFileInfo
+
+from OpenNumismat import version
+
+
+Places = {'spb': 'АукционЪ.СПб', 'conros': 'Конрос'}
+# Height of list row in default style, used instead of view row height
+# for creating preview images
+PreviewHeight = 44
+
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(
+                    prog='open-numismat-import',
+                    description="Import auction lots into %s collection "
+                                "without GUI" % version.AppName)
+    parser.add_argument('--auction', choices=sorted(Places),
+                        help="auction house")
+    parser.add_argument('--from', dest='from_num', type=int,
+                        help="number of first imported auction")
+    parser.add_argument('--till', dest='till_num', type=int,
+                        help="number of last imported auction "
+                             "(default: same as --from)")
+    parser.add_argument('--category', default='all',
+                        help="category number starting from 1 or 'all' "
+                             "(default: all)")
+    parser.add_argument('--db', required=True,
+                        help="collection file, created when not exists")
+    parser.add_argument('--password', default='',
+                        help="collection password")
+    parser.add_argument('--images', action='store_true',
+                        help="download lots images")
+    parser.add_argument('--update', action='store_true',
+                        help="update prices of already imported lots")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="parallel connections to auction site")
+    parser.add_argument('--watch', action='store_true',
+                        help="import lots of watch list which trading "
+                             "should be finished by now")
+    parser.add_argument('--list-categories', action='store_true',
+                        help="print categories of auction and exit")
+
+    args = parser.parse_args(argv)
+    if not args.watch or args.from_num is not None:
+        # Watch list alone is processed without importing auctions
+        if not args.auction:
+            parser.error("the following arguments are required: --auction")
+        if args.from_num is None and not args.list_categories:
+            parser.error("the following arguments are required: --from")
+
+    return args
+
+
+def openCollection(fileName, password):
+    from OpenNumismat.Collection.Collection import Collection, CollectionSettings, Photo
+    from OpenNumismat.Collection.CollectionFields import CollectionFields
+    from OpenNumismat.Collection.Password import checkPassword
+    from OpenNumismat.Collection import Thumbnails
+
+    collection = Collection(None)
+
+    if not QFileInfo(fileName).exists():
+        if not collection.create(fileName):
+            raise RuntimeError("Can't create collection %s" % fileName)
+        return collection
+
+    collection.db.setDatabaseName(fileName)
+    if not collection.db.open() or not collection.db.tables():
+        raise RuntimeError("Can't open collection %s: %s" %
+                           (fileName, collection.db.lastError().text()))
+    collection.fileName = fileName
+
+    collection.settings = CollectionSettings(collection)
+    if collection.settings['Type'] != version.AppName:
+        raise RuntimeError("Collection %s in wrong format" % fileName)
+    if int(collection.settings['Version']) != CollectionSettings.Default['Version']:
+        raise RuntimeError("Collection %s should be updated by %s first" %
+                           (fileName, version.AppName))
+    if not checkPassword(collection, password):
+        raise RuntimeError("Wrong password for collection %s" % fileName)
+
+    collection.fields = CollectionFields(collection.db)
+    Photo.createIndex(collection.db)
+    Thumbnails.attach(collection.db, fileName)
+
+    return collection
+
+
+def main(argv=None):
+    try:
+        locale.setlocale(locale.LC_ALL, '')
+    except:
+        pass
+
+    args = parseArguments(sys.argv[1:] if argv is None else argv)
+
+    # Only event loop and settings are required, no widgets are created
+    app = QCoreApplication(sys.argv)
+    QCoreApplication.setOrganizationName(version.Company)
+    QCoreApplication.setApplicationName(version.AppName)
+
+    from OpenNumismat.Auctions.Importer import AuctionImporter, importWatchedLots
+    from OpenNumismat.Auctions.Fetcher import workersCount
+    from OpenNumismat.Collection.Collection import RecordsWriter
+    from OpenNumismat.Collection.ImageQueue import ImageQueue
+
+    params = None
+    if args.auction:
+        place = Places[args.auction]
+        parserClass = AuctionImporter.placeParser(place)
+
+        if args.list_categories:
+            for i, category in enumerate(parserClass.categories()):
+                print("%d: %s" % (i + 1, category))
+            return 0
+
+    if args.from_num is not None:
+        if args.category == 'all':
+            category = 0
+        else:
+            category = int(args.category)
+            if not 1 <= category <= len(parserClass.categories()):
+                print("Wrong category %s" % args.category, file=sys.stderr)
+                return 2
+
+        params = {'auction': place,
+                  'category': category,
+                  'from_num': args.from_num,
+                  'till_num': args.till_num or args.from_num,
+                  'download_images': args.images,
+                  'update_existing': args.update,
+                  'workers': args.workers or workersCount(parserClass)}
+        if params['till_num'] < params['from_num']:
+            print("Auction number From should be less or equal to Till",
+                  file=sys.stderr)
+            return 2
+
+    try:
+        collection = openCollection(args.db, args.password)
+    except RuntimeError as error:
+        print(error, file=sys.stderr)
+        return 1
+
+    workingDir = QFileInfo(collection.fileName).absolutePath()
+    imageQueue = ImageQueue(collection.db, workingDir,
+                            collection.getCollectionName(), PreviewHeight)
+    writer = RecordsWriter(collection.db, collection.fields, workingDir,
+                           collection.getCollectionName(), PreviewHeight,
+                           imageQueue)
+    importer = None
+    if params:
+        importer = AuctionImporter(writer, params)
+
+    watchedCount = 0
+    try:
+        if importer:
+            importer.run()
+        if args.watch:
+            watchedCount = importWatchedLots(writer, args.images,
+                                             args.workers or None)
+        # Images queued by this or previous runs
+        imageQueue.start()
+        imageQueue.waitForDone()
+    except KeyboardInterrupt:
+        # Interrupted page is rolled back and not downloaded images stay
+        # in queue, import can be continued later
+        print("Interrupted", file=sys.stderr)
+        status = 1
+    except Exception as error:
+        print("Import failed: %s" % error, file=sys.stderr)
+        status = 1
+    else:
+        status = 0
+        # Failed lots and not listed pages are retried by next run, but
+        # caller should know that this run is incomplete
+        if importer and (importer.failedCount or importer.unfinishedCount):
+            status = 1
+
+    imageQueue.close()
+
+    if importer:
+        print(importer.statistics())
+    if args.watch:
+        print("%d lots imported from watch list" % watchedCount)
+    print(imageQueue.statistics())
+
+    collection.db.close()
+    del app
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
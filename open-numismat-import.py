@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+#
+# This file is part of NumismatTracker (http://code.google.com/p/open-numismat-tracker/).
+#
+# NumismatTracker is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# NumismatTracker is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NumismatTracker; If not, see <http://www.gnu.org/licenses/>.
+
+
+import sys
+
+from OpenNumismat import import_cli
+
+if __name__ == "__main__":
+    sys.exit(import_cli.main())
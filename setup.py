@@ -116,7 +116,7 @@ params = {
         '*.js', '*.htm', '*.html', '*.css', '*.qm', '*.db', '*.ref']},
 #    "data_files": data_files,
 
-    "py_modules": ['open-numismat', ],
+    "py_modules": ['open-numismat', 'open-numismat-import'],
 
     "packages": find_packages() + [
         'OpenNumismat/icons',
@@ -127,6 +127,7 @@ params = {
     "entry_points": {
         'console_scripts': [
             'open-numismat = OpenNumismat:main',
+            'open-numismat-import = OpenNumismat.import_cli:main',
         ],
         'gui_scripts': [
             'open-numismat = OpenNumismat:main',
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+#
+# Offline benchmark of auction parsers.
+#
+# Pages listed in parser_bench/manifest.json are downloaded once in record
+# mode and stored in parser_bench/fixtures together with parser output.
+# Committed fixtures are reduced pages reproducing markup of each site,
+# recording replaces them by real pages.
+# Benchmark mode replays the stored pages without network, checks that the
+# output is unchanged and compares throughput and memory with the baseline
+# measured on the same machine. Memory is measured both as peak of Python
+# allocations and as growth of peak resident memory of separate process,
+# which includes allocations of lxml.
+#
+#   parser_bench.py --record             download fixtures
+#   parser_bench.py --update-expected    store current parser output
+#   parser_bench.py --update-baseline    run benchmark and store baseline
+#   parser_bench.py                      run benchmark and check regressions
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+try:
+    import resource
+except ImportError:
+    # Peak resident memory isn't measured on Windows
+    resource = None
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+
+from PyQt5.QtWidgets import QApplication
+
+from OpenNumismat.Auctions import Network, NotDoneLot, ParserClasses
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'parser_bench')
+MANIFEST_FILE = os.path.join(DATA_PATH, 'manifest.json')
+BASELINE_FILE = os.path.join(DATA_PATH, 'baseline.json')
+FIXTURES_PATH = os.path.join(DATA_PATH, 'fixtures')
+INDEX_FILE_NAME = 'index.json'
+RSS_SLACK = 256 * 1024
+
+
+class FixtureSession:
+    """Replaces HTTP session and returns stored pages"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.cache = None
+        self.scheduler = Network.Scheduler()
+        self.stats = Network.SessionStats()
+
+    def read(self, url, headers=None, priority=None, maxAge=None):
+        try:
+            data = self.pages[url]
+        except KeyError:
+            raise Network.NetworkError(url, "page not recorded")
+
+        self.stats.add(requests=1, bytes=len(data))
+        return data
+
+    def close(self):
+        pass
+
+
+class RecordingSession:
+    """Reads pages by real HTTP session and keeps them for storing"""
+
+    def __init__(self, session):
+        self.session = session
+        self.cache = None
+        self.scheduler = session.scheduler
+        self.stats = session.stats
+        self.pages = {}
+
+    def read(self, url, headers=None, priority=Network.Priority.Lot,
+             maxAge=None):
+        data = self.session.read(url, headers, priority, maxAge)
+        self.pages[url] = data
+        return data
+
+    def close(self):
+        self.session.close()
+
+
+def toJson(value):
+    # Molotok and Wolmar parsers return AuctionItem instead of dict
+    if hasattr(value, '__dict__'):
+        value = vars(value)
+    if isinstance(value, dict):
+        return {key: toJson(val) for key, val in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [toJson(val) for val in value]
+    return value
+
+
+def fixturePath(parserName):
+    return os.path.join(FIXTURES_PATH, parserName)
+
+
+def loadJson(fileName, default=None):
+    if not os.path.exists(fileName):
+        return default
+
+    with open(fileName, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def saveJson(fileName, value):
+    os.makedirs(os.path.dirname(fileName), exist_ok=True)
+    with open(fileName, 'w', encoding='utf-8') as file:
+        json.dump(value, file, ensure_ascii=False, indent=1, sort_keys=True)
+
+
+def loadFixtures(parserClass):
+    path = fixturePath(parserClass.__name__)
+    index = loadJson(os.path.join(path, INDEX_FILE_NAME))
+    if not index:
+        return None, {}
+
+    pages = {}
+    for url, fileName in index['files'].items():
+        with open(os.path.join(path, fileName), 'rb') as file:
+            pages[url] = file.read()
+
+    return index, pages
+
+
+def record(parserClass, entry, lotsPerPage):
+    recorder = RecordingSession(Network.HttpSession())
+    Network.setSession(recorder)
+
+    # Fields depending on date of parsing or locale aren't compared
+    index = {'pages': [], 'lots': [], 'files': {},
+             'ignore': entry.get('ignore', [])}
+    parser = parserClass()
+
+    lots = []
+    for page in entry.get('pages', []):
+        category = page.get('category', 0)
+        parser.page_category = category
+        items = parser.parsePage(page['url'])
+        if not items:
+            print("No lots at %s" % page['url'])
+            continue
+
+        index['pages'].append({'url': page['url'], 'category': category,
+                               'expected': toJson(items)})
+        for item in items[:lotsPerPage]:
+            lots.append({'url': item['url'], 'category': category})
+
+    for lot in entry.get('lots', []):
+        lots.append({'url': lot['url'], 'category': lot.get('category', 0)})
+
+    for lot in lots:
+        parser.page_category = lot['category']
+        item = parser.parse(lot['url'])
+        if not item or isinstance(item, NotDoneLot):
+            print("Lot not parsed %s" % lot['url'])
+            continue
+
+        lot['expected'] = toJson(item)
+        index['lots'].append(lot)
+
+    path = fixturePath(parserClass.__name__)
+    os.makedirs(path, exist_ok=True)
+    for url, data in recorder.pages.items():
+        fileName = hashlib.sha1(url.encode('utf-8')).hexdigest() + '.html'
+        with open(os.path.join(path, fileName), 'wb') as file:
+            file.write(data)
+        index['files'][url] = fileName
+
+    saveJson(os.path.join(path, INDEX_FILE_NAME), index)
+
+    print("%s: %d pages, %d lots recorded" % (parserClass.__name__,
+                                              len(index['pages']),
+                                              len(index['lots'])))
+
+
+def parseFixtures(parserClass, index, pages):
+    # Only parsing is measured, page data is already in memory
+    parser = parserClass()
+    encoding = parser._encoding()
+    results = []
+
+    for page in index['pages']:
+        parser.page_category = page['category']
+        parser.loadHtmlPage(page['url'], pages[page['url']], encoding)
+        results.append(toJson(parser._parsePage()))
+
+    for lot in index['lots']:
+        parser.page_category = lot['category']
+        parser.loadHtmlPage(lot['url'], pages[lot['url']], encoding)
+        results.append(toJson(parser._parse()))
+
+    return results
+
+
+def withoutFields(value, fields):
+    if isinstance(value, dict):
+        return {key: val for key, val in value.items() if key not in fields}
+    return value
+
+
+def updateExpected(parserClass):
+    index, pages = loadFixtures(parserClass)
+    if not index:
+        return False
+
+    Network.setSession(FixtureSession(pages))
+
+    results = parseFixtures(parserClass, index, pages)
+    for entry, result in zip(index['pages'] + index['lots'], results):
+        entry['expected'] = result
+
+    path = fixturePath(parserClass.__name__)
+    saveJson(os.path.join(path, INDEX_FILE_NAME), index)
+
+    return True
+
+
+def maxRss():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS bytes
+    if sys.platform != 'darwin':
+        usage *= 1024
+    return usage
+
+
+def procStatus(field):
+    with open('/proc/self/status') as file:
+        for line in file:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+
+
+def rssPass(parserClass):
+    index, pages = loadFixtures(parserClass)
+    Network.setSession(FixtureSession(pages))
+
+    # Linux allows to reset peak to current resident memory, so peak of
+    # imports doesn't hide parsing
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        start = maxRss()
+        parseFixtures(parserClass, index, pages)
+        return maxRss() - start
+
+    start = procStatus('VmRSS')
+    parseFixtures(parserClass, index, pages)
+    return procStatus('VmHWM') - start
+
+
+def peakRss(parserClass):
+    # Parsing runs in new process, so memory freed by other parsers and
+    # timing passes isn't reused and doesn't hide growth
+    if not resource:
+        return None
+
+    process = subprocess.run([sys.executable, os.path.abspath(__file__),
+                              '--rss-pass', parserClass.__name__],
+                             stdout=subprocess.PIPE, universal_newlines=True)
+    lines = process.stdout.split()
+    if process.returncode or not lines:
+        return None
+
+    # Parsers print debug output before result
+    return int(lines[-1])
+
+
+def benchmark(parserClass, repeat):
+    index, pages = loadFixtures(parserClass)
+    if not index:
+        return None
+
+    # Wolmar parser reads additional pages while parsing lot
+    Network.setSession(FixtureSession(pages))
+
+    errors = []
+    ignore = index.get('ignore', [])
+    expected = [page['expected'] for page in index['pages']] + \
+               [lot['expected'] for lot in index['lots']]
+    results = parseFixtures(parserClass, index, pages)
+    for url, result, value in zip(
+                [entry['url'] for entry in index['pages'] + index['lots']],
+                results, expected):
+        if withoutFields(result, ignore) != withoutFields(value, ignore):
+            errors.append("output changed for %s" % url)
+
+    pagesTime = 0.
+    lotsTime = 0.
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parseFixtures(parserClass, {'pages': index['pages'], 'lots': []},
+                      pages)
+        pagesTime += time.perf_counter() - start
+
+        start = time.perf_counter()
+        parseFixtures(parserClass, {'pages': [], 'lots': index['lots']},
+                      pages)
+        lotsTime += time.perf_counter() - start
+
+    # Separate pass as tracing slows down parsing
+    tracemalloc.start()
+    parseFixtures(parserClass, index, pages)
+    peakMemory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    result = {'pages_per_sec': 0., 'lots_per_sec': 0.,
+              'peak_memory': peakMemory, 'peak_rss': peakRss(parserClass),
+              'errors': errors}
+    if pagesTime:
+        result['pages_per_sec'] = len(index['pages']) * repeat / pagesTime
+    if lotsTime:
+        result['lots_per_sec'] = len(index['lots']) * repeat / lotsTime
+
+    return result
+
+
+def checkRegression(result, baseline, threshold):
+    errors = []
+    for key in ('pages_per_sec', 'lots_per_sec'):
+        if baseline.get(key) and \
+                result[key] < baseline[key] * (1 - threshold):
+            errors.append("%s dropped from %.1f to %.1f" %
+                          (key, baseline[key], result[key]))
+
+    if baseline.get('peak_memory') and \
+            result['peak_memory'] > baseline['peak_memory'] * (1 + threshold):
+        errors.append("peak memory grown from %d to %d bytes" %
+                      (baseline['peak_memory'], result['peak_memory']))
+
+    # Resident memory grows by whole pages, so small fixtures get slack
+    if baseline.get('peak_rss') and result['peak_rss'] is not None and \
+            result['peak_rss'] > baseline['peak_rss'] * (1 + threshold) + \
+                                 RSS_SLACK:
+        errors.append("peak RSS grown from %d to %d bytes" %
+                      (baseline['peak_rss'], result['peak_rss']))
+
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of "
+                                                 "auction parsers")
+    parser.add_argument('--record', action='store_true',
+                        help="download pages from manifest as fixtures")
+    parser.add_argument('--lots', type=int, default=10,
+                        help="count of lots recorded from each list page")
+    parser.add_argument('--update-expected', action='store_true',
+                        help="store current parser output for fixtures")
+    parser.add_argument('--rss-pass', help=argparse.SUPPRESS)
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="store results as new baseline")
+    parser.add_argument('--repeat', type=int, default=20,
+                        help="count of parsing each fixture")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="allowed relative regression of throughput "
+                             "and memory")
+    parser.add_argument('parsers', nargs='*',
+                        help="names of benchmarked parser classes")
+    args = parser.parse_args()
+
+    # Some parsers show message boxes
+    app = QApplication(sys.argv)
+
+    parserClasses = [parserClass for parserClass in ParserClasses
+                     if not args.parsers or
+                     parserClass.__name__ in args.parsers]
+
+    if args.rss_pass:
+        parserClass = [parserClass for parserClass in ParserClasses
+                       if parserClass.__name__ == args.rss_pass][0]
+        print(rssPass(parserClass))
+        return 0
+
+    if args.record:
+        manifest = loadJson(MANIFEST_FILE, {})
+        for parserClass in parserClasses:
+            entry = manifest.get(parserClass.__name__)
+            if entry:
+                record(parserClass, entry, args.lots)
+        return 0
+
+    if args.update_expected:
+        for parserClass in parserClasses:
+            if updateExpected(parserClass):
+                print("%s: expected output updated" % parserClass.__name__)
+        return 0
+
+    baseline = loadJson(BASELINE_FILE, {})
+    failed = False
+    for parserClass in parserClasses:
+        name = parserClass.__name__
+        result = benchmark(parserClass, args.repeat)
+        if result is None:
+            print("%s: no fixtures, run with --record" % name)
+            continue
+
+        if result['peak_rss'] is None:
+            rss = "n/a"
+        else:
+            rss = "%.1f KB" % (result['peak_rss'] / 1024)
+        print("%s: %.1f pages/sec, %.1f lots/sec, peak memory %.1f KB,"
+              " peak RSS %s" % (name, result['pages_per_sec'],
+                                result['lots_per_sec'],
+                                result['peak_memory'] / 1024, rss))
+
+        errors = result.pop('errors')
+        if not args.update_baseline and name in baseline:
+            errors += checkRegression(result, baseline[name], args.threshold)
+        for error in errors:
+            print("  FAIL: %s" % error)
+        if errors:
+            failed = True
+        elif args.update_baseline:
+            baseline[name] = result
+
+    if args.update_baseline:
+        saveJson(BASELINE_FILE, baseline)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())